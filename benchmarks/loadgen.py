@@ -0,0 +1,206 @@
+""" Load generator for server.py: simulated voters fetch a pair, optionally its thumbnails,
+    and vote, each on its own keep-alive connection. Reports sustained votes per second and
+    the latency percentiles of every request type
+
+    python3 -m benchmarks.loadgen --folder-size 1000 --voters 16 --seconds 20
+    python3 -m benchmarks.loadgen --url http://127.0.0.1:8765 --voters 8 --thumbnails
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit, quote
+from benchmarks.synthetic import make_folder
+
+
+def percentiles(durations):
+    """ p50, p95, p99 and max of durations in milliseconds
+    """
+    if not durations:
+        return {}
+    ordered = sorted(durations)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'count': len(ordered), 'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': ordered[-1] * 1000}
+
+
+class Voter(threading.Thread):
+    """ one simulated voter: pair, thumbnails if asked, vote, until stop is set. The winner
+        is the image whose name sorts first, so the votes agree with a hidden ranking
+
+        Parameters
+        address : tuple
+           (host, port) of the server
+        stop : threading.Event
+           set to end the run
+        thumbnails : boolean
+           fetch both thumbnails of every pair, as a browser would
+        think : float
+           seconds between receiving a pair and voting on it
+    """
+    def __init__(self, address, stop, thumbnails=False, think=0.0):
+        super().__init__(daemon=True)
+        self.address = address
+        self.stop = stop
+        self.thumbnails = thumbnails
+        self.think = think
+        self.timings = {'pair': [], 'thumbnail': [], 'vote': []}
+        self.errors = 0
+
+    def request(self, connection, kind, method, path, body=None):
+        started = time.perf_counter()
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        self.timings[kind].append(time.perf_counter() - started)
+        if response.status != 200:
+            self.errors += 1
+            return None
+        return data
+
+    def run(self):
+        connection = http.client.HTTPConnection(*self.address, timeout=30)
+        try:
+            while not self.stop.is_set():
+                data = self.request(connection, 'pair', 'GET', '/pair')
+                if data is None:
+                    time.sleep(0.1)
+                    continue
+                pair = json.loads(data)
+                if self.thumbnails:
+                    for side in ('left', 'right'):
+                        self.request(connection, 'thumbnail', 'GET', '/thumbnail?image=' + quote(pair[side]))
+                if self.think:
+                    time.sleep(random.expovariate(1 / self.think))
+                winner, loser = sorted((pair['left'], pair['right']))
+                vote = {'winner': winner, 'loser': loser, 'pair_id': pair['pair_id']}
+                self.request(connection, 'vote', 'POST', '/vote', json.dumps(vote))
+        except (OSError, http.client.HTTPException):
+            self.errors += 1
+        finally:
+            connection.close()
+
+
+class Listener(threading.Thread):
+    """ reads the event stream of the server and counts the vote events received
+    """
+    def __init__(self, address):
+        super().__init__(daemon=True)
+        self.address = address
+        self.events = 0
+
+    def run(self):
+        connection = http.client.HTTPConnection(*self.address, timeout=60)
+        try:
+            connection.request('GET', '/events')
+            response = connection.getresponse()
+            for line in response:
+                if line.startswith(b'event: vote'):
+                    self.events += 1
+        except (OSError, http.client.HTTPException):
+            pass
+
+
+def start_server(folder, port, workdir, store):
+    """ runs server.py on folder in a subprocess, returns it once it accepts connections
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, os.path.join(root, 'server.py'), folder, '--port', str(port),
+               '--cache-dir', os.path.join(workdir, 'server_cache'), '--store', store]
+    process = subprocess.Popen(command, cwd=root, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server.py exited with code {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/ranking?count=1')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('server.py did not start listening')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='a running server, otherwise one is started on a synthetic folder')
+    parser.add_argument('--folder-size', type=int, default=1000, help='images in the synthetic folder')
+    parser.add_argument('--resolution', default='640x480', help='image size of the synthetic folder')
+    parser.add_argument('--port', type=int, default=8766, help='port of the server started here')
+    parser.add_argument('--store', choices=('sqlite', 'json'), default='sqlite')
+    parser.add_argument('--voters', type=int, default=8, help='concurrent voters')
+    parser.add_argument('--listeners', type=int, default=1, help='concurrent event stream readers')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--thumbnails', action='store_true', help='fetch both thumbnails of every pair')
+    parser.add_argument('--think', type=float, default=0.0, help='mean seconds a voter looks at a pair')
+    parser.add_argument('--workdir', default='./local_cache/benchmarks/', help='generated folders and caches')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        address = (url.hostname, url.port or 80)
+    else:
+        width, height = (int(value) for value in args.resolution.lower().split('x'))
+        folder = make_folder(args.workdir, args.folder_size, (width, height))
+        server = start_server(folder, args.port, args.workdir, args.store)
+        address = ('127.0.0.1', args.port)
+
+    stop = threading.Event()
+    listeners = [Listener(address) for _ in range(args.listeners)]
+    voters = [Voter(address, stop, args.thumbnails, args.think) for _ in range(args.voters)]
+    try:
+        for thread in listeners:
+            thread.start()
+        time.sleep(0.2)  # let the streams subscribe before the first vote
+        started = time.perf_counter()
+        for thread in voters:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in voters:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        time.sleep(0.5)  # the last events are still on their way to the listeners
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)  # stops like Ctrl-C, so the store is compacted and closed
+            server.wait()
+
+    votes = sum(len(voter.timings['vote']) for voter in voters)
+    results = {
+        'voters': args.voters,
+        'seconds': elapsed,
+        'votes': votes,
+        'votes_per_second': votes / elapsed,
+        'errors': sum(voter.errors for voter in voters),
+        'events_per_listener': [listener.events for listener in listeners],
+        'latency_ms': {kind: percentiles([duration for voter in voters for duration in voter.timings[kind]])
+                       for kind in ('pair', 'thumbnail', 'vote')},
+    }
+    print(f"{votes} votes in {elapsed:.1f} s from {args.voters} voters: {results['votes_per_second']:.0f} votes/s, "
+          f"{results['errors']} errors")
+    for kind, figures in results['latency_ms'].items():
+        if figures:
+            print(f"{kind:<10} {figures['count']:>7} requests  p50 {figures['p50']:7.2f} ms  "
+                  f"p95 {figures['p95']:7.2f} ms  p99 {figures['p99']:7.2f} ms  max {figures['max']:7.2f} ms")
+    if listeners:
+        print(f"events received per listener: {', '.join(str(count) for count in results['events_per_listener'])}")
+    if args.output:
+        with open(args.output, mode='w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+""" Benchmarks for the decode, scan, ranking and persistence hot paths on synthetic folders.
+    Runs offline and headless, results are written as JSON and two runs can be compared
+
+    python3 -m benchmarks.run run --output before.json
+    python3 -m benchmarks.run compare before.json after.json --threshold 0.1
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+import numpy as np
+import PIL
+from utils.engine import RankingEngine
+from utils.imageutils import resize_image, get_exif_data, render_preview
+from utils.thumbcache import ThumbnailCache
+from utils.tracing import tracer, traced
+from benchmarks.synthetic import make_folder, synthetic_votes
+
+
+def measure(fn, repeat, setup=None, ops=1):
+    """ times fn repeat times, calling setup untimed before each, and returns the summary
+        stored in the results file
+
+        Parameters
+        fn : callable
+           the code being timed
+        repeat : int
+           number of timed calls
+        setup : callable
+           run before each call, outside the timing
+        ops : int
+           operations performed by one call of fn, for the per operation figures
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    median = statistics.median(samples)
+    return {
+        'samples': samples,
+        'min': min(samples),
+        'median': median,
+        'mean': statistics.fmean(samples),
+        'p95': float(np.percentile(samples, 95)),
+        'ops': ops,
+        'ops_per_sec': ops / median if median > 0 else None,
+    }
+
+
+def benchmark_key(name, params):
+    return name + '[' + ','.join(f'{k}={v}' for k, v in sorted(params.items())) + ']'
+
+
+class Suite:
+    """ collects results, printing each one as it completes
+    """
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def add(self, name, params, fn, setup=None, ops=1, repeat=None):
+        result = measure(fn, repeat or self.repeat, setup, ops)
+        result.update(name=name, params=params, key=benchmark_key(name, params))
+        self.results.append(result)
+        per_op = result['median'] / ops
+        print(f"{result['key']:<60} median {result['median'] * 1000:9.2f} ms   {per_op * 1e6:10.1f} us/op")
+
+
+def quiet():
+    """ the engine reports scan statistics on stdout, which would drown the benchmark output
+    """
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def bench_scan(suite, folder, count, workdir):
+    engine = RankingEngine(os.path.join(workdir, 'scan_cache'))
+    engine.folder_path = folder
+    params = {'images': count}
+
+    def cold():
+        shutil.rmtree(os.path.join(workdir, 'scan_cache', 'manifests'), ignore_errors=True)
+
+    def load():
+        with quiet():
+            engine.load_images()
+
+    suite.add('load_images.cold', params, load, setup=cold, ops=count)
+    suite.add('load_images.warm', params, load, ops=count)
+
+
+def bench_ranking(suite, images, votes, workdir):
+    engine = RankingEngine(os.path.join(workdir, 'ranking_cache'))  # only the in-memory state is used
+    engine.image_files = list(images)
+    engine.rankings = {img: 0 for img in images}
+    engine.rating_engine.reset(images)
+    engine.scheduler.reset(images)
+    for winner, loser in votes:
+        engine.rankings[winner] += 1
+        engine.rating_engine.record(winner, loser)
+        engine.scheduler.record(winner, loser)
+    engine.sync_rank_order()
+    params = {'images': len(images), 'votes': len(votes)}
+
+    def invalidate():
+        engine.rating_engine.record(*votes[0])  # makes the Bradley-Terry fit out of date, as a vote does
+
+    def vote_and_page():
+        # what vote mode does per vote: move the two images, then refresh the visible rows
+        for winner, loser in votes[:200]:
+            engine.rating_engine.record(winner, loser)
+            engine.rankings[winner] += 1
+            engine.rank_order.update(winner, engine.rank_key(winner))
+            engine.rank_order.update(loser, engine.rank_key(loser))
+            engine.get_ranking_table_data(0, 10)
+
+    suite.add('get_ranking_table_data', params, engine.get_ranking_table_data, setup=invalidate)
+    suite.add('get_ranking_table_data.vote_and_page', params, vote_and_page, ops=min(200, len(votes)))
+    draws = 10000
+    suite.add('get_random_image', params, lambda: [engine.get_random_image() for _ in range(draws)], ops=draws)
+
+
+def bench_persistence(suite, folder, images, votes, workdir, backend):
+    cache_dir = os.path.join(workdir, f'store_{backend}')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    engine = RankingEngine(cache_dir, store_backend=backend)
+    with quiet():
+        engine.open_folder(folder, index_metadata=False)
+    params = {'images': len(images), 'votes': len(votes), 'store': backend}
+
+    def record_all():
+        for winner, loser in votes:
+            engine.record_vote(winner, loser)
+
+    suite.add('record_vote', params, record_all, ops=len(votes), repeat=1)
+    suite.add('write_rankings_to_disk', params, engine.write_rankings_to_disk)
+    suite.add('read_rankings_from_disk', params, engine.read_rankings_from_disk)
+    engine.store.close()
+
+
+def bench_images(suite, folder, resolution, sample, workdir):
+    paths = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.jpg'))[:sample]
+    params = {'resolution': resolution}
+    cache = ThumbnailCache(os.path.join(workdir, 'thumbnails'))
+
+    def render_all():
+        for path in paths:
+            render_preview(path)
+
+    def render_cached():
+        for path in paths:
+            data = cache.get(path, (720, 480))
+            if data is None:
+                cache.put(path, (720, 480), render_preview(path))
+
+    def clear_cache():
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+        cache.__init__(cache.cache_dir)
+
+    # render_preview is what convert_to_bytes runs, without the popup that needs a display
+    suite.add('convert_to_bytes.uncached', params, render_all, ops=len(paths))
+    suite.add('convert_to_bytes.thumbnail_cache_miss', params, render_cached, setup=clear_cache, ops=len(paths))
+    suite.add('convert_to_bytes.thumbnail_cache_hit', params, render_cached, ops=len(paths))
+    suite.add('resize_image', params, lambda: [resize_image(path, (100, 100)) for path in paths], ops=len(paths))
+    suite.add('get_exif_data', params, lambda: [get_exif_data(path) for path in paths], ops=len(paths))
+
+
+def bench_tracing(suite):
+    """ cost of the instrumentation on a function that does nothing, with tracing off and on
+    """
+    calls = 100000
+
+    def bare():
+        return None
+
+    instrumented = traced('benchmark.noop')(bare)
+    suite.add('tracing.bare_call', {}, lambda: [bare() for _ in range(calls)], ops=calls)
+    suite.add('tracing.disabled', {}, lambda: [instrumented() for _ in range(calls)], ops=calls)
+    tracer.enable()
+    suite.add('tracing.enabled', {}, lambda: [instrumented() for _ in range(calls)], ops=calls)
+    tracer.enabled = False
+    tracer.reset()
+
+
+def bench_startup(suite):
+    """ time to import the engine in a fresh interpreter, the part of the startup before
+        the first window that does not need a display
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def import_engine():
+        subprocess.run([sys.executable, '-c', 'import utils.engine'], cwd=root, check=True)
+
+    suite.add('startup.import_engine', {}, import_engine)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pillow': PIL.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def cmd_run(args):
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    suite = Suite(args.repeat)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    resolutions = args.resolutions.split(',')
+
+    for count in sizes:
+        print(f'Preparing a folder of {count} images')
+        folder = make_folder(os.path.join(workdir, 'folders'), count, (64, 48), args.seed)
+        images = sorted(name for name in os.listdir(folder) if name.endswith('.jpg'))
+        votes = synthetic_votes(images, count * args.votes_per_image, args.seed)
+        bench_scan(suite, folder, count, workdir)
+        bench_ranking(suite, images, votes, workdir)
+        for backend in ('sqlite', 'json'):
+            bench_persistence(suite, folder, images, votes, workdir, backend)
+
+    for resolution in resolutions:
+        print(f'Preparing {args.sample} images at {resolution}')
+        folder = make_folder(os.path.join(workdir, 'folders'), args.sample, parse_resolution(resolution), args.seed)
+        bench_images(suite, folder, resolution, args.sample, workdir)
+
+    settings = {key: value for key, value in vars(args).items() if key != 'run'}
+    bench_tracing(suite)
+    bench_startup(suite)
+
+    output = {'environment': environment(), 'args': settings, 'results': suite.results}
+    with open(args.output, mode='w') as output_file:
+        json.dump(output, output_file, indent=1)
+    print(f'Results written to {args.output}')
+
+
+def cmd_compare(args):
+    """ compares the medians of two result files, returns 1 if any benchmark slowed down
+        by more than the threshold
+    """
+    with open(args.baseline, mode='r') as baseline_file:
+        baseline = {result['key']: result for result in json.load(baseline_file)['results']}
+    with open(args.candidate, mode='r') as candidate_file:
+        candidate = {result['key']: result for result in json.load(candidate_file)['results']}
+
+    regressions = 0
+    for key in sorted(set(baseline) | set(candidate)):
+        if key not in baseline or key not in candidate:
+            print(f"{key:<60} {'only in ' + (args.baseline if key in baseline else args.candidate)}")
+            continue
+        before, after = baseline[key]['median'], candidate[key]['median']
+        change = (after - before) / before if before > 0 else 0.0
+        if change > args.threshold:
+            verdict = 'REGRESSION'
+            regressions += 1
+        elif change < -args.threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        print(f'{key:<60} {before * 1000:9.2f} ms -> {after * 1000:9.2f} ms  {change:+7.1%}  {verdict}')
+    print(f'{regressions} regression(s) above {args.threshold:.0%}')
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the suite and write the results')
+    run.add_argument('--sizes', default='100,1000', help='folder sizes for the scan, ranking and persistence benchmarks')
+    run.add_argument('--resolutions', default='640x480,4000x3000', help='image sizes for the decode benchmarks')
+    run.add_argument('--sample', type=int, default=10, help='images per resolution')
+    run.add_argument('--votes-per-image', type=int, default=5)
+    run.add_argument('--repeat', type=int, default=5)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--workdir', default='./local_cache/benchmarks/', help='generated folders and caches')
+    run.add_argument('--output', default='bench_results.json')
+    run.set_defaults(run=cmd_run)
+
+    compare = commands.add_parser('compare', help='compare two result files')
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=0.1, help='relative slow down flagged as a regression')
+    compare.set_defaults(run=cmd_compare)
+
+    args = parser.parse_args()
+    sys.exit(args.run(args) or 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+""" Synthetic image folders for the benchmarks, generated once and reused between runs
+"""
+
+import os
+import json
+import random
+import numpy as np
+from PIL import Image
+
+# EXIF tag ids written to every image, so header parsing has the same work as a camera file
+EXIF_ISO = 0x8827
+EXIF_FNUMBER = 0x829D
+EXIF_EXPOSURE_TIME = 0x829A
+EXIF_IFD = 0x8769
+
+
+def make_image(path, size, rng, quality=90):
+    """ writes a JPEG with smooth gradients plus noise, which compresses like a photo
+        rather than like a flat colour, and a small EXIF block
+
+        Parameters
+        path : str
+           where to write the image
+        size : tuple of int
+           width and height in pixels
+        rng : random.Random
+           source of the colours, noise and EXIF values
+    """
+    width, height = size
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    channels = []
+    for _ in range(3):
+        a, b, c = rng.random(), rng.random(), rng.random()
+        channels.append(255 * (a * x + b * y + c * x * y) / (a + b + c))
+    pixels = np.stack(channels, axis=-1)
+    noise = np.random.default_rng(rng.getrandbits(32)).normal(0, 12, pixels.shape).astype(np.float32)
+    pixels = np.clip(pixels + noise, 0, 255).astype(np.uint8)
+
+    exif = Image.Exif()
+    exif_ifd = exif.get_ifd(EXIF_IFD)
+    exif_ifd[EXIF_ISO] = rng.choice((100, 200, 400, 800, 1600, 3200))
+    exif_ifd[EXIF_FNUMBER] = rng.choice((1.8, 2.8, 4.0, 5.6, 8.0, 11.0))
+    exif_ifd[EXIF_EXPOSURE_TIME] = 1 / rng.choice((30, 60, 125, 250, 500, 1000))
+    Image.fromarray(pixels, 'RGB').save(path, format='JPEG', quality=quality, exif=exif)
+
+
+def make_folder(root, count, size, seed=0):
+    """ returns the path of a folder holding count synthetic JPEGs of the given size,
+        generating it unless a complete one with the same parameters already exists
+
+        Parameters
+        root : str
+           directory the benchmark folders are kept in
+        count : int
+           number of images
+        size : tuple of int
+           width and height in pixels
+        seed : int
+           seed for the image content
+    """
+    folder = os.path.join(root, f'{count}_{size[0]}x{size[1]}_{seed}')
+    marker = os.path.join(folder, '.complete')
+    params = {'count': count, 'size': list(size), 'seed': seed}
+    if os.path.exists(marker):
+        with open(marker, mode='r') as marker_file:
+            if json.load(marker_file) == params:
+                return folder
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    for i in range(count):
+        make_image(os.path.join(folder, f'img_{i:06d}.jpg'), size, rng)
+    with open(marker, mode='w') as marker_file:
+        json.dump(params, marker_file)
+    return folder
+
+
+def synthetic_votes(images, count, seed=0):
+    """ count (winner, loser) votes between random images, the better image per a hidden
+        score winning most of the time, as a human voter would
+    """
+    rng = random.Random(seed)
+    scores = {img: rng.gauss(0, 1) for img in images}
+    votes = []
+    for _ in range(count):
+        left, right = rng.sample(images, 2)
+        p_left = 1 / (1 + np.exp(scores[right] - scores[left]))
+        votes.append((left, right) if rng.random() < p_left else (right, left))
+    return votes
@@ -0,0 +1,367 @@
+""" Command line front end to the ranking engine, for scripted and batch work without the GUI
+
+    python3 cli.py scan FOLDER
+    python3 cli.py replay FOLDER [--log votes.jsonl]
+    python3 cli.py ingest FOLDER [votes.jsonl | -]
+    python3 cli.py tournament FOLDER --comparisons 200 [--mode sort | --mode top --k 20]
+    python3 cli.py export FOLDER --output rank.csv
+    python3 cli.py thumbnails FOLDER [--workers 8]
+    python3 cli.py quality FOLDER [--top 20]
+    python3 cli.py duplicates FOLDER [--threshold 5]
+    python3 cli.py filter FOLDER --field ISOSpeedRatings [--min 100] [--max 800]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from utils.engine import RankingEngine
+from utils.metadata import MetadataIndex, DISPLAY_FIELDS
+from utils.scheduler import STRATEGIES
+from utils.tracing import tracer
+
+
+def read_vote_lines(stream):
+    """ yields (line number, winner, loser) from JSON lines of {"winner": ..., "loser": ...},
+        lines that are blank or not votes yield None for winner and loser
+    """
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            yield number, record['winner'], record['loser']
+        except (ValueError, KeyError, TypeError):
+            yield number, None, None
+
+
+def print_top(engine, top):
+    # a page of the table only shows the last finished fit, a one-shot command fits up front
+    engine.rating_engine.fit_bradley_terry()
+    for rank, image, votes, rating, interval in engine.get_ranking_table_data(0, top):
+        print(f'{rank:>5}  {rating:>5} {interval:>5}  {votes:>5}  {image}')
+
+
+def cmd_scan(engine, args):
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    compared = sum(1 for votes in engine.rankings.values() if votes)
+    print(f'{len(engine.image_files)} images, {compared} with votes, '
+          f'{len(engine.rating_engine.comparisons)} stored comparisons')
+
+
+def cmd_replay(engine, args):
+    """ replays the stored comparisons of the folder, or a JSONL vote log, through the rating
+        engine and scheduler without writing anything, and reports the throughput
+    """
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    if args.log:
+        with open(args.log, mode='r') as log_file:
+            comparisons = [(winner, loser) for _, winner, loser in read_vote_lines(log_file) if winner]
+    else:
+        comparisons = list(engine.rating_engine.comparisons)
+    engine.rating_engine.reset(engine.image_files)
+    engine.scheduler.reset(engine.image_files)
+
+    started = time.perf_counter()
+    for winner, loser in comparisons:
+        engine.rating_engine.record(winner, loser)
+        engine.scheduler.record(winner, loser)
+    seconds = time.perf_counter() - started
+    engine.sync_rank_order()
+    rate = len(comparisons) / seconds if seconds > 0 else 0.0
+    print(f'Replayed {len(comparisons)} comparisons in {seconds:.3f}s ({rate:.0f} votes/sec)')
+    print_top(engine, args.top)
+
+
+def cmd_ingest(engine, args):
+    """ records votes read as JSON lines from a file or stdin, as if they were cast in the GUI
+    """
+    engine.open_folder(args.folder, index_metadata=False)
+    stream = sys.stdin if args.votes == '-' else open(args.votes, mode='r')
+    recorded = skipped = 0
+    started = time.perf_counter()
+    try:
+        for number, winner, loser in read_vote_lines(stream):
+            if winner is None or winner == loser or winner not in engine.rankings or loser not in engine.rankings:
+                skipped += 1
+                if args.verbose:
+                    print(f'Skipping line {number}')
+                continue
+            engine.record_vote(winner, loser)
+            recorded += 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    seconds = time.perf_counter() - started
+    engine.write_rankings_to_disk()
+    rate = recorded / seconds if seconds > 0 else 0.0
+    print(f'Recorded {recorded} votes, skipped {skipped}, in {seconds:.3f}s ({rate:.0f} votes/sec)')
+
+
+def run_structured_tournament(engine, api_key, args):
+    """ a full sort or top k selection with Gemini voting, one pair at a time since each pair
+        depends on the previous answer. Stops after --comparisons votes, the next run resumes
+    """
+    tournament = engine.start_tournament(args.mode, args.k)
+    pair = tournament.pending
+    done = failed = 0
+    started = time.perf_counter()
+    while pair is not None and done + failed < args.comparisons:
+        try:
+            winner, loser, _ = engine.compare_with_ai(api_key, *pair)
+        except Exception as e:
+            print(f'Error comparing {pair[0]} and {pair[1]} : {e}')
+            failed += 1
+            continue
+        pair = engine.record_tournament_vote(winner, loser)
+        done += 1
+        votes, total = tournament.estimate()
+        print(f'{votes}/~{total} tournament votes', end='\r', flush=True)
+    print()
+    seconds = time.perf_counter() - started
+    engine.write_rankings_to_disk()
+    votes, total = tournament.estimate()
+    print(f'{done} comparisons ({failed} failed) in {seconds:.1f}s, {votes} tournament votes so far')
+    if pair is None:
+        for place, image in enumerate(tournament.result[:args.top], 1):
+            print(f'{place:>5}  {image}')
+        engine.stop_tournament(discard=True)
+    else:
+        print(f'About {total - votes} votes left, run again to carry on')
+
+
+def cmd_tournament(engine, args):
+    """ lets Gemini cast every vote. Pairs come from the scheduler in rounds of disjoint
+        pairs, each round is asked concurrently and recorded before the next is chosen
+    """
+    if not engine.open_folder(args.folder, index_metadata=False):
+        print('At least two images are needed')
+        return
+    engine.scheduler.set_strategy(args.pairing)
+    engine.load_duplicate_groups()
+    engine.set_collapse_duplicates(args.collapse_duplicates)
+    api_key = engine.get_api_key()
+    client = engine.get_gemini_client(api_key)
+    client.verbose = args.verbose
+    if args.mode != 'pairs':
+        run_structured_tournament(engine, api_key, args)
+        return
+
+    done = failed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='tournament') as pool:
+        while done + failed < args.comparisons:
+            pairs = []
+            busy = []
+            for _ in range(min(args.workers, args.comparisons - done - failed)):
+                pair = engine.scheduler.next_pair(busy)
+                if pair is None:
+                    break
+                pairs.append(pair)
+                busy.extend(pair)
+            if not pairs:
+                break
+            futures = [pool.submit(engine.compare_with_ai, api_key, left, right) for left, right in pairs]
+            for (left, right), future in zip(pairs, futures):
+                try:
+                    winner, loser, _ = future.result()
+                except Exception as e:
+                    print(f'Error comparing {left} and {right} : {e}')
+                    failed += 1
+                    continue
+                engine.record_vote(winner, loser)
+                done += 1
+            print(f'{done}/{args.comparisons} comparisons', end='\r', flush=True)
+    print()
+    seconds = time.perf_counter() - started
+    engine.write_rankings_to_disk()
+    stats = client.stats
+    print(f'{done} comparisons ({failed} failed) in {seconds:.1f}s, {stats["calls"]} requests sent, '
+          f'{stats["cache_hits"]} cached, {stats["bytes_sent"] / 1024 / 1024:.1f} MiB uploaded')
+    print_top(engine, args.top)
+
+
+def cmd_thumbnails(engine, args):
+    """ renders the display thumbnails of the folder ahead of the first session. Interrupting
+        keeps what was rendered, running it again carries on from there
+    """
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    warmer = engine.get_thumbnail_warmer(workers=args.workers)
+    total = len(warmer.file_paths)
+    started = time.perf_counter()
+    try:
+        for file_path, error in warmer.run():
+            if error is not None and args.verbose:
+                print(f'Error rendering {file_path} : {error}')
+            print(f'{sum(warmer.stats.values())}/{total} thumbnails', end='\r', flush=True)
+    except KeyboardInterrupt:
+        print('\nInterrupted, run again to carry on')
+    print()
+    seconds = time.perf_counter() - started
+    print(f'{warmer.stats["rendered"]} rendered, {warmer.stats["skipped"]} already up to date, '
+          f'{warmer.stats["failed"]} failed in {seconds:.1f}s')
+    if warmer.cache_full:
+        print(f'The thumbnail cache is full, {warmer.left_out} images were left out. '
+              f'Raise IMAGE_RANKER_THUMBNAIL_MB to keep more')
+
+
+def cmd_quality(engine, args):
+    """ scores sharpness and exposure of the folder locally, saves the scores and prints
+        the best scored images. The next session's ratings start from the scores
+    """
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    total = len(engine.quality_index.stale(engine.image_files))
+    started = time.perf_counter()
+    done = 0
+    try:
+        for done, _ in enumerate(engine.score_quality(workers=args.workers), 1):
+            print(f'{done}/{total} images scored', end='\r', flush=True)
+    except KeyboardInterrupt:
+        print('\nInterrupted, run again to carry on')
+    print()
+    seconds = time.perf_counter() - started
+    print(f'{done} images scored in {seconds:.1f}s ({done / seconds if seconds > 0 else 0:.0f} images/sec)')
+    ranked = engine.quality_index.sorted_names(engine.image_files, 'score', reverse=True)
+    for name in ranked[:args.top]:
+        scores = engine.quality_index.get(name)
+        if scores:
+            print(f"{scores['score']:>6.2f} {scores['sharpness']:>9.0f} {scores['clipped']:>7.1%}  {name}")
+
+
+def cmd_duplicates(engine, args):
+    """ hashes the folder and lists the groups of near-duplicates, largest first
+    """
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    engine.duplicate_threshold = args.threshold
+    total = len(engine.hash_index.stale(engine.image_files))
+    started = time.perf_counter()
+    done = 0
+    try:
+        for done, _ in enumerate(engine.find_duplicates(workers=args.workers), 1):
+            print(f'{done}/{total} images hashed', end='\r', flush=True)
+    except KeyboardInterrupt:
+        print('\nInterrupted, run again to carry on')
+    print()
+    groups = sorted(engine.duplicate_groups.groups(), key=len, reverse=True)
+    print(f'{done} images hashed in {time.perf_counter() - started:.1f}s, {len(groups)} groups of near-duplicates')
+    for names in groups[:args.top]:
+        best = engine.best_of(names)
+        print(f'{len(names):>5}  {best}  ' + ' '.join(sorted(name for name in names if name != best)))
+
+
+def cmd_filter(engine, args):
+    """ indexes the EXIF fields of the folder and lists the images whose field lies within
+        the given range, in file name order
+    """
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    engine.metadata_index = MetadataIndex(engine.folder_path, os.path.join(engine.cache_dir, 'metadata'))
+    total = len(engine.metadata_index.stale(engine.image_files))
+    try:
+        for done, _ in enumerate(engine.metadata_index.update(engine.image_files, args.workers), 1):
+            print(f'{done}/{total} images indexed', end='\r', flush=True)
+    except KeyboardInterrupt:
+        print('\nInterrupted, run again to carry on')
+    if total:
+        print()
+    engine.metadata_index.save()
+    names = engine.filter_image_files(args.field, args.min, args.max)
+    for name in names:
+        print(f"{engine.metadata_index.get(name).get(args.field)!s:>10}  {name}")
+    print(f'{len(names)} of {len(engine.image_files)} images within the range')
+
+
+def cmd_export(engine, args):
+    engine.open_folder(args.folder, remember=False, index_metadata=False)
+    data = engine.get_ranking_table_data()
+    if args.format == 'json' or (args.format is None and args.output.endswith('.json')):
+        engine.write_rank_json(data, args.output)
+    else:
+        engine.write_rank_csv(engine.get_ranking_header(), data, args.output)
+    print(f'{len(data)} images written to {args.output}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cache-dir', default='./local_cache/', help='where rankings and caches are kept')
+    parser.add_argument('--store', choices=('sqlite', 'json'), default=None, help='ranking storage backend')
+    parser.add_argument('--recursive', action='store_true', default=None, help='include images in sub folders')
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--trace', help='print span percentiles and write a Chrome trace to this file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help='list the folder and report what is stored for it')
+    scan.add_argument('folder')
+    scan.set_defaults(run=cmd_scan)
+
+    replay = commands.add_parser('replay', help='replay stored comparisons or a vote log, without writing')
+    replay.add_argument('folder')
+    replay.add_argument('--log', help='JSON lines of {"winner": ..., "loser": ...} to replay instead')
+    replay.add_argument('--top', type=int, default=10, help='ranking rows to print')
+    replay.set_defaults(run=cmd_replay)
+
+    ingest = commands.add_parser('ingest', help='record votes from JSON lines')
+    ingest.add_argument('folder')
+    ingest.add_argument('votes', nargs='?', default='-', help='file of JSON lines, - for stdin')
+    ingest.set_defaults(run=cmd_ingest)
+
+    tournament = commands.add_parser('tournament', help='let Gemini cast the votes')
+    tournament.add_argument('folder')
+    tournament.add_argument('--comparisons', type=int, default=100)
+    tournament.add_argument('--pairing', choices=sorted(STRATEGIES), default='close')
+    tournament.add_argument('--workers', type=int, default=4, help='comparisons in flight at once')
+    tournament.add_argument('--top', type=int, default=10, help='ranking rows to print')
+    tournament.add_argument('--mode', choices=('pairs', 'sort', 'top'), default='pairs',
+                            help='scheduled pairs, a full merge sort, or a knockout for the best k')
+    tournament.add_argument('--k', type=int, default=20, help='places to find with --mode top')
+    tournament.add_argument('--collapse-duplicates', action='store_true',
+                            help='compare only the best image of each group found by the duplicates command')
+    tournament.set_defaults(run=cmd_tournament)
+
+    export = commands.add_parser('export', help='write the ranking table')
+    export.add_argument('folder')
+    export.add_argument('--output', default='rank.csv')
+    export.add_argument('--format', choices=('csv', 'json'), default=None, help='guessed from the file name if not given')
+    export.set_defaults(run=cmd_export)
+
+    thumbnails = commands.add_parser('thumbnails', help='render the display thumbnails on all CPU cores')
+    thumbnails.add_argument('folder')
+    thumbnails.add_argument('--workers', type=int, default=None, help='processes, all CPUs by default')
+    thumbnails.set_defaults(run=cmd_thumbnails)
+
+    quality = commands.add_parser('quality', help='score sharpness and exposure locally to seed the ratings')
+    quality.add_argument('folder')
+    quality.add_argument('--workers', type=int, default=None, help='processes, all CPUs by default')
+    quality.add_argument('--top', type=int, default=10, help='best scored images to print')
+    quality.set_defaults(run=cmd_quality)
+
+    duplicates = commands.add_parser('duplicates', help='group near-duplicate images by perceptual hash')
+    duplicates.add_argument('folder')
+    duplicates.add_argument('--threshold', type=int, default=5, help='differing hash bits still counted as duplicates')
+    duplicates.add_argument('--workers', type=int, default=None, help='processes, all CPUs by default')
+    duplicates.add_argument('--top', type=int, default=20, help='groups to print')
+    duplicates.set_defaults(run=cmd_duplicates)
+
+    filter_range = commands.add_parser('filter', help='list the images whose EXIF field lies within a range')
+    filter_range.add_argument('folder')
+    filter_range.add_argument('--field', choices=DISPLAY_FIELDS, default='ISOSpeedRatings')
+    filter_range.add_argument('--min', type=float, default=None, help='lowest value kept')
+    filter_range.add_argument('--max', type=float, default=None, help='highest value kept')
+    filter_range.add_argument('--workers', type=int, default=None, help='processes, all CPUs by default')
+    filter_range.set_defaults(run=cmd_filter)
+
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable()
+    engine = RankingEngine(args.cache_dir, args.store, args.recursive)
+    try:
+        args.run(engine, args)
+    finally:
+        engine.store.close()
+    tracer.report(args.trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,55 +1,46 @@
+import time
+STARTUP_NS = time.perf_counter_ns()  # taken before the other imports so they count towards startup
 import FreeSimpleGUI as sg
 import os
-import io
-import random
-import csv
-import json
-import gettext
-import google.generativeai as genai
-from PIL import Image
-from PIL.ExifTags import TAGS
-from dotenv import load_dotenv
-from utils.imageutils import resize_image, get_exif_data, sanitise_exif_value
+import threading
+from utils.imageutils import resize_image, render_exif_thumbnail
+from utils.thumbcache import ThumbnailCache
+from utils.prefetch import DisplayCache, Prefetcher
+from utils.engine import RankingEngine
+from utils.filelist import FileIndex, FileView
+from utils.gemini import AIJobQueue
+from utils.tracing import tracer, traced
 
-load_dotenv()
 
 
-class ImageRanker:
+class ImageRanker(RankingEngine):
     def __init__(self):
-        self.image_files = []
-        self.folder_path = None
-        self.rankings = {}
-        self.current_left = None
-        self.current_right = None
-        self.cache_dir = './local_cache/'
-        self.cache_file = 'rankings.data'
+        super().__init__()
+        self.ai_jobs = None
+        self.refresh_interval_ms = 5000  # how often open windows pick up added or deleted files
+        self.rescan_running = False
+        self.icon_cache = ThumbnailCache(os.path.join(self.cache_dir, 'ui'), extension='png')  # small, so its index loads instantly
+        self.display_cache = DisplayCache()
+        self.prefetcher = Prefetcher(self.render_display_bytes, self.display_cache)
+        self.prefetch_radius = 3  # files rendered ahead of and behind the one on screen
+        self.file_index = None
+        self.file_list_rows = 200  # names in the view mode listbox at a time
+        self.queued_images = []  # vote mode: (image, partner) chosen ahead of time, partner None for a fresh pair
+        self.keep_winner = False
+        self.table_page = 0
+        self.table_page_size = 10  # rows of the ranking table, only these are built per update
+        self.pipeline_stats = {'hits': 0, 'misses': 0}
         self.toggle_btn_off = b'iVBORw0KGgoAAAANSUhEUgAAACgAAAAoCAYAAACM/rhtAAAABmJLR0QA/wD/AP+gvaeTAAAED0lEQVRYCe1WTWwbRRR+M/vnv9hO7BjHpElMKSlpqBp6gRNHxAFVcKM3qgohQSqoqhQ45YAILUUVDRxAor2VAweohMSBG5ciodJUSVqa/iikaePEP4nj2Ovdnd1l3qqJksZGXscVPaylt7Oe/d6bb9/svO8BeD8vA14GvAx4GXiiM0DqsXv3xBcJU5IO+RXpLQvs5yzTijBmhurh3cyLorBGBVokQG9qVe0HgwiXLowdy9aKsY3g8PA5xYiQEUrsk93JTtjd1x3siIZBkSWQudUK4nZO1w3QuOWXV+HuP/fL85klAJuMCUX7zPj4MW1zvC0Ej4yMp/w++K2rM9b70sHBYCjo34x9bPelsgp/XJksZ7KFuwZjr3732YcL64ttEDw6cq5bVuCvgy/sje7rT0sI8PtkSHSEIRIKgCQKOAUGM6G4VoGlwiqoVd2Za9Vl8u87bGJqpqBqZOj86eEHGNch+M7otwHJNq4NDexJD+59RiCEQG8qzslFgN8ibpvZNsBifgXmFvJg459tiOYmOElzYvr2bbmkD509e1ylGEZk1Y+Ssfan18n1p7vgqVh9cuiDxJPxKPT3dfGXcN4Tp3dsg/27hUQs0qMGpRMYjLz38dcxS7Dm3nztlUAb38p0d4JnLozPGrbFfBFm79c8hA3H2AxcXSvDz7/+XtZE1kMN23hjV7LTRnKBh9/cZnAj94mOCOD32gi2EUw4FIRUMm6LGhyiik86nO5NBdGRpxYH14bbjYfJteN/OKR7UiFZVg5T27QHYu0RBxoONV9W8KQ7QVp0iXdE8fANUGZa0QAvfhhXlkQcmjJZbt631oIBnwKmacYoEJvwiuFgWncWnXAtuVBBEAoVVXWCaQZzxmYuut68b631KmoVBEHMUUrJjQLXRAQVSxUcmrKVHfjWWjC3XOT1FW5QrWpc5IJdQhDKVzOigEqS5dKHMVplnNOqrmsXqUSkn+YzWaHE9RW1FeXL7SKZXBFUrXW6jIV6YTEvMAUu0W/G3kcxPXP5ylQZs4fa6marcWvvZfJu36kuHjlc/nMSuXz+/ejxgqPFpuQ/xVude9eu39Jxu27OLvBGoMjrUN04zrNMbgVmOBZ96iPdPZmYntH5Ls76KuxL9NyoLA/brav7n382emDfHqeooXyhQmARVhSnAwNNMx5bu3V1+habun5nWdXhwJZ2C5mirTesyUR738sv7g88UQ0rEkTDlp+1wwe8Pf0klegUenYlgyg7bby75jUTITs2rhCAXXQ2vwxz84vlB0tZ0wL4NEcLX/04OrrltG1s8aOrHhk51SaK0us+n/K2xexBxljcsm1n6x/Fuv1PCWGiKOaoQCY1Vb9gWPov50+fdEqd21ge3suAlwEvA14G/ucM/AuppqNllLGPKwAAAABJRU5ErkJggg=='
         self.toggle_btn_on = b'iVBORw0KGgoAAAANSUhEUgAAACgAAAAoCAYAAACM/rhtAAAABmJLR0QA/wD/AP+gvaeTAAAD+UlEQVRYCe1XzW8bVRCffbvrtbP+2NhOD7GzLm1VoZaPhvwDnKBUKlVyqAQ3/gAkDlWgPeVQEUCtEOIP4AaHSI0CqBWCQyXOdQuRaEFOk3g3IMWO46+tvZ+PeZs6apq4ipON1MNafrvreTPzfvub92bGAOEnZCBkIGQgZOClZoDrh25y5pdjruleEiX+A+rCaQo05bpuvJ/+IHJCSJtwpAHA/e269g8W5RbuzF6o7OVjF8D3Pr4tSSkyjcqfptPDMDKSleW4DKIggIAD5Yf+Oo4DNg6jbUBlvWLUNutAwZu1GnDjzrcXzGcX2AHw/emFUV6Sfk0pqcKpEydkKSo9q3tkz91uF5aWlo1Gs/mYc+i7tz4//19vsW2AU9O381TiioVCQcnlRsWeQhD3bJyH1/MiFLICyBHiuzQsD1arDvypW7DR9nzZmq47q2W95prm+I9fXfqXCX2AF2d+GhI98Y8xVX0lnxvl2UQQg0csb78ag3NjEeD8lXZ7pRTgftmCu4864OGzrq+5ZU0rCa3m+NzXlzvoAoB3+M+SyWQuaHBTEzKMq/3BMbgM+FuFCDBd9kK5XI5PJBKqLSev+POTV29lKB8rT0yMD0WjUSYLZLxzNgZvIHODOHuATP72Vwc6nQ4Uiw8MUeBU4nHS5HA6TYMEl02wPRcZBJuv+ya+UCZOIBaLwfCwQi1Mc4QXhA+PjWRkXyOgC1uIhW5Qd8yG2TK7kSweLcRGKKVnMNExWWBDTQsH9qVmtmzjiThQDs4Qz/OUSGTwcLwIQTLW58i+yOjpXDLqn1tgmDzXzRCk9eDenjo9yhvBmlizrB3V5dDrNTuY0A7opdndStqmaQLPC1WCGfShYRgHdLe32UrV3ntiH9LliuNrsToNlD4kruN8v75eafnSgC6Luo2+B3fGKskilj5muV6pNhk2Qqg5v7lZ51nBZhNBjGrbxfI1+La5t2JCzfD8RF1HTBGJXyDzs1MblONulEqPDVYXgwDIfNx91IUVbAbY837GMur+/k/XZ75UWmJ77ou5mfM1/0x7vP1ls9XQdF2z9uNsPzosXPNFA5m0/EX72TBSiqsWzN8z/GZB08pWq9VeEZ+0bjKb7RTD2i1P4u6r+bwypo5tZUumEcDAmuC3W8ezIqSGfE6g/sTd1W5p5bKjaWubrmWd29Fu9TD0GlYlmTx+8tTJoZeqYe2BZC1/JEU+wQR5TVEUPptJy3Fs+Vkzgf8lemqHumP1AnYoMZSwsVEz6o26i/G9Lgitb+ZmLu/YZtshfn5FZDPBCcJFQRQ+8ih9DctOFvdLIKHH6uUQnq9yhFu0bec7znZ+xpAGmuqef5/wd8hAyEDIQMjAETHwP7nQl2WnYk4yAAAAAElFTkSuQmCC'
 
-        self.available_languages = ['en', 'pt-BR']
-        self.set_language()
-
-    def set_language(self, language='en'):
-        domain='main'
-        localedir = os.path.join(os.path.dirname(__file__), 'locale')
-
-        # Load the translation
-        try:
-            # Use find to locate the .mo file based on the system's locale settings
-            # or the specified languages
-            translation = gettext.translation(domain, localedir, languages=[language], fallback=True)
-            self._ = translation.gettext # Assign the translation function to '_'
-        except FileNotFoundError:
-            # Fallback if no translation is found for the specified language
-            self._ = gettext.gettext # Use the default gettext if no translation is available
-
     def select_folder(self):
         """ Pop-up folder selection for the user to choose the location of images on the filesystem
         """
         default_folder_path = './images'
-        cache_data = self.read_rankings_from_disk()
-        if 'latest_folder' in cache_data:
-            default_folder_path = cache_data['latest_folder']
+        latest_folder = self.store.latest_folder()
+        if latest_folder:
+            default_folder_path = latest_folder
+        self.report_startup()
         folder = sg.popup_get_folder(self._('Image folder to open'), default_path=default_folder_path)
 
         if not folder:
@@ -57,37 +48,169 @@ class ImageRanker:
             # TODO - do we need the pop-up here?
             raise SystemExit()
 
-        self.folder_path = folder
-        self.load_images()
-
-        # update any loaded image data with the ranking data from previous runs
-        # can't just overwrite it since the files in the folder may have changed
-        cached_ranking_data = {}
-        if 'rankings' in cache_data and self.folder_path in cache_data['rankings']:
-            cached_ranking_data = cache_data['rankings'][self.folder_path]
-            for image_name, image_votes in cached_ranking_data.items():
-                if image_name in self.rankings:
-                    self.rankings[image_name] = image_votes
-
-        return len(self.image_files) >= 2
+        return self.open_folder(folder)
         # create sub list of image files (no sub folders, no wrong file types)
         
 
-    def load_images(self):
-        """ Create the list of files from the selected folder
+    def report_startup(self):
+        """ prints the time from process start until the first window is about to open
         """
-        if not self.folder_path:
+        finished = time.perf_counter_ns()
+        tracer.record('startup.first_window', STARTUP_NS, finished)
+        print(f'Time to first window: {(finished - STARTUP_NS) / 1e6:.0f} ms')
+
+
+    def get_icon_bytes(self, icon_path, size=(100, 100)):
+        """ button image data for a UI icon, resized once and then read from the local cache
+
+            Parameters
+            icon_path : str
+               path of the icon image
+            size : tuple of int
+               the (width, height) of the button image
+        """
+        data = self.icon_cache.get(icon_path, size)
+        if data is None:
+            data = resize_image(icon_path, size)
+            self.icon_cache.put(icon_path, size, data)
+        return data
+
+
+    def warm_thumbnails(self):
+        """ renders the display thumbnails of the whole folder on all CPU cores, with a
+            progress meter. Cancelling keeps what was rendered, the next run carries on from there
+        """
+        warmer = self.get_thumbnail_warmer()
+        total = len(warmer.file_paths)
+        run = warmer.run()
+        try:
+            for _ in run:
+                done = sum(warmer.stats.values())  # skipped images count as done
+                if not sg.one_line_progress_meter(self._('Preparing thumbnails'), done, total, key='-WARMUP_PROGRESS-'):
+                    if done < total:
+                        break
+        finally:
+            run.close()
+        sg.one_line_progress_meter_cancel(key='-WARMUP_PROGRESS-')
+        summary = self._('{rendered} thumbnails rendered, {skipped} already up to date, {failed} failed')
+        summary = summary.format(**warmer.stats)
+        if warmer.cache_full:
+            summary += '\n' + self._('The thumbnail cache is full, {left_out} images were left out. '
+                                      'Raise IMAGE_RANKER_THUMBNAIL_MB to keep more').format(left_out=warmer.left_out)
+        sg.popup_ok(summary)
+
+
+    def score_folder_quality(self):
+        """ scores the sharpness and exposure of the whole folder locally, with a progress
+            meter, and seeds the ratings from the scores. Cancelling keeps the scores so far
+        """
+        pending = len(self.quality_index.stale(self.image_files))
+        run = self.score_quality()
+        try:
+            for done, _ in enumerate(run, 1):
+                if not sg.one_line_progress_meter(self._('Scoring sharpness'), done, pending, key='-QUALITY_PROGRESS-'):
+                    if done < pending:
+                        break
+        finally:
+            run.close()
+        sg.one_line_progress_meter_cancel(key='-QUALITY_PROGRESS-')
+        scored = len(self.quality_index.scores(self.image_files))
+        sg.popup_ok(self._('{scored} of {total} images scored, their ratings now start from the scores').format(
+            scored=scored, total=len(self.image_files)))
+
+
+    def show_current_pair(self, window):
+        """ puts current_left and current_right on screen
+        """
+        window['-IMAGE1-'].update(data=self.get_display_bytes(os.path.join(self.folder_path, self.current_left)))
+        window['-IMAGE2-'].update(data=self.get_display_bytes(os.path.join(self.folder_path, self.current_right)))
+
+
+    def show_tournament_pair(self, window):
+        """ shows the tournament's pending pair, finishing the tournament if there is none, and
+            prefetches the images of both pairs that can follow the vote
+        """
+        if self.tournament.pending is None:
+            self.finish_tournament(window)
             return
-        # PIL supported image types
-        img_types = ('.png', '.jpg', 'jpeg', '.tiff', '.bmp')
-        self.image_files = [
-            f for f in os.listdir(self.folder_path) 
-            if f.lower().endswith(img_types)
-        ]
-        
-        self.rankings = {img: 0 for img in self.image_files}
+        self.current_left, self.current_right = self.tournament.pending
+        self.show_current_pair(window)
+        upcoming = []
+        for winner, loser in ((self.current_left, self.current_right), (self.current_right, self.current_left)):
+            pair = self.tournament.next_after(winner, loser)
+            if pair is not None:
+                upcoming.extend(image for image in pair if image not in (self.current_left, self.current_right))
+        self.prefetcher.prefetch([os.path.join(self.folder_path, image) for image in dict.fromkeys(upcoming)])
+        self.update_tournament_status(window)
+
+
+    def update_tournament_status(self, window):
+        if self.tournament is None:
+            window['-TOURNAMENT_STATUS-'].update('')
+            return
+        done, total = self.tournament.estimate()
+        status = self._('Vote {done} of about {total}, about {remaining} left')
+        window['-TOURNAMENT_STATUS-'].update(status.format(done=done, total=total, remaining=total - done))
+
+
+    def vote_in_tournament(self, window, winner, loser):
+        """ answers the tournament's pending pair and shows the next one
+        """
+        self.record_tournament_vote(winner, loser)
+        self.show_tournament_pair(window)
+        self.update_rank_table(window)
+
+
+    def finish_tournament(self, window):
+        """ saves the result of a finished tournament to tournament.csv and returns to free voting
+        """
+        tournament = self.tournament
+        rows = [[place, image] for place, image in enumerate(tournament.result, 1)]
+        self.write_rank_csv([self._('rank'), self._('image name')], rows, 'tournament.csv')
+        self.stop_tournament(discard=True)
+        window['-TOURNAMENT-'].update(value=self._('Free voting'))
+        self.update_tournament_status(window)
+        message = self._('Tournament finished after {votes} votes. Saved to tournament.csv')
+        sg.popup_ok(message.format(votes=len(tournament.answers)))
+        if self.update_images():
+            self.show_current_pair(window)
+            self.queued_images = []
+            self.plan_next_images()
+
+
+    def find_folder_duplicates(self):
+        """ hashes the folder for near-duplicates with a progress meter and reports the groups found
+        """
+        pending = len(self.hash_index.stale(self.image_files))
+        run = self.find_duplicates()
+        try:
+            for done, _ in enumerate(run, 1):
+                if not sg.one_line_progress_meter(self._('Finding near-duplicates'), done, pending, key='-DUPES_PROGRESS-'):
+                    if done < pending:
+                        break
+        finally:
+            run.close()
+        sg.one_line_progress_meter_cancel(key='-DUPES_PROGRESS-')
+        groups = self.duplicate_groups.groups()
+        summary = self._('{groups} groups of near-duplicates, {images} images in them')
+        sg.popup_ok(summary.format(groups=len(groups), images=sum(len(names) for names in groups)))
+
+
+    def get_placeholder_bytes(self, file_path, maxsize=(720, 480)):
+        """ image data from the embedded EXIF thumbnail, shown while the full preview renders.
+            Returns None when the file has no thumbnail
+
+            Parameters
+            file_path : str
+               path of the image to display
+        """
+        try:
+            return render_exif_thumbnail(file_path, maxsize)
+        except Exception:
+            return None
 
 
+    @traced('convert_to_bytes')
     def convert_to_bytes(self, file_path, maxsize=(720, 480)):
         """Generate image data using PIL
         """
@@ -96,105 +219,121 @@ class ImageRanker:
         # if not os.path.exists(file_path):
         #     raise FileNotFoundError(f'Image file not found: {file_path}')
         try:
-            img = Image.open(file_path)
-            img.thumbnail(maxsize)
-            
-            bio = io.BytesIO()
-            img.save(bio, format='PNG')
-            del img
-            return bio.getvalue()
+            return self.render_display_bytes(file_path, maxsize)
         except Exception as e:
             sg.popup_error(f'Error loading image: {e}')
             return None
 
 
-    def get_random_image(self, excludes=None):
-        """ Chooses a random image among those in the file list.
-            
+    @traced('get_display_bytes')
+    def get_display_bytes(self, file_path):
+        """ Display-size image data from the in-memory cache, waiting on or performing the render if needed
+
             Parameters
-            excludes : array of str
-               the file names of files to exclude from possible return values
+            file_path : str
+               path of the image to display
         """
-        available = [img for img in self.image_files if img not in excludes]
-        if not available:
+        try:
+            return self.prefetcher.get(file_path)
+        except Exception as e:
+            sg.popup_error(f'Error loading image: {e}')
             return None
-        return random.choice(available)
 
 
-    def update_images(self, keep_selected=None, new_random=None):
-        """ Update the images in the window
-            
+    def prefetch_around(self, view):
+        """ queues the files either side of the current one for background rendering,
+            dropping queued work for files that are no longer nearby
+
             Parameters
-            keep_selected : array of str
-               string 'right' or 'left' to indicate to keep either image, None will cycle both
-            new_random : str
-                string filename to set image to, otherwise will select at random
+            view : FileView
+               the view mode file list
         """
-        if keep_selected is None:
-            self.current_left, self.current_right = random.sample(self.image_files, 2)
-        else:
-            if keep_selected == 'left':
-                self.current_left = self.current_left
-                self.current_right = new_random if new_random else self.get_random_image([self.current_left, self.current_right])
-            else:
-                self.current_right = self.current_right
-                self.current_left = new_random if new_random else self.get_random_image([self.current_left, self.current_right])
+        self.prefetcher.prefetch([os.path.join(self.folder_path, name) for name in view.neighbours(self.prefetch_radius)])
 
-        return True
 
+    def show_file_list(self, window, view):
+        """ puts the slice of the file list around the current file in the listbox,
+            the widget is only refilled when the slice moved
+        """
+        names, row = view.visible()
+        listbox = window['listbox']
+        if names != listbox.get_list_values():
+            listbox.update(values=names)
+        if names:
+            listbox.update(set_to_index=[row], scroll_to_index=row)
 
-    def record_selection(self, selected_side):
-        """ stores vote between images
-            
-            Parameters
-            selected_side : str
-               string 'right' or 'left' to indicate to image that was voted for
+
+    def plan_next_images(self):
+        """ picks the images for the next pairings ahead of time and queues them for background
+            rendering. With keep winner on, an opponent is planned for each side since either
+            may win, otherwise a whole fresh pair is planned
         """
-        if selected_side == 'left':
-            selected_image = self.current_left
+        current = [self.current_left, self.current_right]
+        if self.keep_winner:
+            self.queued_images = [(img, partner) for img, partner in self.queued_images
+                                  if img not in current and img in self.rankings and partner in current]
+            planned = [partner for _, partner in self.queued_images]
+            for partner in current:
+                if partner not in planned:
+                    queued = [img for img, _ in self.queued_images]
+                    opponent = self.scheduler.next_opponent(partner, current + queued)
+                    if opponent is not None:
+                        self.queued_images.append((opponent, partner))
         else:
-            selected_image = self.current_right
-        
-        if selected_image:
-            if selected_image not in self.rankings:
-                self.rankings[selected_image] = 0
-            self.rankings[selected_image] += 1
-    
+            self.queued_images = [(img, partner) for img, partner in self.queued_images
+                                  if img not in current and img in self.rankings and partner is None]
+            if len(self.queued_images) < 2:
+                pair = self.scheduler.next_pair(current)
+                self.queued_images = [(img, None) for img in pair] if pair else []
+        self.prefetcher.prefetch([os.path.join(self.folder_path, img) for img, _ in self.queued_images])
 
-    def get_ranking_display(self):
-        sorted_rankings = sorted(
-            self.rankings.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
 
-        if not sorted_rankings:
-            return 'Empty ranking'
-        
-        max_filename_len = max(len(img) for img, _ in sorted_rankings) if sorted_rankings else 30
-        max_filename_len = max(max_filename_len, 20)
+    def take_next_image(self, excludes, partner=None):
+        """ returns the next planned image, preferring one planned against partner, falling back
+            to the scheduler if the queue has nothing usable, and counts whether its display
+            bytes were ready in time
 
-        lines = [f"{'Image Filename':<{max_filename_len}} | Votes", "-" * (max_filename_len + 20)]
+            Parameters
+            excludes : array of str
+               the file names of files to exclude from possible return values
+            partner : str
+               the image that stays on screen and will be compared with the returned one
+        """
+        new_img = None
+        for wanted in (partner, None):
+            for position, (candidate, candidate_partner) in enumerate(self.queued_images):
+                if candidate_partner == wanted and candidate not in excludes:
+                    new_img = candidate
+                    del self.queued_images[position]
+                    break
+            if new_img is not None:
+                break
+        if new_img is None:
+            new_img = self.scheduler.next_opponent(partner, excludes) if partner else self.get_random_image(excludes)
+            if new_img is None:
+                return None
+        if self.prefetcher.is_ready(os.path.join(self.folder_path, new_img)):
+            self.pipeline_stats['hits'] += 1
+        else:
+            self.pipeline_stats['misses'] += 1
+        return new_img
 
-        for rank, (image, votes) in enumerate(sorted_rankings, 1):
-            lines.append(f"{image:<{max_filename_len}} | {votes}")
-        
-        return '\n'.join(lines)
-    
 
-    def get_ranking_table_data(self):
-        sorted_rankings = sorted(
-            self.rankings.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+    def update_rank_table(self, window):
+        """ shows the current page of the ranking table, only its rows are built
 
-        table_data = []
-        
-        for rank, (image, votes) in enumerate(sorted_rankings, 1):
-            table_data.append([rank, image, votes])
-        
-        return table_data
+            Parameters
+            window : simplegui window object
+                the vote mode window
+        """
+        total = len(self.rank_order)
+        last_page = max(0, (total - 1) // self.table_page_size)
+        self.table_page = min(max(self.table_page, 0), last_page)
+        start = self.table_page * self.table_page_size
+        window['-RANK_TABLE-'].update(values=self.get_ranking_table_data(start, self.table_page_size))
+        page_text = self._('Rows {first}-{last} of {total}')
+        window['-TABLE_PAGE-'].update(page_text.format(first=min(start + 1, total),
+                                                       last=min(start + self.table_page_size, total), total=total))
 
 
     def generate_rank_csv(self, header, data):
@@ -206,35 +345,131 @@ class ImageRanker:
             data : array of str
                 data for csv entries
         """
-        filename = 'rank.csv'
+        self.write_rank_csv(header, data, 'rank.csv')
+        sg.popup_ok(self._('CSV created successfully!'))
 
-        with open(filename, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(header)
-            writer.writerows(data[0:])
 
-        sg.popup_ok(self._('CSV created successfully!'))
+    def get_ai_jobs(self, api_key):
+        """ the background queue for Gemini requests made from the vote and view windows
+        """
+        if self.ai_jobs is None:
+            self.ai_jobs = AIJobQueue(self.get_gemini_client(api_key))
+        return self.ai_jobs
 
 
-    def get_image_eval(self, api_key, filename):
-        """ asks Gemini for image evaluation
+    def start_folder_rescan(self, window):
+        """ rescans the folder on a worker thread, the file names come back as a '-RESCANNED-'
+            event on window for apply_folder_scan. Does nothing while a rescan is running
+        """
+        if self.rescan_running or self.scanner is None:
+            return
+        self.rescan_running = True
+
+        def rescan():
+            try:
+                found = self.scan_folder()
+                window.write_event_value('-RESCANNED-', found)
+            except Exception:
+                pass  # the window was closed while the folder was being scanned
+            finally:
+                self.rescan_running = False
+        threading.Thread(target=rescan, daemon=True).start()
+
+
+    def replace_removed_images(self, window, removed):
+        """ puts new images in place of any on screen that were deleted from the folder
+        """
+        self.queued_images = [(img, partner) for img, partner in self.queued_images
+                              if img in self.rankings and (partner is None or partner in self.rankings)]
+        if self.tournament is not None:
+            if removed:
+                self.show_tournament_pair(window)  # the tournament was reloaded without them
+            return
+        left_gone, right_gone = self.current_left in removed, self.current_right in removed
+        if left_gone and right_gone:
+            if self.update_images():
+                self.show_current_pair(window)
+            self.plan_next_images()
+        elif left_gone:
+            self.cycle_image(window, 'left', False)
+        elif right_gone:
+            self.cycle_image(window, 'right', False)
+
+
+    def dispatch_ai_job(self, api_key, window, prompt, file_paths, context):
+        """ sends a Gemini request to the background queue, its result comes back as a
+            '-AI_DONE-' event on window with the job id as value
+        """
+        def notify(job_id):
+            try:
+                window.write_event_value('-AI_DONE-', job_id)
+            except Exception:
+                pass  # the window was closed while the request was running
+        self.get_ai_jobs(api_key).submit(prompt, file_paths, context, notify)
+        self.update_ai_status(window)
+
+
+    def update_ai_status(self, window, message=''):
+        pending = self.ai_jobs.pending_count() if self.ai_jobs else 0
+        status = self._('Gemini: {pending} request(s) pending').format(pending=pending) if pending else ''
+        window['-AI_STATUS-'].update(' '.join(part for part in (status, message) if part))
+
+
+    def cancel_ai_jobs(self, window=None):
+        if self.ai_jobs is not None:
+            self.ai_jobs.cancel_all()
+        if window is not None:
+            self.update_ai_status(window)
+
+
+    def handle_ai_result(self, window, job_id):
+        """ applies a finished Gemini request from the background queue
+
+            Parameters
+            window : simplegui window object
+                the window the request was made from
+            job_id : int
+                the job id posted with the '-AI_DONE-' event
+        """
+        result = self.ai_jobs.take(job_id)
+        self.update_ai_status(window)
+        if result is None:
+            return
+        context, response_text, error = result
+        if error is not None:
+            self.update_ai_status(window, self._('Gemini request failed: {error}').format(error=error))
+            return
+        if context['kind'] == 'eval':
+            self.show_image_eval(context['filename'], response_text)
+        else:
+            self.apply_image_comparison(window, context, response_text)
+
+
+    def get_image_eval(self, api_key, filename, window):
+        """ asks Gemini for image evaluation, the answer is shown once it arrives
             
             Parameters
             api_key : str
                Gemini api_key needed for gemini services
+            filename : str
+               path of the image to evaluate
+            window : simplegui window object
+                the window that receives the result event
         """
-        gemini_key = api_key
-        genai.configure(api_key=gemini_key)
-        model = genai.GenerativeModel(model_name='gemini-2.5-flash')
-        # filename = os.path.join(self.folder_path, image_name)
-        image_for_gemini = Image.open(filename)
-        prompt_text = '''Rate this image for sharpness on a scale of 0-10,
-                         the language for details in the response should be: ''' + self._('language for Gemini response')
-        prompt_text = " ".join(prompt_text.split()) # removes extraneous whitespace
+        self.dispatch_ai_job(api_key, window, self.get_eval_prompt(), [filename], {'kind': 'eval', 'filename': filename})
+
 
-        response = model.generate_content([prompt_text, image_for_gemini])
+    def show_image_eval(self, filename, response_text):
+        """ shows a Gemini image evaluation
+            
+            Parameters
+            filename : str
+               path of the image that was evaluated
+            response_text : str
+               Gemini's answer
+        """
         formated_translate = self._('Gemini evaluation for {filename}:\n\n {response}')
-        formatted_text = f"{formated_translate.format(filename=filename, response=response.text)}"
+        formatted_text = f"{formated_translate.format(filename=filename, response=response_text)}"
         layout = [
             [sg.Text(text=formatted_text)],
             [sg.HorizontalSeparator()],
@@ -257,7 +492,8 @@ class ImageRanker:
     
 
     def get_image_comparison(self, api_key, window, cycle_both=False):
-        """ asks Gemini for image evaluation
+        """ asks Gemini to compare the pair on screen. The request runs in the background,
+            so voting can go on and several comparisons can be queued
             
             Parameters
             api_key : str
@@ -265,34 +501,69 @@ class ImageRanker:
             window : simplegui window object
                 needed to make call by reference updates to the main window
         """
-        gemini_key = api_key
-        genai.configure(api_key=gemini_key)
-        model = genai.GenerativeModel(model_name='gemini-2.5-flash')
         file1 = os.path.join(self.folder_path, self.current_left)
         file2 = os.path.join(self.folder_path, self.current_right)
-        image1 = Image.open(file1)
-        image2 = Image.open(file2)
-        response = model.generate_content(['''Compare these two images and indicate which picture is technically superior. 
-                                              Start your response with 1 or 2 to indicate which image is the answer before giving details. 
-                                              If they are equivalent, randomly select 1 or 2.''', image1, image2])
+        context = {'kind': 'compare', 'left': self.current_left, 'right': self.current_right,
+                   'file1': file1, 'file2': file2, 'cycle_both': cycle_both}
+        self.dispatch_ai_job(api_key, window, self.comparison_prompt, [file1, file2], context)
+
+
+    def apply_image_comparison(self, window, context, response_text):
+        """ records Gemini's vote for the pair that was on screen when the comparison was
+            requested, and cycles the images only if that pair is still showing
+        """
+        file1, file2 = context['file1'], context['file2']
         formatted_translate = self._('Gemini comparison for {file1} vs {file2}:\n\n {response}')
-        formatted_text = f'{formatted_translate.format(file1=file1, file2=file2, response=response.text)}'
+        formatted_text = f'{formatted_translate.format(file1=file1, file2=file2, response=response_text)}'
 
-        if(response.text.startswith('1')):
+        winner, loser = self.comparison_result(context['left'], context['right'], response_text)
+        if winner == context['left']:
             vote_translation = self._('Gemini voted for image1: {file1}')
-            sg.popup(f'{vote_translation.format(file1=file1)}')
-            self.record_selection('left')
-            self.cycle_image(window, 'right', cycle_both)
+            message = vote_translation.format(file1=file1)
+            cycle_side = 'right'
         else:
             vote_translation = self._('Gemini voted for image2: {file2}')
-            sg.popup(f'{vote_translation.format(file2=file2)}')
-            self.record_selection('right')
-            self.cycle_image(window, 'left', cycle_both)
+            message = vote_translation.format(file2=file2)
+            cycle_side = 'left'
+        self.update_ai_status(window, message)
+        if self.tournament is not None and self.tournament.pending in ((winner, loser), (loser, winner)):
+            self.vote_in_tournament(window, winner, loser)
+            return
+        self.record_vote(winner, loser)
+        if self.tournament is not None:
+            self.update_rank_table(window)  # the tournament has moved on from this pair
+        elif (self.current_left, self.current_right) == (context['left'], context['right']):
+            self.cycle_image(window, cycle_side, context['cycle_both'])
+        else:
+            self.update_rank_table(window)
         print(f'Gemini full voting response:\n {formatted_text}')
-        image1.close()
-        image2.close()
 
 
+    def evaluate_folder(self, api_key):
+        """ asks Gemini to evaluate every image in the folder, several requests at a time within
+            the rate limit. Answers are cached by image content, so a re-run only pays for new
+            or changed images. Results are written to gemini_eval.csv
+            
+            Parameters
+            api_key : str
+               Gemini api_key needed for gemini services
+        """
+        client = self.get_gemini_client(api_key)
+        calls_before = client.stats['calls']
+        file_paths = [os.path.join(self.folder_path, name) for name in self.image_files]
+        results = []
+        for done, (file_path, text, error) in enumerate(client.batch_evaluate(file_paths, self.get_eval_prompt()), 1):
+            results.append([os.path.relpath(file_path, self.folder_path), text if error is None else f'Error: {error}'])
+            if not sg.one_line_progress_meter(self._('Gemini Eval - whole folder'), done, len(file_paths), key='-GEMINI_BATCH-'):
+                if done < len(file_paths):
+                    break  # cancelled, the answers received so far are already cached
+
+        self.write_rank_csv([self._('image name'), self._('Gemini evaluation')], sorted(results), 'gemini_eval.csv')
+        summary = self._('{count} images evaluated, {calls} Gemini requests sent. Saved to gemini_eval.csv')
+        sg.popup_ok(summary.format(count=len(results), calls=client.stats['calls'] - calls_before))
+
+
+    @traced('cycle_image')
     def cycle_image(self, window, side, both):
         """ asks Gemini for image evaluation
             
@@ -306,83 +577,44 @@ class ImageRanker:
         """
         keep = 'right'
         if(side.startswith('left')):
-            new_img = self.get_random_image([self.current_left, self.current_right])
+            new_img = self.take_next_image([self.current_left, self.current_right], self.current_right)
         else:
-            new_img = self.get_random_image([self.current_left, self.current_right])
+            new_img = self.take_next_image([self.current_left, self.current_right], self.current_left)
             keep = 'left'
         if new_img:
             self.update_images(keep_selected=keep, new_random=new_img)
-            img1_path = os.path.join(self.folder_path, self.current_left)
-            img2_path = os.path.join(self.folder_path, self.current_right)
-            img1_data = self.convert_to_bytes(img1_path)
-            img2_data = self.convert_to_bytes(img2_path)
-            window['-IMAGE1-'].update(data=img1_data)
-            window['-IMAGE2-'].update(data=img2_data)
-            window['-RANK_TABLE-'].update(values=self.get_ranking_table_data())
+            # the kept image is already on screen, only the replaced side needs new data
+            if keep == 'right':
+                img1_path = os.path.join(self.folder_path, self.current_left)
+                window['-IMAGE1-'].update(data=self.get_display_bytes(img1_path))
+            else:
+                img2_path = os.path.join(self.folder_path, self.current_right)
+                window['-IMAGE2-'].update(data=self.get_display_bytes(img2_path))
+            self.update_rank_table(window)
 
         if both:
             self.cycle_image(window, keep, False)
-
-
-    def read_rankings_from_disk(self):
-        """ reads the current rankings and other settings from disk
-        """
-        cache_path = self.cache_dir + self.cache_file
-        cache_data = {}
-        if(os.path.exists(cache_path)):
-            try:
-                with open(cache_path, mode='r') as cache_file:
-                    cache_data = json.load(cache_file)
-            except IOError as e:
-                print(f'Error opening file {cache_path} : {e}')
-
-        return cache_data
-
-    def write_rankings_to_disk(self):
-        """ writes the current rankings and other settings to disk
-        """
-        cache_path = self.cache_dir + self.cache_file
-        cache_data = self.read_rankings_from_disk()
-
-        cache_data['latest_folder'] = self.folder_path
-        if 'rankings' not in cache_data:
-            cache_data['rankings'] = {}
-        cache_data['rankings'][self.folder_path] = self.rankings
-
-        try:
-            if not os.path.isdir(self.cache_dir):
-                os.mkdir(self.cache_dir)
-            with open(cache_path, mode='w') as cache_file:
-                cache_file.write(json.dumps(cache_data))
-        except IOError as e:
-                print(f'Error writing to file {cache_path} : {e}')
-
-
-    def get_simplified_image_details(self, image_path):
-        details = get_exif_data(image_path)
-        
-        required_details = ['ApertureValue', "ShutterSpeedValue", "ExposureIndex", "ISOSpeedRatings"]
-        simplified_details = []
-        if details is None:
-            return []
-        else: 
-            filtered_dict = {k: details[k] for k in required_details if k in details}
-            simplified_details.append(list(filtered_dict.values()))
-            
-        return simplified_details
+        self.plan_next_images()
 
 
     def get_view_mode_window(self):
         """ Switches to view-only window from the voting window
         """
-        api_key = os.getenv('GEMINI_API_KEY')
-        num_files = len(self.image_files)
-        filename = os.path.join(self.folder_path, self.image_files[0])  # name of first file in list
-        image_elem = sg.Image(data=self.convert_to_bytes(filename))
+        api_key = self.get_api_key()
+        self.file_index = FileIndex(self.image_files)
+        self.file_index.build_async()
+        view = FileView(self.file_index, self.file_list_rows)
+        filename = os.path.join(self.folder_path, view.current())  # name of first file in list
+        image_elem = sg.Image(data=self.get_display_bytes(filename))
         filename_display_elem = sg.Text(filename, size=(80, 3))
-        file_num_display_elem = sg.Text(self._('File 1 of {}').format(num_files), size=(15, 1))
+        file_num_display_elem = sg.Text(self._('File 1 of {}').format(len(view)), size=(15, 1))
 
         image_exif_header = ["Aperture:", "Shutter Speed:", "Exposure:", "ISO:"]
+        sort_names = {self._('File name'): 'name', self._('Sharpness'): 'quality', self._('ISO'): 'ISOSpeedRatings',
+                      self._('Aperture'): 'ApertureValue', self._('Shutter speed'): 'ShutterSpeedValue'}
+        range_fields = {self._('ISO'): 'ISOSpeedRatings', self._('Aperture'): 'ApertureValue',
+                        self._('Shutter speed'): 'ShutterSpeedValue'}
+        exif_range = (None, None, None)  # (field, minimum, maximum) of the EXIF range filter
 
         # define layout, show and read the form
         col = [[filename_display_elem],
@@ -398,74 +630,140 @@ class ImageRanker:
                         expand_y=False,
                         hide_vertical_scroll=True
                         )
-                    ]]
+                    ],
+            [sg.Text('', key='-QUALITY-', size=(80, 1))]]
 
-        col_files = [[sg.Listbox(values=self.image_files, change_submits=True, size=(60, 30), key='listbox')],
+        col_files = [[sg.Text(self._('Filter:')), sg.Input(key='-FILTER-', enable_events=True, size=(50, 1))],
+                    [sg.Listbox(values=view.visible()[0], change_submits=True, size=(60, 30), key='listbox')],
                     [sg.Button(self._('Gemini Eval'), key='-GEMINI_EVAL-', size=(10, 2)), sg.Button(self._('prev'), key='Prev', size=(8, 2)),
                                 sg.Button(self._('next'), key='Next', size=(8, 2)),file_num_display_elem],
+                    [sg.Button(self._('Gemini Eval - whole folder'), key='-GEMINI_EVAL_FOLDER-'),
+                     sg.Button(self._('Cancel Gemini requests'), key='-AI_CANCEL-')],
+                    [sg.Button(self._('Score sharpness - whole folder'), key='-SCORE_QUALITY-')],
+                    [sg.Text('', key='-AI_STATUS-', size=(60, 1))],
                     [sg.Button(self._('Switch to Vote Mode'), key='-SWITCH_VOTE_MODE-'),
-                     sg.Button(self._('Exit App'), key='-EXIT-')]]
+                     sg.Button(self._('Exit App'), key='-EXIT-')],
+                    [sg.Text(self._('Sort by:')),
+                     sg.Combo(list(sort_names), default_value=self._('File name'), key='-SORT_BY-', enable_events=True, readonly=True)],
+                    [sg.Text(self._('Range:')),
+                     sg.Combo(list(range_fields), default_value=self._('ISO'), key='-RANGE_FIELD-', readonly=True),
+                     sg.Input(key='-RANGE_MIN-', size=(8, 1)), sg.Text(self._('to')), sg.Input(key='-RANGE_MAX-', size=(8, 1)),
+                     sg.Button(self._('Apply'), key='-RANGE_APPLY-')]]
 
         layout = [[sg.Column(col_files), sg.Column(col)]]
 
         window = sg.Window(self._('Image Browser'), layout, return_keyboard_events=True, finalize=True,
                         use_default_focus=False)
 
-        window_keys = ('listbox', 'Next', 'Prev', '-GEMINI_EVAL-', '-SWITCH_VOTE_MODE-', '-EXIT-')
+        window_keys = ('listbox', 'Next', 'Prev', '-GEMINI_EVAL-', '-GEMINI_EVAL_FOLDER-', '-SWITCH_VOTE_MODE-', '-EXIT-',
+                       '-RANGE_APPLY-')
         self.set_clicky_cursors(window, window_keys)
 
         # loop reading the user input and displaying image, filename
-        i = 0
-        listbox = window['listbox']
-        listbox.update(set_to_index=[i], scroll_to_index=i)
+        self.show_file_list(window, view)
         window['-IMAGE_DETAILS-'].update(values=self.get_simplified_image_details(filename))
+        window['-QUALITY-'].update(self.get_quality_details(filename) or self._('Not scored'))
+        self.prefetch_around(view)
+        event_span = None
         while True:
+            tracer.end(event_span)
             # read the form
-            event, values = window.read()
+            event, values = window.read(timeout=self.refresh_interval_ms)
+            event_span = tracer.begin('view.event', event)
             
             # perform button and keyboard operations
             if event in (sg.WIN_CLOSED, '-EXIT-'):
                 break
+            elif event == sg.TIMEOUT_KEY:
+                self.start_folder_rescan(window)
+                continue
+            elif event == '-RESCANNED-':
+                added, removed = self.apply_folder_scan(values['-RESCANNED-'])
+                if not (added or removed):
+                    continue
+                if not self.image_files:
+                    break
+                self.file_index.rebuild(self.filter_image_files(*exif_range))
+                self.file_index.build_async()
+                view.refresh()
             elif event in ('Next', 'MouseWheel:Down', 'Down:40', 'Next:34'):
-                i += 1
-                if i >= num_files:
-                    i -= num_files
-                filename = os.path.join(self.folder_path, self.image_files[i])
+                view.move(1)
             elif event in ('Prev', 'MouseWheel:Up', 'Up:38', 'Prior:33'):
-                i -= 1
-                if i < 0:
-                    i = num_files + i
-                filename = os.path.join(self.folder_path, self.image_files[i])
+                view.move(-1)
             elif event == 'listbox':            # something from the listbox
-                f = values["listbox"][0]            # selected filename
-                filename = os.path.join(self.folder_path, f)  # read this file
-                i = self.image_files.index(f)                 # update running index
-                
+                if not values['listbox'] or not view.select(values['listbox'][0]):
+                    continue
+            elif event == '-FILTER-':
+                view.set_filter(values['-FILTER-'])
+                if view.current() is None:
+                    self.show_file_list(window, view)
+                    file_num_display_elem.update(self._('File {} of {}').format(0, 0))
+                    continue
+            elif event == '-SORT_BY-':
+                self.sort_image_files(sort_names[values['-SORT_BY-']])
+                self.file_index.rebuild(self.filter_image_files(*exif_range))
+                self.file_index.build_async()
+                view.refresh()
+            elif event == '-RANGE_APPLY-':
+                try:
+                    bounds = [float(values[key]) if values[key].strip() else None for key in ('-RANGE_MIN-', '-RANGE_MAX-')]
+                except ValueError:
+                    sg.popup_error(self._('The range limits must be numbers'))
+                    continue
+                exif_range = (range_fields[values['-RANGE_FIELD-']], *bounds)
+                self.file_index.rebuild(self.filter_image_files(*exif_range))
+                self.file_index.build_async()
+                view.refresh()
+                if view.current() is None:
+                    self.show_file_list(window, view)
+                    file_num_display_elem.update(self._('File {} of {}').format(0, 0))
+                    continue
             elif event == '-GEMINI_EVAL-':
-                filename = os.path.join(self.folder_path, self.image_files[i])
-                self.get_image_eval(api_key, filename)
-            elif event == '-IMAGE_DETAILS-':
-                filename = os.path.join(self.folder_path, self.image_files[i])
-                window['-IMAGE_DETAILS-'].update(values=self.get_simplified_image_details(filename))
+                if view.current() is not None:
+                    self.get_image_eval(api_key, os.path.join(self.folder_path, view.current()), window)
+                continue
+            elif event == '-AI_DONE-':
+                self.handle_ai_result(window, values['-AI_DONE-'])
+                continue
+            elif event == '-AI_CANCEL-':
+                self.cancel_ai_jobs(window)
+                continue
+            elif event == '-GEMINI_EVAL_FOLDER-':
+                self.evaluate_folder(api_key)
+                continue
+            elif event == '-SCORE_QUALITY-':
+                self.score_folder_quality()
+                if view.current() is not None:
+                    filename = os.path.join(self.folder_path, view.current())
+                    window['-QUALITY-'].update(self.get_quality_details(filename) or self._('Not scored'))
+                continue
             elif event == '-SWITCH_VOTE_MODE-':
+                self.cancel_ai_jobs()
                 window.close()
                 self.get_vote_mode()
                 break
-            else:
-                filename = os.path.join(self.folder_path, self.image_files[i])
 
-            listbox = window['listbox']
-            
-            listbox.update(set_to_index=[i], scroll_to_index=i)
-            # update window with new image
-            image_elem.update(data=self.convert_to_bytes(filename))
+            if view.current() is None:
+                continue
+            filename = os.path.join(self.folder_path, view.current())
+            self.show_file_list(window, view)
+            # update window with new image, showing the embedded thumbnail first if the preview is not ready
+            if not self.prefetcher.is_ready(filename):
+                placeholder = self.get_placeholder_bytes(filename)
+                if placeholder is not None:
+                    image_elem.update(data=placeholder)
+                    window.refresh()
+            image_elem.update(data=self.get_display_bytes(filename))
+            self.prefetch_around(view)
             # update window with filename
             filename_display_elem.update(filename)
             # update page display
             window['-IMAGE_DETAILS-'].update(values=self.get_simplified_image_details(filename))
+            window['-QUALITY-'].update(self.get_quality_details(filename) or self._('Not scored'))
             
-            file_num_display_elem.update(self._('File {} of {}').format(i+1, num_files))
+            file_num_display_elem.update(self._('File {} of {}').format(view.position + 1, len(view)))
 
+        tracer.end(event_span)
         window.close()
 
 
@@ -485,9 +783,13 @@ class ImageRanker:
 
     def get_vote_mode(self):
         
-        api_key = os.getenv('GEMINI_API_KEY')
-        ranking_header = [self._('rank'), self._('image name'), self._('votes')]
-        keep_winner = False;
+        api_key = self.get_api_key()
+        ranking_header = self.get_ranking_header()
+        self.keep_winner = False
+        self.load_duplicate_groups()  # near-duplicates found in an earlier session are not paired
+        pairing_names = {self._('Random pairs'): 'random', self._('Least compared'): 'uncertainty',
+                         self._('Closest ratings'): 'close'}
+        tournament_names = {self._('Free voting'): None, self._('Full sort'): 'sort', self._('Top k'): 'top'}
    
         layout = [
             [
@@ -502,7 +804,20 @@ class ImageRanker:
             [sg.HorizontalSeparator()],
             [
                 sg.Text(self._('Keep winner for next vote:')),
-                sg.Button('', image_data=self.toggle_btn_off, key='-TOGGLE_KEEP_WINNER-', button_color=(sg.theme_background_color(), sg.theme_background_color()), border_width=0)
+                sg.Button('', image_data=self.toggle_btn_off, key='-TOGGLE_KEEP_WINNER-', button_color=(sg.theme_background_color(), sg.theme_background_color()), border_width=0),
+                sg.Text(self._('Pairing:')),
+                sg.Combo(list(pairing_names), default_value=next(name for name, key in pairing_names.items() if key == self.scheduler.strategy.name),
+                         key='-PAIRING-', enable_events=True, readonly=True),
+                sg.Checkbox(self._('Collapse near-duplicates'), default=self.collapse_duplicates,
+                            key='-COLLAPSE_DUPES-', enable_events=True)
+            ],
+            [
+                sg.Text(self._('Tournament:')),
+                sg.Combo(list(tournament_names), default_value=self._('Free voting'), key='-TOURNAMENT-',
+                         enable_events=True, readonly=True),
+                sg.Text('k'),
+                sg.Spin(list(range(1, 1001)), initial_value=20, key='-TOP_K-', size=(5, 1)),
+                sg.Text('', key='-TOURNAMENT_STATUS-', size=(50, 1))
             ],
             [sg.HorizontalSeparator()],
             [
@@ -512,6 +827,10 @@ class ImageRanker:
                 sg.Button(self._('Switch to View-Only mode'), key='-SWITCH_VIEW_ONLY-'),
                 sg.Button(self._('Exit App'), key='-EXIT-')
             ],
+            [
+                sg.Text('', key='-AI_STATUS-', size=(80, 1)),
+                sg.Button(self._('Cancel Gemini requests'), key='-AI_CANCEL-')
+            ],
             [sg.Text(self._('Current Ranking:'))],
             [
                 sg.Table(
@@ -519,10 +838,15 @@ class ImageRanker:
                     headings=ranking_header,
                     key='-RANK_TABLE-',
                     auto_size_columns=True,
-                    num_rows=10,
+                    num_rows=self.table_page_size,
                     expand_x=True,
                     expand_y=False
                 )
+            ],
+            [
+                sg.Button('<', key='-TABLE_PREV-'),
+                sg.Text('', key='-TABLE_PAGE-', size=(30, 1), justification='center'),
+                sg.Button('>', key='-TABLE_NEXT-')
             ]
         ]
 
@@ -538,46 +862,96 @@ class ImageRanker:
             window.close()
             return
         
-        img1_path = os.path.join(self.folder_path, self.current_left)
-        img2_path = os.path.join(self.folder_path, self.current_right)
-        img1_data = self.convert_to_bytes(img1_path)
-        img2_data = self.convert_to_bytes(img2_path)
-        window['-IMAGE1-'].update(data=img1_data)
-        window['-IMAGE2-'].update(data=img2_data)
+        saved = self.saved_tournament()
+        if saved is not None and sg.popup_yes_no(self._('Resume the unfinished tournament?')) == 'Yes':
+            self.start_tournament(saved.mode, saved.k)
+            window['-TOURNAMENT-'].update(value=next(name for name, mode in tournament_names.items() if mode == saved.mode))
+            self.show_tournament_pair(window)
+        else:
+            self.show_current_pair(window)
+            self.plan_next_images()
         window_keys = ('-IMAGE1-', '-IMAGE2-', '-TOGGLE_KEEP_WINNER-', '-EVAL_LEFT_PHOTO-', 
                        '-COMPARE_PHOTO-', '-EXPORT_CSV-', '-SWITCH_VIEW_ONLY-', '-EXIT-')
         self.set_clicky_cursors(window, window_keys)
 
-        window['-RANK_TABLE-'].update(values=self.get_ranking_table_data())
+        self.update_rank_table(window)
 
+        event_span = None
         while True:
-            event, values = window.read()
-
-            if event in (sg.WIN_CLOSED, '-EXIT-'):
+            tracer.end(event_span)
+            event, values = window.read(timeout=self.refresh_interval_ms)
+            event_span = tracer.begin('vote.event', event)
+
+            if event == sg.TIMEOUT_KEY:
+                self.start_folder_rescan(window)
+            elif event == '-RESCANNED-':
+                added, removed = self.apply_folder_scan(values['-RESCANNED-'])
+                if added or removed:
+                    self.replace_removed_images(window, set(removed))
+                    self.update_rank_table(window)
+            elif event in (sg.WIN_CLOSED, '-EXIT-'):
                 self.write_rankings_to_disk()
+                print(f"Vote pipeline: {self.pipeline_stats['hits']} hits, {self.pipeline_stats['misses']} misses")
                 break
+            elif event in ('-IMAGE1-', '-IMAGE2-') and self.tournament is not None:
+                if event == '-IMAGE1-':
+                    self.vote_in_tournament(window, self.current_left, self.current_right)
+                else:
+                    self.vote_in_tournament(window, self.current_right, self.current_left)
             elif event == '-IMAGE1-':
                 self.record_selection('left')
-                self.cycle_image(window, 'right', not keep_winner)
+                self.cycle_image(window, 'right', not self.keep_winner)
             elif event == '-IMAGE2-':
                 self.record_selection('right')
-                self.cycle_image(window, 'left', not keep_winner)
+                self.cycle_image(window, 'left', not self.keep_winner)
+            elif event in ('-TABLE_PREV-', '-TABLE_NEXT-'):
+                self.table_page += 1 if event == '-TABLE_NEXT-' else -1
+                self.update_rank_table(window)
             elif event == '-EXPORT_CSV-':
-                window['-RANK_TABLE-'].update(values=self.get_ranking_table_data())
+                self.update_rank_table(window)
                 self.generate_rank_csv(ranking_header, self.get_ranking_table_data())
             elif event == '-EVAL_LEFT_PHOTO-':
                 img1_path = os.path.join(self.folder_path, self.current_left)
-                self.get_image_eval(api_key, img1_path)
+                self.get_image_eval(api_key, img1_path, window)
             elif event == '-COMPARE_PHOTO-':
-                self.get_image_comparison(api_key, window, not keep_winner)
+                self.get_image_comparison(api_key, window, not self.keep_winner)
+            elif event == '-AI_DONE-':
+                self.handle_ai_result(window, values['-AI_DONE-'])
+            elif event == '-AI_CANCEL-':
+                self.cancel_ai_jobs(window)
             elif event == '-SWITCH_VIEW_ONLY-':
+                self.cancel_ai_jobs()
                 window.close()
                 self.get_view_mode_window()
                 break
+            elif event == '-PAIRING-':
+                self.scheduler.set_strategy(pairing_names[values['-PAIRING-']])
+                self.queued_images = []
+                self.plan_next_images()
+            elif event == '-TOURNAMENT-':
+                mode = tournament_names[values['-TOURNAMENT-']]
+                if mode is None:
+                    self.stop_tournament()
+                    self.update_tournament_status(window)
+                    if self.update_images():
+                        self.show_current_pair(window)
+                        self.queued_images = []
+                        self.plan_next_images()
+                else:
+                    self.start_tournament(mode, int(values['-TOP_K-']))
+                    self.show_tournament_pair(window)
+            elif event == '-COLLAPSE_DUPES-':
+                if values['-COLLAPSE_DUPES-']:
+                    self.find_folder_duplicates()  # only new or changed images are hashed
+                self.set_collapse_duplicates(values['-COLLAPSE_DUPES-'])
+                self.queued_images = []
+                self.plan_next_images()
             elif event == '-TOGGLE_KEEP_WINNER-':
-                keep_winner = not keep_winner
-                window['-TOGGLE_KEEP_WINNER-'].update(image_data=self.toggle_btn_on if keep_winner else self.toggle_btn_off)
+                self.keep_winner = not self.keep_winner
+                window['-TOGGLE_KEEP_WINNER-'].update(image_data=self.toggle_btn_on if self.keep_winner else self.toggle_btn_off)
+                self.plan_next_images()  # keeping the winner plans an opponent per side instead of a pair
                 
+        tracer.end(event_span)
         window.close()
 
 
@@ -594,15 +968,16 @@ class ImageRanker:
             [
                 
                 sg.Column([
-                        [sg.Button(image_data=resize_image(ballot_icon, (100, 100)), border_width=0, button_color=(sg.theme_background_color(), sg.theme_background_color()), key='-VOTE_MODE-')],
+                        [sg.Button(image_data=self.get_icon_bytes(ballot_icon), border_width=0, button_color=(sg.theme_background_color(), sg.theme_background_color()), key='-VOTE_MODE-')],
                         [sg.Text(self._('Vote Mode'), key='-VOTE_MODE_TEXT-')]
                 ], element_justification='center'),
                 sg.VSeparator(),
                 sg.Column([
-                        [sg.Button(image_data=resize_image(view_image_icon, (100, 100)), border_width=0, button_color=(sg.theme_background_color(), sg.theme_background_color()), key='-VIEW_ONLY_MODE-')],
+                        [sg.Button(image_data=self.get_icon_bytes(view_image_icon), border_width=0, button_color=(sg.theme_background_color(), sg.theme_background_color()), key='-VIEW_ONLY_MODE-')],
                         [sg.Text(self._('View Images'), key='-VIEW_IMAGES_TEXT-')]
                 ], element_justification='center'),
             ],
+            [sg.Button(self._('Prepare thumbnails'), key='-WARMUP-')],
             [
                 sg.Text(self._('Select Language:'), key='-SELECT_LANGUAGE_TEXT-'),
                 sg.Combo(self.available_languages, default_value='en', key='-LANG_SELECT-', enable_events=True)
@@ -624,19 +999,29 @@ class ImageRanker:
                 window.close()
                 self.get_view_mode_window()
                 break
+            elif event == '-WARMUP-':
+                self.warm_thumbnails()
             elif event == '-LANG_SELECT-':
                 self.set_language(values['-LANG_SELECT-'])
                 window['-CHOOSE_MODE_TEXT-'].update(self._('Choose a mode:'))
                 window['-VOTE_MODE_TEXT-'].update(self._('Vote Mode'))
                 window['-VIEW_IMAGES_TEXT-'].update(self._('View Images'))
                 window['-SELECT_LANGUAGE_TEXT-'].update(self._('Select Language:'))
+                window['-WARMUP-'].update(self._('Prepare thumbnails'))
 
         window.close()
+        self.prefetcher.shutdown()
+        if self.ai_jobs is not None:
+            self.ai_jobs.shutdown()
    
 
 def main():
+    trace_path = os.getenv('IMAGE_RANKER_TRACE')
+    if trace_path:
+        tracer.enable()
     app = ImageRanker()
     app.run()
+    tracer.report(trace_path)
 
 
 if __name__ == '__main__':   
@@ -0,0 +1,316 @@
+""" Serves one folder to several voters at once over a local HTTP API, built on the ranking engine
+
+    python3 server.py FOLDER [--host 0.0.0.0] [--port 8765]
+
+    GET  /                       voting page for a browser
+    GET  /pair                   {"pair_id", "left", "right"}, a pair not handed to another voter
+    GET  /thumbnail?image=NAME   display JPEG of an image of the folder
+    POST /vote                   {"winner", "loser", "pair_id"}
+    GET  /ranking?start=0&count=20
+    GET  /events                 server-sent events, one "vote" event per recorded vote
+"""
+
+import os
+import json
+import time
+import queue
+import argparse
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from utils.engine import RankingEngine
+from utils.scheduler import STRATEGIES
+from utils.imageutils import reencode_preview
+from utils.prefetch import DisplayCache
+from utils.tracing import tracer
+
+INDEX_HTML = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Image Ranker</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+#pair img { max-width: 48%; cursor: pointer; margin: 0 0.5%; }
+td { padding: 0 0.6em; }
+</style></head>
+<body>
+<div id="pair"><img id="left"><img id="right"></div>
+<p id="status"></p>
+<table id="ranking"></table>
+<script>
+let pair = null;
+async function nextPair() {
+  const response = await fetch('/pair');
+  if (!response.ok) { document.getElementById('status').textContent = 'No pair available'; return; }
+  pair = await response.json();
+  for (const side of ['left', 'right'])
+    document.getElementById(side).src = '/thumbnail?image=' + encodeURIComponent(pair[side]);
+}
+async function vote(side) {
+  if (!pair) return;
+  const winner = pair[side], loser = pair[side === 'left' ? 'right' : 'left'];
+  const body = JSON.stringify({winner: winner, loser: loser, pair_id: pair.pair_id});
+  pair = null;
+  await fetch('/vote', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: body});
+  nextPair();
+}
+let refresh = null;
+async function showRanking() {
+  refresh = null;
+  const rows = await (await fetch('/ranking?count=10')).json();
+  document.getElementById('ranking').innerHTML = rows.map(row =>
+    '<tr>' + row.map(cell => '<td>' + String(cell).replace(/</g, '&lt;') + '</td>').join('') + '</tr>').join('');
+}
+document.getElementById('left').onclick = () => vote('left');
+document.getElementById('right').onclick = () => vote('right');
+new EventSource('/events').addEventListener('vote', event => {
+  document.getElementById('status').textContent = JSON.parse(event.data).total_votes + ' votes';
+  if (!refresh) refresh = setTimeout(showRanking, 500);
+});
+nextPair();
+showRanking();
+</script></body></html>
+'''
+
+
+class RankingService:
+    """ The ranking engine shared by every connected voter
+
+        Pair choice and vote recording run under one lock, so the scheduler, ratings and
+        store see votes one at a time in the order they arrive. Images of pairs handed out
+        and not voted on yet are kept out of new pairs, so voters do not duplicate each
+        other's work. Thumbnails are rendered outside the lock, the thumbnail cache is
+        thread safe, and their JPEG copies for the browsers are kept in memory. Each recorded vote is pushed to the event subscribers.
+
+        Parameters
+        engine : RankingEngine
+           the engine with the folder open
+        pair_timeout : float
+           seconds after which an unanswered pair is handed out again
+    """
+    def __init__(self, engine, pair_timeout=120.0):
+        self.engine = engine
+        self.pair_timeout = pair_timeout
+        self.lock = threading.Lock()
+        self.outstanding = {}  # pair id -> (left, right, time handed out), oldest first
+        self.pair_ids = itertools.count(1)
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+        self.total_votes = len(engine.rating_engine.comparisons)
+        self.jpeg_cache = DisplayCache(64 * 1024 * 1024)
+
+    def next_pair(self):
+        """ {'pair_id', 'left', 'right'}, None if the folder has fewer than two images
+        """
+        with self.lock:
+            expired = time.monotonic() - self.pair_timeout
+            for pair_id in [pair_id for pair_id, (_, _, issued) in self.outstanding.items() if issued < expired]:
+                del self.outstanding[pair_id]
+            busy = {image for left, right, _ in self.outstanding.values() for image in (left, right)}
+            pair = self.engine.scheduler.next_pair(busy)
+            if pair is None:
+                pair = self.engine.scheduler.next_pair()  # every image is out with a voter, share one
+            if pair is None:
+                return None
+            pair_id = next(self.pair_ids)
+            self.outstanding[pair_id] = (pair[0], pair[1], time.monotonic())
+        return {'pair_id': pair_id, 'left': pair[0], 'right': pair[1]}
+
+    def vote(self, winner, loser, pair_id=None):
+        """ records a vote and notifies the subscribers. Raises ValueError for unknown images
+        """
+        rankings = self.engine.rankings
+        if winner not in rankings or loser not in rankings or winner == loser:
+            raise ValueError('winner and loser must be two different images of the folder')
+        with self.lock:
+            self.outstanding.pop(pair_id, None)
+            self.engine.record_vote(winner, loser)
+            self.total_votes += 1
+            ratings = self.engine.rating_engine.ratings
+            event = {
+                'winner': winner, 'loser': loser, 'total_votes': self.total_votes,
+                'ratings': {winner: round(ratings[winner]), loser: round(ratings[loser])},
+                'ranks': {winner: self.engine.rank_order.rank(winner) + 1, loser: self.engine.rank_order.rank(loser) + 1},
+            }
+        self.publish(event)
+        return event
+
+    def ranking(self, start, count):
+        with self.lock:
+            return self.engine.get_ranking_table_data(start, count)
+
+    def thumbnail(self, image, maxsize=(720, 480)):
+        """ display JPEG of image, None if it is not an image of the folder
+        """
+        if image not in self.engine.rankings:
+            return None  # only names from the folder, never a path from the request
+        data = self.jpeg_cache.get((image, maxsize))
+        if data is None:
+            # the shared thumbnail cache holds PPM for Tk, browsers need a compressed format
+            data = reencode_preview(self.engine.render_display_bytes(os.path.join(self.engine.folder_path, image), maxsize))
+            self.jpeg_cache.put((image, maxsize), data)
+        return data
+
+    def subscribe(self):
+        events = queue.Queue(maxsize=256)
+        with self.subscribers_lock:
+            self.subscribers.add(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.subscribers_lock:
+            self.subscribers.discard(events)
+
+    def publish(self, event):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                pass  # a client that stopped reading misses events rather than holding up the votes
+
+
+class RankingRequestHandler(BaseHTTPRequestHandler):
+    """ routes the API requests to the RankingService of the server
+    """
+    protocol_version = 'HTTP/1.1'  # keep-alive, voters reuse their connection
+    disable_nagle_algorithm = True  # headers and body go out in separate writes, don't hold the body back
+    heartbeat_seconds = 15
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_bytes(body, 'application/json', status)
+
+    def send_bytes(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        span = tracer.begin('http', 'GET ' + url.path)
+        try:
+            if url.path == '/':
+                self.send_bytes(INDEX_HTML.encode('utf-8'), 'text/html; charset=utf-8')
+            elif url.path == '/pair':
+                pair = self.server.service.next_pair()
+                if pair is None:
+                    self.send_json({'error': 'fewer than two images'}, 404)
+                else:
+                    self.send_json(pair)
+            elif url.path == '/thumbnail':
+                try:
+                    data = self.server.service.thumbnail(query.get('image', [''])[0])
+                except Exception as e:
+                    self.send_json({'error': f'Error loading image: {e}'}, 500)
+                    return
+                if data is None:
+                    self.send_json({'error': 'unknown image'}, 404)
+                else:
+                    self.send_bytes(data, 'image/jpeg')
+            elif url.path == '/ranking':
+                start = int(query.get('start', ['0'])[0])
+                count = int(query.get('count', ['20'])[0])
+                self.send_json(self.server.service.ranking(max(start, 0), max(min(count, 1000), 0)))
+            elif url.path == '/events':
+                self.stream_events()
+            else:
+                self.send_json({'error': 'not found'}, 404)
+        except ValueError:
+            self.send_json({'error': 'bad request'}, 400)
+        finally:
+            tracer.end(span)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        span = tracer.begin('http', 'POST ' + url.path)
+        try:
+            if url.path != '/vote':
+                self.send_json({'error': 'not found'}, 404)
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                vote = json.loads(self.rfile.read(length))
+                event = self.server.service.vote(vote['winner'], vote['loser'], vote.get('pair_id'))
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json({'error': str(e)}, 400)
+                return
+            self.send_json(event)
+        finally:
+            tracer.end(span)
+
+    def stream_events(self):
+        """ server-sent events until the client goes away, with a comment line as heartbeat
+        """
+        events = self.server.service.subscribe()
+        self.close_connection = True  # the stream has no length, it ends with the connection
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            while True:
+                try:
+                    event = events.get(timeout=self.heartbeat_seconds)
+                    self.wfile.write(f'event: vote\ndata: {json.dumps(event)}\n\n'.encode('utf-8'))
+                except queue.Empty:
+                    self.wfile.write(b': heartbeat\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.service.unsubscribe(events)
+
+
+class RankingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, RankingRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder')
+    parser.add_argument('--host', default='127.0.0.1', help='0.0.0.0 to let other machines vote')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-dir', default='./local_cache/', help='where rankings and caches are kept')
+    parser.add_argument('--store', choices=('sqlite', 'json'), default=None, help='ranking storage backend')
+    parser.add_argument('--recursive', action='store_true', default=None, help='include images in sub folders')
+    parser.add_argument('--pairing', choices=sorted(STRATEGIES), default=None, help='pairing strategy, as in cli.py tournament')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    parser.add_argument('--trace', help='print span percentiles and write a Chrome trace to this file')
+    args = parser.parse_args()
+
+    if args.trace:
+        tracer.enable()
+    engine = RankingEngine(args.cache_dir, args.store, args.recursive)
+    if not engine.open_folder(args.folder, index_metadata=False):
+        print('At least two images are needed')
+        return
+    if args.pairing:
+        engine.scheduler.set_strategy(args.pairing)
+    server = RankingServer((args.host, args.port), RankingService(engine), args.verbose)
+    print(f'Serving {len(engine.image_files)} images of {args.folder} on http://{args.host}:{server.server_port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with server.service.lock:
+            engine.write_rankings_to_disk()
+        tracer.report(args.trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+""" Simulates voting sessions against synthetic ground-truth orderings to compare
+    how many comparisons each pairing strategy needs to reach a target rank correlation
+"""
+
+import argparse
+import random
+import numpy as np
+from utils.rating import RatingEngine
+from utils.scheduler import PairScheduler, STRATEGIES
+
+
+def kendall_tau(true_scores, estimated_scores):
+    """ Kendall rank correlation, vectorized over all pairs (fine for a few thousand images)
+    """
+    true_sign = np.sign(true_scores[:, None] - true_scores[None, :])
+    estimated_sign = np.sign(estimated_scores[:, None] - estimated_scores[None, :])
+    upper = np.triu_indices(len(true_scores), k=1)
+    return float(np.mean(true_sign[upper] * estimated_sign[upper]))
+
+
+def simulate(strategy, num_images, target_tau, max_comparisons, noise, seed, check_every):
+    """ runs one simulated session, returns the number of comparisons needed to reach
+        target_tau, or None if max_comparisons was reached first
+
+        Parameters
+        strategy : str
+           one of the names in STRATEGIES
+        num_images : int
+           size of the synthetic folder
+        target_tau : float
+           Kendall correlation between the Elo order and the ground truth that ends the session
+        max_comparisons : int
+           give up after this many votes
+        noise : float
+           scale of the logistic vote noise, 0 makes the voter always pick the better image
+        seed : int
+           seed for the ground truth, the voter and the scheduler
+    """
+    rng = random.Random(seed)
+    true_scores = np.array([rng.gauss(0, 1) for _ in range(num_images)])
+    images = [f'img_{i:05d}.jpg' for i in range(num_images)]
+    index = {img: i for i, img in enumerate(images)}
+
+    engine = RatingEngine()
+    engine.reset(images)
+    scheduler = PairScheduler(engine, strategy, rng=random.Random(seed + 1))
+    scheduler.reset(images)
+
+    for comparison in range(1, max_comparisons + 1):
+        left, right = scheduler.next_pair()
+        difference = true_scores[index[left]] - true_scores[index[right]]
+        p_left = 1 / (1 + np.exp(-difference / noise)) if noise > 0 else float(difference > 0)
+        winner, loser = (left, right) if rng.random() < p_left else (right, left)
+        engine.record(winner, loser)
+        scheduler.record(winner, loser)
+
+        if comparison % check_every == 0:
+            estimated = np.array([engine.ratings[img] for img in images])
+            if kendall_tau(true_scores, estimated) >= target_tau:
+                return comparison
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=200, help='images in each synthetic folder')
+    parser.add_argument('--target', type=float, default=0.8, help='Kendall tau to reach')
+    parser.add_argument('--max-comparisons', type=int, default=20000)
+    parser.add_argument('--noise', type=float, default=0.3, help='logistic noise of the simulated voter')
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    args = parser.parse_args()
+
+    check_every = max(1, args.images // 10)
+    print(f'{args.images} images, target tau {args.target}, noise {args.noise}, {args.trials} trials')
+    for strategy in args.strategies:
+        results = [simulate(strategy, args.images, args.target, args.max_comparisons, args.noise, seed, check_every)
+                   for seed in range(args.trials)]
+        reached = [r for r in results if r is not None]
+        mean = f'{np.mean(reached):.0f}' if reached else '-'
+        print(f'{strategy:<12} comparisons needed: mean {mean}, reached target in {len(reached)}/{len(results)} trials')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+from array import array
+
+EMPTY = -1
+FIBONACCI = 0x9E3779B97F4A7C15  # 2**64 / golden ratio, spreads packed pair keys over the table
+MASK64 = (1 << 64) - 1
+
+
+class ImageCatalog:
+    """ Interns file names to dense integer ids, 0, 1, 2... in the order they are added, and
+        keeps the per image counters in typed arrays indexed by id
+
+        The name index is an open addressing table of int32 ids probed with the hash Python
+        caches on every str, kept at most half full, so a name costs 8 bytes of index plus
+        4 + 4 + 8 bytes of wins, losses and rating, against about 100 bytes for an entry in
+        each dict keyed by name. Ids are never reused, an image removed from the folder
+        keeps its id and counters in case it comes back.
+
+        Parameters
+        initial_rating : float
+           rating of an image added without one
+    """
+    def __init__(self, initial_rating=1500.0):
+        self.initial_rating = initial_rating
+        self.names = []  # id -> file name, the str objects are shared with the file list
+        self.wins = array('I')
+        self.losses = array('I')
+        self.ratings = array('d')
+        self._table = array('i', [EMPTY]) * 16
+        self._mask = 15
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self.id_of(name) is not None
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def id_of(self, name):
+        """ the id of name, None if it was never added
+        """
+        table, names, mask = self._table, self.names, self._mask
+        slot = hash(name) & mask
+        while True:
+            image_id = table[slot]
+            if image_id == EMPTY:
+                return None
+            if names[image_id] == name:
+                return image_id
+            slot = (slot + 1) & mask
+
+    def intern(self, name, rating=None):
+        """ the id of name, adding it with rating and no games if it is new
+
+            Parameters
+            name : str
+               file name of the image
+            rating : float
+               starting rating of a new image, initial_rating by default
+        """
+        table, names, mask = self._table, self.names, self._mask
+        slot = hash(name) & mask
+        while True:
+            image_id = table[slot]
+            if image_id == EMPTY:
+                break
+            if names[image_id] == name:
+                return image_id
+            slot = (slot + 1) & mask
+        image_id = len(names)
+        names.append(name)
+        self.wins.append(0)
+        self.losses.append(0)
+        self.ratings.append(self.initial_rating if rating is None else rating)
+        table[slot] = image_id
+        if 2 * len(names) > len(table):
+            self._grow()
+        return image_id
+
+    def _grow(self):
+        size = len(self._table) * 2
+        table = array('i', [EMPTY]) * size
+        mask = size - 1
+        for image_id, name in enumerate(self.names):
+            slot = hash(name) & mask
+            while table[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            table[slot] = image_id
+        self._table, self._mask = table, mask
+
+    def reserve(self, count):
+        """ sizes the index for count names, so adding them does not rehash along the way
+        """
+        size = len(self._table)
+        while size < 2 * count:
+            size *= 2
+        if size > len(self._table):
+            self._table = array('i', [EMPTY]) * (size // 2)
+            self._grow()
+
+    def games(self, image_id):
+        return self.wins[image_id] + self.losses[image_id]
+
+    def nbytes(self):
+        """ memory held by the index and counter arrays, the names themselves excluded
+        """
+        arrays = (self._table, self.wins, self.losses, self.ratings)
+        return sum(len(column) * column.itemsize for column in arrays) + 8 * len(self.names)
+
+
+class RatingColumn:
+    """ The ratings of a catalog by file name, for code that reads them like a dict
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, name):
+        image_id = self.catalog.id_of(name)
+        if image_id is None:
+            raise KeyError(name)
+        return self.catalog.ratings[image_id]
+
+    def __setitem__(self, name, rating):
+        self.catalog.ratings[self.catalog.intern(name)] = rating
+
+    def get(self, name, default=None):
+        image_id = self.catalog.id_of(name)
+        return default if image_id is None else self.catalog.ratings[image_id]
+
+    def __contains__(self, name):
+        return self.catalog.id_of(name) is not None
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __iter__(self):
+        return iter(self.catalog.names)
+
+    def items(self):
+        return zip(self.catalog.names, self.catalog.ratings)
+
+
+class ComparisonLog:
+    """ (winner, loser) outcomes in the order they were recorded, held as two int32 id
+        arrays, 8 bytes per comparison. Iterating yields file names like a list of tuples
+
+        Parameters
+        catalog : ImageCatalog
+           resolves the ids back to file names
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.winners = array('i')
+        self.losers = array('i')
+
+    def append(self, winner_id, loser_id):
+        self.winners.append(winner_id)
+        self.losers.append(loser_id)
+
+    def __len__(self):
+        return len(self.winners)
+
+    def __iter__(self):
+        names = self.catalog.names
+        for winner_id, loser_id in zip(self.winners, self.losers):
+            yield names[winner_id], names[loser_id]
+
+    def ids(self):
+        """ (winner id, loser id) pairs
+        """
+        return zip(self.winners, self.losers)
+
+
+class PairHistory:
+    """ The set of image pairs compared so far, by catalog id, with O(1) membership
+
+        Each unordered pair is packed in one 64 bit key, smaller id in the high half, and
+        stored in an open addressing table of uint64 at most two thirds full, with 0 marking
+        a free slot. A pair costs 12 to 24 bytes, where a tuple of two names in a set costs
+        about 130. A dense bit matrix would answer as fast, but needs n * n / 2 bits, 62 GB
+        for a million images, while sessions compare only a tiny share of the pairs.
+
+        Parameters
+        capacity : int
+           pairs expected, the table grows past it as needed
+    """
+    def __init__(self, capacity=0):
+        bits = 4
+        while (1 << bits) * 2 < capacity * 3:
+            bits += 1
+        self._bits = bits
+        self._keys = array('Q', [0]) * (1 << bits)
+        self._count = 0
+
+    @staticmethod
+    def pack(id_a, id_b):
+        if id_a > id_b:
+            id_a, id_b = id_b, id_a
+        return (id_a << 32 | id_b) + 1  # + 1 keeps 0 free as the empty marker
+
+    def _slot(self, key):
+        return ((key * FIBONACCI) & MASK64) >> (64 - self._bits)
+
+    def __len__(self):
+        return self._count
+
+    def contains(self, id_a, id_b):
+        """ True if the pair was added, in either order
+        """
+        key = self.pack(id_a, id_b)
+        keys, mask = self._keys, len(self._keys) - 1
+        slot = self._slot(key)
+        while True:
+            stored = keys[slot]
+            if stored == key:
+                return True
+            if stored == 0:
+                return False
+            slot = (slot + 1) & mask
+
+    def add(self, id_a, id_b):
+        """ records the pair, returns False if it was already there
+        """
+        key = self.pack(id_a, id_b)
+        keys, mask = self._keys, len(self._keys) - 1
+        slot = self._slot(key)
+        while True:
+            stored = keys[slot]
+            if stored == key:
+                return False
+            if stored == 0:
+                break
+            slot = (slot + 1) & mask
+        keys[slot] = key
+        self._count += 1
+        if 3 * self._count > 2 * len(keys):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old_keys = self._keys
+        self._bits += 1
+        keys = self._keys = array('Q', [0]) * (1 << self._bits)
+        mask = len(keys) - 1
+        for key in old_keys:
+            if key:
+                slot = self._slot(key)
+                while keys[slot]:
+                    slot = (slot + 1) & mask
+                keys[slot] = key
+
+    def nbytes(self):
+        return len(self._keys) * self._keys.itemsize
@@ -0,0 +1,195 @@
+import os
+from PIL import Image
+from utils.metadata import MetadataIndex
+
+
+def dhash(image_path, hash_size=8):
+    """ 64 bit difference hash: the image is reduced to a (hash_size + 1) x hash_size grayscale
+        grid and each bit records whether a cell is brighter than its right neighbour.
+        Frames of a burst differ in a few bits, unrelated images in about half of them
+
+        Parameters
+        image_path : str
+           path of the image to hash
+        hash_size : int
+           rows of the grid, the hash has hash_size * hash_size bits
+    """
+    with Image.open(image_path) as img:
+        img.draft('L', (hash_size * 8, hash_size * 8))  # JPEGs decode at a reduced scale
+        grid = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+        pixels = list(grid.getdata())
+    value = 0
+    for row in range(hash_size):
+        line = pixels[row * (hash_size + 1):(row + 1) * (hash_size + 1)]
+        for left, right in zip(line, line[1:]):
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _hash_entry(folder, name):
+    """ process pool worker, returns (name, size, mtime_ns, {'dhash': int})
+    """
+    path = os.path.join(folder, name)
+    try:
+        stat = os.stat(path)
+        return name, stat.st_size, stat.st_mtime_ns, {'dhash': dhash(path)}
+    except Exception:
+        return name, None, None, {}
+
+
+class HashIndex(MetadataIndex):
+    """ dHash of every image of a folder, kept in the local cache like the EXIF index and
+        computed only for new or changed files
+
+        Parameters
+        folder : str
+           the folder being hashed
+        cache_dir : str
+           where the hashes are saved, one file per folder
+    """
+    read_entry = staticmethod(_hash_entry)
+
+    def hash_of(self, name):
+        """ the dHash of name, computed on the spot if it is not indexed yet, None if unreadable
+        """
+        return self.get(name).get('dhash')
+
+
+class DuplicateGroups:
+    """ Groups of near-duplicate images, found by Hamming distance between 64 bit dHashes
+
+        The hashes are packed in a uint64 array. Candidate pairs come from splitting the 64
+        bits into threshold + 1 bands: two hashes within threshold bits of each other agree
+        on at least one whole band, so only images sharing a band value are compared, and
+        those comparisons are vectorized XOR and popcount over the packed array. Groups are
+        kept in a union-find, so adding an image joins its group without regrouping the folder.
+
+        Parameters
+        threshold : int
+           largest number of differing bits for two images to count as near-duplicates
+    """
+    def __init__(self, threshold=5):
+        import numpy as np  # kept out of the startup imports
+        self.np = np
+        self.threshold = threshold
+        bands = threshold + 1
+        edges = [64 * band // bands for band in range(bands + 1)]
+        self.bands = [(edges[band], edges[band + 1] - edges[band]) for band in range(bands)]  # (shift, width)
+        self.names = []
+        self.position = {}
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.count = 0
+        self.buckets = [{} for _ in self.bands]  # band value -> positions sharing it
+        self.parent = []
+        self.size = []  # images in the group, valid at group roots
+
+    def _band_values(self, hashes, shift, width):
+        return (hashes >> self.np.uint64(shift)) & self.np.uint64((1 << width) - 1)
+
+    def _find(self, position):
+        parent = self.parent
+        root = position
+        while parent[root] != root:
+            root = parent[root]
+        while parent[position] != root:
+            parent[position], position = root, parent[position]
+        return root
+
+    def _union(self, a, b):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a != root_b:
+            root, child = min(root_a, root_b), max(root_a, root_b)
+            self.parent[child] = root
+            self.size[root] += self.size[child]
+
+    def build(self, hashes):
+        """ groups every image at once
+
+            Parameters
+            hashes : dict
+               file name -> dHash
+        """
+        np = self.np
+        self.names = list(hashes)
+        self.position = {name: i for i, name in enumerate(self.names)}
+        self.hashes = np.fromiter((hashes[name] for name in self.names), dtype=np.uint64, count=len(self.names))
+        self.count = len(self.names)
+        self.parent = list(range(self.count))
+        self.size = [1] * self.count
+        self.buckets = [{} for _ in self.bands]
+        for band, (shift, width) in enumerate(self.bands):
+            values = self._band_values(self.hashes, shift, width)
+            order = np.argsort(values, kind='stable')
+            sorted_values = values[order]
+            starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+            ends = np.r_[starts[1:], len(order)]
+            buckets = self.buckets[band]
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                members = order[start:end]
+                buckets[int(sorted_values[start])] = members.tolist()
+                if end - start > 1:
+                    self._join_close(members)
+
+    def _join_close(self, members):
+        """ unions every pair within members that is within the threshold
+        """
+        np = self.np
+        if len(members) > 1024:
+            # a crowded band value, one row at a time keeps the pair arrays small
+            for i in range(len(members) - 1):
+                distances = np.bitwise_count(self.hashes[members[i + 1:]] ^ self.hashes[members[i]])
+                for other in members[i + 1:][distances <= self.threshold].tolist():
+                    self._union(int(members[i]), other)
+            return
+        first, second = np.triu_indices(len(members), k=1)
+        close = np.bitwise_count(self.hashes[members[first]] ^ self.hashes[members[second]]) <= self.threshold
+        for a, b in zip(members[first[close]].tolist(), members[second[close]].tolist()):
+            self._union(a, b)
+
+    def add(self, name, value):
+        """ adds one image, joining it to the group of any near-duplicate already present
+        """
+        np = self.np
+        if name in self.position:
+            return
+        position = self.count
+        if position == len(self.hashes):
+            grown = np.zeros(max(16, 2 * len(self.hashes)), dtype=np.uint64)
+            grown[:position] = self.hashes[:position]
+            self.hashes = grown
+        self.hashes[position] = value
+        self.names.append(name)
+        self.position[name] = position
+        self.parent.append(position)
+        self.size.append(1)
+        self.count += 1
+        candidates = set()
+        for band, (shift, width) in enumerate(self.bands):
+            bucket = self.buckets[band].setdefault((value >> shift) & ((1 << width) - 1), [])
+            candidates.update(bucket)
+            bucket.append(position)
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            distances = np.bitwise_count(self.hashes[candidates] ^ np.uint64(value))
+            for other in candidates[distances <= self.threshold].tolist():
+                self._union(position, other)
+
+    def group_of(self, name):
+        """ id of the group of name, shared by all of its near-duplicates, None if unknown
+        """
+        position = self.position.get(name)
+        return None if position is None else self._find(position)
+
+    def group_size(self, name):
+        """ number of images in the group of name, 1 if it has no near-duplicates
+        """
+        position = self.position.get(name)
+        return 0 if position is None else self.size[self._find(position)]
+
+    def groups(self):
+        """ the groups with more than one image, as lists of file names
+        """
+        members = {}
+        for position, name in enumerate(self.names):
+            members.setdefault(self._find(position), []).append(name)
+        return [names for names in members.values() if len(names) > 1]
@@ -0,0 +1,707 @@
+import os
+import csv
+import json
+import shutil
+import gettext
+from utils.imageutils import get_exif_data, render_preview
+from utils.rating import RatingEngine
+from utils.scheduler import PairScheduler
+from utils.rankorder import RankOrder
+from utils.journal import VoteJournal
+from utils.store import SqliteRankingStore
+from utils.scanner import FolderScanner
+from utils.metadata import MetadataIndex, DISPLAY_FIELDS
+from utils.quality import QualityIndex
+from utils.dedupe import HashIndex, DuplicateGroups
+from utils.tournament import Tournament, TournamentStore
+from utils.thumbcache import ThumbnailCache
+from utils.warmup import ThumbnailWarmer
+from utils.tracing import traced
+from utils.gemini import GeminiBackend, FakeBackend, GeminiClient, ResponseCache, PayloadPreparer
+
+COMPARISON_PROMPT = '''Compare these two images and indicate which picture is technically superior. 
+                                    Start your response with 1 or 2 to indicate which image is the answer before giving details. 
+                                    If they are equivalent, randomly select 1 or 2.'''
+THUMBNAIL_CACHE_MB = 1024  # smallest thumbnail cache budget, unless IMAGE_RANKER_THUMBNAIL_MB is set
+THUMBNAIL_BYTES = 720 * 480 * 3  # a display thumbnail is its raw RGB pixels, see PREVIEW_FORMAT
+
+
+class RankingEngine:
+    """ Everything about a ranking session that does not need a window: scanning the folder,
+        choosing pairs, recording votes, persistence, Gemini requests and export.
+        The GUI and the command line are both built on top of it
+
+        Parameters
+        cache_dir : str
+           where rankings, manifests, metadata and Gemini responses are kept
+        store_backend : str
+           'sqlite' or 'json', see open_store
+        recursive : boolean
+           include images in sub folders
+    """
+    def __init__(self, cache_dir='./local_cache/', store_backend=None, recursive=None):
+        self.image_files = []
+        self.folder_path = None
+        self.rankings = {}
+        self.rating_engine = RatingEngine()
+        self.scheduler = PairScheduler(self.rating_engine)
+        self.rank_order = RankOrder()
+        # a page of the table may show confidence intervals this far behind the votes: 25 votes,
+        # or 1% of the history once that is more, so refitting stays a small share of the votes
+        self.ci_refresh_votes = 25
+        self.ci_refresh_fraction = 0.01
+        self.current_left = None
+        self.current_right = None
+        self.cache_dir = cache_dir
+        self.cache_file = 'rankings.data'
+        self.scanner = None
+        self.metadata_index = None
+        self.quality_index = None
+        self.hash_index = None
+        self.duplicate_groups = None
+        self.duplicate_threshold = 5  # differing dHash bits still counted as the same shot
+        self.collapse_duplicates = False
+        self.collapsed = set()  # near-duplicates left out of the pairing while collapsed
+        self.tournament = None  # the structured tournament being voted on, None for free voting
+        self.tournament_store = None
+        self.thumbnail_cache = ThumbnailCache(os.path.join(cache_dir, 'thumbnails'), max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024)
+        self.size_thumbnail_cache()
+        self.gemini_client = None
+        self._dotenv_loaded = False
+        self.comparison_prompt = COMPARISON_PROMPT
+        if recursive is None:
+            recursive = os.getenv('IMAGE_RANKER_RECURSIVE', '') == '1'
+        self.recursive_scan = recursive
+        self.store = self.open_store(store_backend or os.getenv('IMAGE_RANKER_STORE', 'sqlite'))
+
+        self.available_languages = ['en', 'pt-BR']
+        self.set_language()
+
+    def open_store(self, backend):
+        """ opens the ranking storage backend, 'sqlite' (default) or 'json' for the
+            rankings.data snapshot with its vote journal. The SQLite store imports
+            the JSON files the first time it is created
+
+            Parameters
+            backend : str
+               'sqlite' or 'json'
+        """
+        journal = VoteJournal(self.cache_dir, self.cache_file)
+        if backend == 'json':
+            return journal
+        return SqliteRankingStore(os.path.join(self.cache_dir, 'rankings.sqlite'), legacy_store=journal)
+
+    def set_language(self, language='en'):
+        domain='main'
+        localedir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'locale')
+
+        # Load the translation
+        try:
+            # Use find to locate the .mo file based on the system's locale settings
+            # or the specified languages
+            translation = gettext.translation(domain, localedir, languages=[language], fallback=True)
+            self._ = translation.gettext # Assign the translation function to '_'
+        except FileNotFoundError:
+            # Fallback if no translation is found for the specified language
+            self._ = gettext.gettext # Use the default gettext if no translation is available
+
+    def latest_folder(self):
+        return self.store.latest_folder()
+
+    def open_folder(self, folder, remember=True, index_metadata=True):
+        """ opens a folder of images and restores its votes and ratings from the store.
+            Returns True if there are at least two images to compare
+
+            Parameters
+            folder : str
+               the folder to open
+            remember : boolean
+               store it as the folder to suggest next time
+            index_metadata : boolean
+               build the EXIF index in the background, only needed for display and sorting
+        """
+        self.folder_path = folder
+        if remember:
+            self.store.record_folder(self.folder_path)
+        # images scored locally before start from a rating that reflects their score, see load_images
+        self.quality_index = QualityIndex(self.folder_path, os.path.join(self.cache_dir, 'quality'))
+        self.hash_index = HashIndex(self.folder_path, os.path.join(self.cache_dir, 'hashes'))
+        self.duplicate_groups = None
+        self.collapsed = set()
+        self.scheduler.set_duplicate_groups(None)
+        self.tournament = None
+        self.tournament_store = TournamentStore(self.folder_path, os.path.join(self.cache_dir, 'tournaments'))
+        self.load_images()
+        self.size_thumbnail_cache()
+
+        # update any loaded image data with the ranking data from previous runs
+        # can't just overwrite it since the files in the folder may have changed
+        folder_data = self.read_rankings_from_disk(self.folder_path)
+        rankings = self.rankings
+        rankings.update((name, votes) for name, votes in folder_data['rankings'].items() if name in rankings)
+        # caches written before ratings existed have no comparisons, their vote counts still load
+        self.rating_engine.replay(folder_data['comparisons'])
+        self.scheduler.reset(self.image_files)
+        self.sync_rank_order()
+
+        if index_metadata:
+            self.metadata_index = MetadataIndex(self.folder_path, os.path.join(self.cache_dir, 'metadata'))
+            self.metadata_index.build_async(self.image_files)
+
+        return len(self.image_files) >= 2
+
+    def size_thumbnail_cache(self):
+        """ sets the thumbnail cache budget: IMAGE_RANKER_THUMBNAIL_MB if set, otherwise enough
+            for every thumbnail of the open folder and at least THUMBNAIL_CACHE_MB, but never more
+            than half the free disk space
+        """
+        limit_mb = os.getenv('IMAGE_RANKER_THUMBNAIL_MB')
+        if limit_mb:
+            self.thumbnail_cache.max_bytes = int(limit_mb) * 1024 * 1024
+            return
+        budget = max(THUMBNAIL_CACHE_MB * 1024 * 1024, len(self.image_files) * THUMBNAIL_BYTES)
+        try:
+            budget = min(budget, shutil.disk_usage(self.cache_dir).free // 2)  # the cap wins over the floor
+        except OSError:
+            pass  # the cache folder is created with the first entry
+        self.thumbnail_cache.max_bytes = budget
+
+    def get_thumbnail_warmer(self, maxsize=(720, 480), workers=None):
+        """ a ThumbnailWarmer rendering the display thumbnails of every image in the folder
+
+            Parameters
+            maxsize : tuple of int
+               the (width, height) the thumbnails are rendered for, the display size by default
+            workers : int
+               process count, all CPUs by default
+        """
+        file_paths = [os.path.join(self.folder_path, name) for name in self.image_files]
+        return ThumbnailWarmer(self.thumbnail_cache, file_paths, maxsize, workers)
+
+    def score_quality(self, workers=None):
+        """ measures sharpness and exposure of every new or changed image on a process pool,
+            yielding each file name as it is scored. When it finishes, or is closed early,
+            the scores are saved and the ratings are seeded from them
+
+            Parameters
+            workers : int
+               process count, all CPUs by default
+        """
+        try:
+            yield from self.quality_index.update(self.image_files, workers)
+        finally:
+            self.quality_index.save()
+            self.seed_ratings_from_quality()
+
+    def seed_ratings_from_quality(self):
+        """ restarts the ratings from the local quality scores and replays every vote on top
+        """
+        comparisons = list(self.rating_engine.comparisons)
+        self.rating_engine.set_priors(self.quality_index.rating_priors(self.image_files))
+        self.rating_engine.reset(self.image_files)
+        self.rating_engine.replay(comparisons)
+        # the reset catalog gave the images new ids, the scheduler's pair history must follow
+        self.scheduler.reset(self.image_files)
+        self.set_collapse_duplicates(self.collapse_duplicates)  # the best of each group may have changed
+        self.sync_rank_order()
+
+    def find_duplicates(self, workers=None):
+        """ hashes every new or changed image on a process pool, yielding each file name as
+            it is hashed, then groups the near-duplicates. Closing early groups what was hashed
+
+            Parameters
+            workers : int
+               process count, all CPUs by default
+        """
+        try:
+            yield from self.hash_index.update(self.image_files, workers)
+        finally:
+            self.hash_index.save()
+            self.group_duplicates()
+
+    def load_duplicate_groups(self):
+        """ groups near-duplicates from the hashes cached by an earlier find_duplicates, if any.
+            Returns True if the folder has groups
+        """
+        if self.duplicate_groups is None and self.hash_index is not None and self.hash_index.entries:
+            self.group_duplicates()
+        return self.duplicate_groups is not None
+
+    def group_duplicates(self):
+        """ groups the hashed images of the folder and lets the scheduler avoid pairing near-duplicates
+        """
+        hashes = {}
+        for name in self.image_files:
+            entry = self.hash_index.entries.get(name)
+            if entry is not None and 'dhash' in entry['fields']:
+                hashes[name] = entry['fields']['dhash']
+        groups = DuplicateGroups(self.duplicate_threshold)
+        groups.build(hashes)
+        self.duplicate_groups = groups
+        self.scheduler.set_duplicate_groups(groups)
+        self.set_collapse_duplicates(self.collapse_duplicates)
+
+    def best_of(self, names):
+        """ the representative of a group of near-duplicates: the best local quality score,
+            then the highest rating
+        """
+        scores = self.quality_index.scores(names) if self.quality_index is not None else {}
+        ratings = self.rating_engine.ratings
+        return max(names, key=lambda name: (scores.get(name, float('-inf')), ratings.get(name, 0), name))
+
+    def set_collapse_duplicates(self, collapse):
+        """ with collapse on, only the best image of each group of near-duplicates is offered
+            for voting. Votes and rankings of the others are kept
+
+            Parameters
+            collapse : boolean
+               offer only one image per group
+        """
+        for name in self.collapsed:
+            if name in self.rankings:  # files deleted meanwhile stay out
+                self.scheduler.add_image(name)
+        self.collapsed = set()
+        self.collapse_duplicates = collapse
+        if not collapse or self.duplicate_groups is None:
+            return
+        for names in self.duplicate_groups.groups():
+            best = self.best_of(names)
+            for name in names:
+                if name != best:
+                    self.scheduler.remove_image(name)
+                    self.collapsed.add(name)
+
+    def get_quality_details(self, image_path):
+        """ one line summary of the local quality scores of an image, None if it was not scored
+        """
+        if self.quality_index is None:
+            return None
+        scores = self.quality_index.get(os.path.relpath(image_path, self.folder_path))
+        if not scores:
+            return None
+        return self._('Score {score:.2f}   sharpness {sharpness:.0f}   clipped {clipped:.1%}   brightness {brightness:.0f}').format(**scores)
+
+    @traced('render_display_bytes')
+    def render_display_bytes(self, file_path, maxsize=(720, 480)):
+        """Generate image data using PIL, reusing the on-disk thumbnail cache when possible.
+           Raises on failure and touches no GUI state, so it is safe to call from worker threads
+        """
+        data = self.thumbnail_cache.get(file_path, maxsize)
+        if data is not None:
+            return data
+
+        data = render_preview(file_path, maxsize)
+        self.thumbnail_cache.put(file_path, maxsize, data)
+        return data
+
+    @traced('load_images')
+    def load_images(self):
+        """ Create the list of files from the selected folder
+        """
+        if not self.folder_path:
+            return
+        self.scanner = FolderScanner(self.folder_path, os.path.join(self.cache_dir, 'manifests'), self.recursive_scan)
+        self.image_files = [name for name, _, _ in self.scanner.scan()]
+        stats = self.scanner.stats
+        print(f"Scanned {stats['files']} images in {stats['seconds']:.3f}s ({stats['files_per_sec']:.0f} files/sec, "
+              f"{stats['dirs_listed']} folders listed, {stats['dirs_reused']} unchanged)")
+
+        self.rankings = {img: 0 for img in self.image_files}
+        if self.quality_index is not None:
+            # priors are relative to the scores of the images listed now, not every image ever scored
+            self.rating_engine.set_priors(self.quality_index.rating_priors(self.image_files))
+        self.rating_engine.reset(self.image_files)
+        self.scheduler.reset(self.image_files)
+        self.sync_rank_order()
+
+    @traced('refresh_images')
+    def refresh_images(self):
+        """ rescans the open folder and adds or removes files from the live session,
+            only folders changed since the last scan are listed again.
+            Returns the (added, removed) file names, both empty if nothing changed
+        """
+        found = self.scan_folder()
+        if found is None:
+            return [], []
+        return self.apply_folder_scan(found)
+
+    def scan_folder(self):
+        """ the file names currently in the open folder, None if no folder is open. Touches
+            only the scanner, so it can run on a worker thread while the session goes on
+        """
+        if self.scanner is None:
+            return None
+        return [name for name, _, _ in self.scanner.scan()]
+
+    @traced('apply_folder_scan')
+    def apply_folder_scan(self, found):
+        """ brings the session in line with the file names from scan_folder.
+            Returns the (added, removed) file names
+
+            Parameters
+            found : list of str
+               the files of the folder, as returned by scan_folder
+        """
+        found_set = set(found)
+        added = [name for name in found if name not in self.rankings]
+        removed = [name for name in self.image_files if name not in found_set]
+        for name in added:
+            self.image_files.append(name)
+            self.rankings[name] = 0
+            self.rating_engine.add_image(name)
+            self.scheduler.add_image(name)
+            self.rank_order.update(name, self.rank_key(name))
+            if self.duplicate_groups is not None:
+                self.add_to_duplicate_groups(name)
+        if removed:
+            removed_set = set(removed)
+            self.image_files = [name for name in self.image_files if name not in removed_set]
+            for name in removed:
+                # votes stay in the store in case the file comes back
+                del self.rankings[name]
+                self.scheduler.remove_image(name)
+                self.rank_order.remove(name)
+            if self.tournament is not None:
+                # reloading drops the deleted images, the answers about the rest still count
+                tournament = self.saved_tournament()
+                if tournament is None:
+                    # nothing saved could be read, drop them from the tournament in memory instead
+                    tournament = Tournament(self.tournament.mode, [image for image in self.tournament.images
+                                                                   if image not in removed_set],
+                                            self.tournament.k, self.tournament.answers)
+                self.tournament = tournament
+                self.tournament.step()
+        return added, removed
+
+    def saved_tournament(self):
+        """ the tournament left unfinished in an earlier session, None if there is none
+        """
+        return self.tournament_store.load(set(self.rankings))
+
+    def start_tournament(self, mode, k=20):
+        """ switches from free voting to a structured tournament, resuming the saved one if
+            it has the same mode, otherwise starting over from the current ranking order.
+            Returns the tournament, its pending pair is the next to show
+
+            Parameters
+            mode : str
+               'sort' for a full order or 'top' for the best k
+            k : int
+               places to find in 'top' mode
+        """
+        saved = self.saved_tournament()
+        if saved is not None and saved.mode == mode and (mode == 'sort' or saved.k == min(k, len(saved.images))):
+            self.tournament = saved
+        else:
+            images = [image for image in self.rank_order if image not in self.collapsed]
+            self.tournament = Tournament(mode, images, k)
+            self.tournament_store.start(self.tournament)
+        self.tournament.step()
+        return self.tournament
+
+    def stop_tournament(self, discard=False):
+        """ back to free voting, keeping the saved state to resume later unless discard is set
+        """
+        if discard:
+            self.tournament_store.clear()
+        self.tournament = None
+
+    def record_tournament_vote(self, winner, loser):
+        """ answers the tournament's pending pair and records it as an ordinary vote as well.
+            Returns the next pair, None once the tournament is finished
+        """
+        self.tournament.answer(winner, loser)
+        self.tournament_store.append(winner, loser)
+        self.record_vote(winner, loser)
+        return self.tournament.step()
+
+    def add_to_duplicate_groups(self, name):
+        """ hashes a file that appeared in the folder and joins it to its near-duplicates.
+            While collapsed, a new frame of an existing group is left out of the pairing
+        """
+        value = self.hash_index.hash_of(name)
+        if value is None:
+            return
+        self.duplicate_groups.add(name, value)
+        if self.collapse_duplicates and self.duplicate_groups.group_size(name) > 1:
+            self.scheduler.remove_image(name)
+            self.collapsed.add(name)
+
+    def get_random_image(self, excludes=None):
+        """ Chooses a random image among those in the file list.
+
+            Parameters
+            excludes : array of str
+               the file names of files to exclude from possible return values
+        """
+        return self.scheduler.sample_uniform(excludes or ())
+
+    def update_images(self, keep_selected=None, new_random=None):
+        """ Update the current pair
+
+            Parameters
+            keep_selected : array of str
+               string 'right' or 'left' to indicate to keep either image, None will cycle both
+            new_random : str
+                string filename to set image to, otherwise will select at random
+        """
+        if keep_selected is None:
+            pair = self.scheduler.next_pair()
+            if pair is None:
+                return False
+            self.current_left, self.current_right = pair
+        else:
+            if keep_selected == 'left':
+                self.current_left = self.current_left
+                self.current_right = new_random if new_random else self.get_random_image([self.current_left, self.current_right])
+            else:
+                self.current_right = self.current_right
+                self.current_left = new_random if new_random else self.get_random_image([self.current_left, self.current_right])
+
+        return True
+
+    def record_selection(self, selected_side):
+        """ stores vote between images
+
+            Parameters
+            selected_side : str
+               string 'right' or 'left' to indicate to image that was voted for
+        """
+        if selected_side == 'left':
+            selected_image, other_image = self.current_left, self.current_right
+        else:
+            selected_image, other_image = self.current_right, self.current_left
+
+        if selected_image:
+            self.record_vote(selected_image, other_image)
+
+    @traced('record_vote')
+    def record_vote(self, winner, loser):
+        """ stores a vote for winner over loser, whether or not the pair is still on screen
+
+            Parameters
+            winner : str
+               file name of the image that was voted for
+            loser : str
+               file name of the other image of the pair, may be None
+        """
+        if winner not in self.rankings or (loser and loser not in self.rankings):
+            return  # a file deleted while it was on screen or being evaluated, it stays out
+        self.rankings[winner] += 1
+        if loser:
+            self.rating_engine.record(winner, loser)
+            self.scheduler.record(winner, loser)
+            self.store.record_vote(self.folder_path, winner, loser)
+            self.rank_order.update(loser, self.rank_key(loser))
+        self.rank_order.update(winner, self.rank_key(winner))
+
+    def rank_key(self, image):
+        """ sort key of an image in the ranking table, highest rating then most votes first
+        """
+        return -self.rating_engine.ratings.get(image, self.rating_engine.initial_rating), -self.rankings.get(image, 0)
+
+    def sync_rank_order(self):
+        """ rebuilds the ranking order in one sort, after ratings were changed in bulk
+        """
+        self.rank_order.rebuild((image, self.rank_key(image)) for image in self.rankings)
+
+    def get_ranking_display(self):
+        sorted_rankings = sorted(
+            self.rankings.items(),
+            key=lambda x: x[1],
+            reverse=True
+        )
+
+        if not sorted_rankings:
+            return 'Empty ranking'
+
+        max_filename_len = max(len(img) for img, _ in sorted_rankings) if sorted_rankings else 30
+        max_filename_len = max(max_filename_len, 20)
+
+        lines = [f"{'Image Filename':<{max_filename_len}} | Votes", "-" * (max_filename_len + 20)]
+
+        for rank, (image, votes) in enumerate(sorted_rankings, 1):
+            lines.append(f"{image:<{max_filename_len}} | {votes}")
+
+        return '\n'.join(lines)
+
+    @traced('get_ranking_table_data')
+    def get_ranking_table_data(self, start=0, count=None):
+        """ rows of rank, image name, votes, Elo rating and the half width of the
+            95% confidence interval from a Bradley-Terry fit of all comparisons
+
+            Parameters
+            start : int
+               rank of the first row, 0 based
+            count : int
+               number of rows. None returns every row with an up to date fit. A page shows
+               the last finished fit and refits on a worker thread once that is more than
+               ci_refresh_votes behind, so its cost stays flat. Its intervals are blank until
+               the first fit finishes
+        """
+        ratings = self.rating_engine.ratings
+        if count is None:
+            images = list(self.rank_order)[start:]
+            fit = self.rating_engine.fit_bradley_terry()
+        else:
+            images = self.rank_order.page(start, count)
+            max_stale = max(self.ci_refresh_votes, int(len(self.rating_engine.comparisons) * self.ci_refresh_fraction))
+            fit = self.rating_engine.latest_fit(max_stale)  # refits on a worker thread, never on the vote path
+
+        table_data = []
+
+        for rank, image in enumerate(images, start + 1):
+            rating = ratings.get(image, self.rating_engine.initial_rating)
+            interval = f'±{fit[image][1]:.0f}' if image in fit else ''
+            table_data.append([rank, image, self.rankings.get(image, 0), round(rating), interval])
+
+        return table_data
+
+    def get_ranking_header(self):
+        return [self._('rank'), self._('image name'), self._('votes'), self._('rating'), self._('95% CI')]
+
+    def write_rank_csv(self, header, data, filename='rank.csv'):
+        """ writes ranking data to a csv file
+
+            Parameters
+            header : str
+               heading row for csv
+            data : array of str
+                data for csv entries
+            filename : str
+                where to write the csv
+        """
+        with open(filename, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(header)
+            writer.writerows(data[0:])
+
+    def write_rank_json(self, data, filename):
+        """ writes ranking data as a JSON list of objects, one per image
+        """
+        keys = ('rank', 'image', 'votes', 'rating', 'ci')
+        with open(filename, 'w') as json_file:
+            json.dump([dict(zip(keys, row)) for row in data], json_file, indent=1)
+
+    def get_api_key(self):
+        """ the Gemini API key from the environment or the .env file. python-dotenv is
+            imported and the .env file read the first time a key is needed, not at startup
+        """
+        if not self._dotenv_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            self._dotenv_loaded = True
+        return os.getenv('GEMINI_API_KEY')
+
+    def get_gemini_client(self, api_key):
+        """ the shared Gemini client, created on first use. Setting IMAGE_RANKER_AI_BACKEND=fake
+            swaps in an offline stand-in model, GEMINI_RPM sets the request rate limit and
+            GEMINI_MAX_EDGE / GEMINI_JPEG_QUALITY bound the uploaded images
+
+            Parameters
+            api_key : str
+               Gemini api_key needed for gemini services
+        """
+        if self.gemini_client is None:
+            if os.getenv('IMAGE_RANKER_AI_BACKEND') == 'fake':
+                backend = FakeBackend()
+            else:
+                backend = GeminiBackend(api_key)
+            preparer = PayloadPreparer(max_edge=int(os.getenv('GEMINI_MAX_EDGE', '1536')),
+                                       quality=int(os.getenv('GEMINI_JPEG_QUALITY', '85')))
+            self.gemini_client = GeminiClient(backend, ResponseCache(os.path.join(self.cache_dir, 'gemini')),
+                                              requests_per_minute=float(os.getenv('GEMINI_RPM', '10')),
+                                              preparer=preparer)
+        return self.gemini_client
+
+    def get_eval_prompt(self):
+        prompt_text = '''Rate this image for sharpness on a scale of 0-10,
+                         the language for details in the response should be: ''' + self._('language for Gemini response')
+        return " ".join(prompt_text.split()) # removes extraneous whitespace
+
+    @staticmethod
+    def comparison_result(left, right, response_text):
+        """ (winner, loser) from a comparison response, which starts with 1 or 2
+        """
+        if response_text.startswith('1'):
+            return left, right
+        return right, left
+
+    def compare_with_ai(self, api_key, left, right):
+        """ asks Gemini which of two images is better and returns (winner, loser, response text).
+            The vote is not recorded
+
+            Parameters
+            api_key : str
+               Gemini api_key needed for gemini services
+            left, right : str
+               file names relative to the open folder
+        """
+        file_paths = [os.path.join(self.folder_path, left), os.path.join(self.folder_path, right)]
+        response_text = self.get_gemini_client(api_key).ask(self.comparison_prompt, file_paths)
+        winner, loser = self.comparison_result(left, right, response_text)
+        return winner, loser, response_text
+
+    @traced('read_rankings_from_disk')
+    def read_rankings_from_disk(self, folder=None):
+        """ reads the stored votes and comparisons of one folder
+
+            Parameters
+            folder : str
+               the folder to read, the currently open one if not given
+        """
+        return self.store.load_folder(folder or self.folder_path)
+
+    @traced('write_rankings_to_disk')
+    def write_rankings_to_disk(self):
+        """ votes are stored as they are cast, this makes sure they are all on disk
+            and lets the backend compact its log
+        """
+        self.store.compact()
+        self.store.close()
+
+    @traced('get_simplified_image_details')
+    def get_simplified_image_details(self, image_path):
+        if self.metadata_index is None:
+            details = get_exif_data(image_path)
+        else:
+            details = self.metadata_index.get(os.path.relpath(image_path, self.folder_path))
+
+        simplified_details = []
+        if not details:
+            return []
+        else:
+            filtered_dict = {k: details[k] for k in DISPLAY_FIELDS if k in details}
+            simplified_details.append(list(filtered_dict.values()))
+
+        return simplified_details
+
+    def sort_image_files(self, sort_key):
+        """ reorders the file list by name or by an indexed EXIF field
+
+            Parameters
+            sort_key : str
+               'name', 'quality' for the local score, best first, or one of DISPLAY_FIELDS
+        """
+        if sort_key == 'quality' and self.quality_index is not None:
+            self.image_files = self.quality_index.sorted_names(self.image_files, 'score', reverse=True)
+        elif sort_key == 'name' or self.metadata_index is None:
+            self.image_files.sort()
+        else:
+            self.image_files = self.metadata_index.sorted_names(self.image_files, sort_key)
+
+    def filter_image_files(self, field, minimum=None, maximum=None):
+        """ the files, in list order, whose indexed EXIF field lies within [minimum, maximum],
+            files without the field are left out
+
+            Parameters
+            field : str
+               one of DISPLAY_FIELDS
+            minimum : float
+               lowest value kept, None for no lower bound
+            maximum : float
+               highest value kept, None for no upper bound
+        """
+        if self.metadata_index is None or (minimum is None and maximum is None):
+            return list(self.image_files)
+        return self.metadata_index.filter_names(self.image_files, field, minimum, maximum)
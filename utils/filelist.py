@@ -0,0 +1,183 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+
+class FileIndex:
+    """ Positions of the file names of a folder and a trigram index for type-ahead search
+
+        Looking up a name's position is a dict read. The trigram index maps every three
+        character run of the lower cased names to the positions containing it, so a search
+        only checks the names in the shortest posting list of its trigrams. The index is
+        built on a background thread, searches fall back to a scan until it is ready.
+
+        Parameters
+        names : list of str
+           the file names in display order
+    """
+    def __init__(self, names):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.rebuild(names)
+
+    def rebuild(self, names):
+        with self._lock:
+            self.names = names
+            self.positions = {name: i for i, name in enumerate(names)}
+            self._lower = None
+            self._grams = None
+            self._last = ('', None)
+            self._generation += 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, name):
+        """ position of name, None if it is not in the list
+        """
+        return self.positions.get(name)
+
+    def build_async(self):
+        """ builds the trigram index on a background thread
+        """
+        threading.Thread(target=self._build_grams, args=(self._generation,), daemon=True).start()
+
+    def _build_grams(self, generation):
+        names = self.names
+        lower = [name.lower() for name in names]
+        grams = {}
+        for i, name in enumerate(lower):
+            for gram in {name[j:j + 3] for j in range(len(name) - 2)}:
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array('I')
+                postings.append(i)
+        with self._lock:
+            if generation == self._generation:  # the list was not replaced meanwhile
+                self._lower = lower
+                self._grams = grams
+
+    def search(self, query):
+        """ positions of the names containing query, ignoring case, in list order
+        """
+        query = query.lower()
+        if not query:
+            return list(range(len(self.names)))
+        last_query, last_result = self._last
+        lower = self._lower
+        if lower is None:
+            lower = [name.lower() for name in self.names]
+        if last_result is not None and last_query and last_query in query:
+            # typing extends the previous query, only its matches can still match
+            candidates = last_result
+        elif self._grams is not None and len(query) >= 3:
+            postings = [self._grams.get(query[j:j + 3]) for j in range(len(query) - 2)]
+            if any(posting is None for posting in postings):
+                candidates = []
+            else:
+                candidates = min(postings, key=len)
+        else:
+            candidates = range(len(lower))
+        result = [i for i in candidates if query in lower[i]]
+        self._last = (query, result)
+        return result
+
+
+class FileView:
+    """ The filtered file list of view mode, the current file in it, and the slice of it
+        shown in the listbox. Only the slice is ever handed to the widget, so the cost of a
+        listbox update does not depend on the size of the folder
+
+        Parameters
+        index : FileIndex
+           the folder's file names
+        rows : int
+           names shown in the listbox at a time
+    """
+    def __init__(self, index, rows=200):
+        self.index = index
+        self.rows = rows
+        self.query = ''
+        self.matches = None  # positions in index matching the query, None for every file
+        self.position = 0  # position of the current file within the matches
+        self.first = 0  # position within the matches of the first listbox row
+
+    def __len__(self):
+        return len(self.index) if self.matches is None else len(self.matches)
+
+    def _name_at(self, position):
+        return self.index.names[position if self.matches is None else self.matches[position]]
+
+    def current(self):
+        """ the current file name, None if nothing matches the filter
+        """
+        if len(self) == 0:
+            return None
+        return self._name_at(self.position)
+
+    def set_filter(self, query):
+        """ shows only the files containing query, keeping the current file if it still matches
+        """
+        current = self.current()
+        self.query = query
+        self.matches = self.index.search(query) if query else None
+        self._reposition(current)
+
+    def refresh(self):
+        """ applies the filter again after the file list changed, keeping the current file if possible
+        """
+        current = self.current()
+        self.matches = self.index.search(self.query) if self.query else None
+        self._reposition(current)
+
+    def _reposition(self, name):
+        position = self.index.index(name) if name is not None else None
+        if position is not None and self.matches is not None:
+            position = self._match_position(position)
+        self.position = min(position if position is not None else self.position, max(len(self) - 1, 0))
+
+    def _match_position(self, index_position):
+        found = bisect_left(self.matches, index_position)
+        if found < len(self.matches) and self.matches[found] == index_position:
+            return found
+        return None
+
+    def select(self, name):
+        """ makes name the current file, returns False if it is not in the view
+        """
+        position = self.index.index(name)
+        if position is not None and self.matches is not None:
+            position = self._match_position(position)
+        if position is None:
+            return False
+        self.position = position
+        return True
+
+    def move(self, step):
+        if len(self):
+            self.position = (self.position + step) % len(self)
+
+    def neighbours(self, radius):
+        """ names within radius of the current file, nearest first, for prefetching
+        """
+        count = len(self)
+        names = []
+        if not count:
+            return names
+        for offset in range(1, radius + 1):
+            for position in ((self.position + offset) % count, (self.position - offset) % count):
+                name = self._name_at(position)
+                if name not in names and position != self.position:
+                    names.append(name)
+        return names
+
+    def visible(self):
+        """ (names for the listbox, row of the current file), moving the slice only when
+            the current file has left it
+        """
+        count = len(self)
+        if not self.first <= self.position < self.first + self.rows:
+            self.first = max(0, min(self.position - self.rows // 2, count - self.rows))
+        self.first = max(0, min(self.first, max(count - self.rows, 0)))
+        last = min(self.first + self.rows, count)
+        return [self._name_at(position) for position in range(self.first, last)], self.position - self.first
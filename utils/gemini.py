@@ -0,0 +1,365 @@
+import os
+import io
+import json
+import time
+import random
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from utils.prefetch import DisplayCache
+from utils.imageutils import open_preview
+from utils.tracing import traced
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+
+class GeminiBackend:
+    """ Gemini client, configured once and reused for every request.
+        google.generativeai is only imported when the first request is made
+
+        Parameters
+        api_key : str
+           Gemini api_key needed for gemini services
+        model_name : str
+           the Gemini model to call
+    """
+    def __init__(self, api_key, model_name=DEFAULT_MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(model_name=self.model_name)
+            return self._model
+
+    def generate(self, parts):
+        """ sends the prompt parts (text and images) and returns the response text
+        """
+        return self.model().generate_content(parts).text
+
+
+class FakeBackend:
+    """ Stand-in model for running and benchmarking batch evaluation offline
+
+        Parameters
+        latency : float
+           seconds each request takes
+        failure_rate : float
+           fraction of requests that raise, to exercise the retries
+    """
+    model_name = 'fake'
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, parts):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError('fake backend failure')
+        digest = hashlib.sha1(repr(parts[0]).encode('utf-8') + str(len(parts)).encode('ascii')).digest()
+        return f'{digest[0] % 2 + 1} {digest[1] % 11}/10 from the fake model'
+
+
+class PayloadPreparer:
+    """ Downsamples and re-encodes images before upload so a sharpness or comparison
+        judgement does not ship multi-megabyte originals. Prepared payloads are kept in
+        memory, so the eval and compare paths share them
+
+        Parameters
+        max_edge : int
+           longest edge in pixels of the uploaded image
+        quality : int
+           JPEG quality of the uploaded image
+    """
+    def __init__(self, max_edge=1536, quality=85, cache_bytes=64 * 1024 * 1024):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.cache = DisplayCache(cache_bytes)
+
+    def describe(self):
+        return f'jpeg:{self.max_edge}:{self.quality}'
+
+    def prepare(self, file_path):
+        """ returns the JPEG bytes uploaded for file_path
+        """
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        data = self.cache.get(key)
+        if data is None:
+            preview = open_preview(file_path, (self.max_edge, self.max_edge), allow_exif_thumbnail=False)
+            if preview.mode != 'RGB':
+                preview = preview.convert('RGB')
+            with io.BytesIO() as buffer:
+                preview.save(buffer, format='JPEG', quality=self.quality)
+                data = buffer.getvalue()
+            self.cache.put(key, data)
+        return data
+
+    def __call__(self, file_path):
+        return {'mime_type': 'image/jpeg', 'data': self.prepare(file_path)}
+
+
+class RateLimiter:
+    """ Token bucket limiting calls to requests_per_minute, shared by all worker threads
+    """
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResponseCache:
+    """ Model responses on disk, keyed by the content hash of the images, the prompt and the model
+    """
+    def __init__(self, cache_dir='./local_cache/gemini/'):
+        self.cache_dir = cache_dir
+        self._hashes = {}  # (path, mtime_ns, size) -> content hash
+
+    def content_hash(self, file_path):
+        stat = os.stat(file_path)
+        stat_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        if stat_key not in self._hashes:
+            digest = hashlib.sha256()
+            with open(file_path, mode='rb') as image_file:
+                for block in iter(lambda: image_file.read(1024 * 1024), b''):
+                    digest.update(block)
+            self._hashes[stat_key] = digest.hexdigest()
+        return self._hashes[stat_key]
+
+    def key(self, file_paths, prompt, model_name):
+        digest = hashlib.sha256()
+        for part in [model_name, prompt] + [self.content_hash(path) for path in file_paths]:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.cache_dir, key + '.json')
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, mode='r') as cache_file:
+                return json.load(cache_file)['text']
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def put(self, key, text):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, mode='w') as tmp_file:
+                json.dump({'text': text}, tmp_file)
+            os.replace(tmp_path, os.path.join(self.cache_dir, key + '.json'))
+        except IOError as e:
+            print(f'Error writing Gemini response cache {key} : {e}')
+
+
+class GeminiClient:
+    """ Rate limited, retrying and cached access to a model backend
+
+        Parameters
+        backend : GeminiBackend or FakeBackend
+           anything with a generate(parts) method and a model_name
+        cache : ResponseCache
+           where responses are kept, None to always call the backend
+        requests_per_minute : float
+           limit on calls actually sent to the backend, cache hits are free
+        retries : int
+           attempts after the first failure, with exponential backoff
+        preparer : PayloadPreparer
+           turns a file path into the bounded image part sent to the backend
+        verbose : boolean
+           print the bytes sent and time taken for each call
+    """
+    def __init__(self, backend, cache=None, requests_per_minute=10, retries=4, base_delay=2.0, preparer=None,
+                 verbose=True):
+        self.backend = backend
+        self.cache = cache
+        self.limiter = RateLimiter(requests_per_minute)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.preparer = preparer or PayloadPreparer()
+        self.verbose = verbose
+        self.stats = {'calls': 0, 'cache_hits': 0, 'retries': 0, 'bytes_sent': 0, 'prepare_seconds': 0.0,
+                      'request_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    @traced('gemini.ask')
+    def ask(self, prompt, file_paths):
+        """ returns the model's text for prompt with the images at file_paths, from the cache if possible
+        """
+        # the payload settings change what the model sees, so they are part of the cache key
+        key = self.cache.key(file_paths, prompt, f'{self.backend.model_name}|{self.preparer.describe()}') if self.cache else None
+        if key:
+            text = self.cache.get(key)
+            if text is not None:
+                self._count('cache_hits')
+                return text
+
+        started = time.perf_counter()
+        parts = [prompt] + [self.preparer(path) for path in file_paths]
+        prepare_seconds = time.perf_counter() - started
+        payload_bytes = len(prompt.encode('utf-8')) + sum(len(part['data']) for part in parts[1:])
+        self._count('prepare_seconds', prepare_seconds)
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            self._count('calls')
+            self._count('bytes_sent', payload_bytes)
+            started = time.perf_counter()
+            try:
+                text = self.backend.generate(parts)
+                request_seconds = time.perf_counter() - started
+                self._count('request_seconds', request_seconds)
+                break
+            except Exception:
+                self._count('request_seconds', time.perf_counter() - started)
+                if attempt >= self.retries:
+                    raise
+                self._count('retries')
+                time.sleep(self.base_delay * (2 ** attempt) * (0.5 + random.random()))
+                attempt += 1
+
+        if self.verbose:
+            print(f'Gemini call: {len(file_paths)} image(s), {payload_bytes / 1024:.0f} KiB sent, '
+                  f'{prepare_seconds:.2f}s preparing, {request_seconds:.2f}s waiting for the response')
+        if key:
+            self.cache.put(key, text)
+        return text
+
+    def batch_evaluate(self, file_paths, prompt, workers=4):
+        """ evaluates every file concurrently, yielding (file path, text, error) as each completes
+
+            Parameters
+            file_paths : list of str
+               the images to evaluate, one request each
+            prompt : str
+               the prompt sent with every image
+            workers : int
+               requests in flight at once, the rate limiter still applies
+        """
+        remaining = iter(file_paths)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gemini')
+        in_flight = {}
+        try:
+            while True:
+                # only as many requests as workers are queued, so closing the generator sends no more
+                while len(in_flight) < workers:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    in_flight[pool.submit(self.ask, prompt, [path])] = path
+                if not in_flight:
+                    return
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = in_flight.pop(future)
+                    try:
+                        yield path, future.result(), None
+                    except Exception as e:
+                        yield path, None, e
+        finally:
+            # requests already running finish in the background, the caller does not wait for them
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AIJobQueue:
+    """ Runs Gemini requests on background threads so the event loops stay responsive
+
+        Each job remembers the context it was submitted with (for example the pair that
+        was on screen), and notify(job_id) is called from the worker thread once the job
+        finishes, typically to post an event to the window's queue.
+
+        Parameters
+        client : GeminiClient
+           the client that performs the requests
+        workers : int
+           jobs running at once, the client's rate limiter still applies
+    """
+    def __init__(self, client, workers=2):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gemini-job')
+        self._jobs = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def submit(self, prompt, file_paths, context, notify):
+        """ queues a request, returns the job id passed to notify when it completes
+
+            Parameters
+            prompt : str
+               the prompt text
+            file_paths : list of str
+               the images sent with the prompt
+            context : dict
+               anything the caller needs to apply the result later
+            notify : callable
+               called with the job id from the worker thread when the job is done
+        """
+        with self._lock:
+            self._next_id += 1
+            job_id = self._next_id
+            # the job is only published with its future, cancel_all may run at any time
+            future = self._executor.submit(self.client.ask, prompt, file_paths)
+            self._jobs[job_id] = {'id': job_id, 'context': context, 'cancelled': False, 'future': future}
+        # outside the lock: a job done already calls notify here, and notify may take the job
+        future.add_done_callback(lambda _: notify(job_id))
+        return job_id
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job['cancelled'])
+
+    def cancel_all(self):
+        """ drops queued jobs and forgets running ones so their results are ignored
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            job['cancelled'] = True
+            job['future'].cancel()
+
+    def take(self, job_id):
+        """ removes a finished job, returning (context, text, error), or None if it was cancelled
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None or job['cancelled'] or job['future'].cancelled():
+            return None
+        try:
+            return job['context'], job['future'].result(), None
+        except Exception as e:
+            return job['context'], None, e
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import tempfile
+
+
+class VoteJournal:
+    """ Write-ahead journal of votes on top of the rankings.data snapshot
+
+        Every vote is appended as one JSON line as it is cast, so the cost per vote does not
+        depend on the size of the history. fsync is batched by count and time. Compaction
+        folds the journal into the snapshot. Each record carries a sequence number and the
+        snapshot remembers the last one it contains, so a crash between writing the snapshot
+        and truncating the journal never applies a vote twice.
+
+        Parameters
+        cache_dir : str
+           directory holding the snapshot and the journal
+        snapshot_file : str
+           name of the JSON snapshot, the existing rankings cache
+        journal_file : str
+           name of the append-only journal
+        fsync_every : int
+           fsync after this many unsynced records
+        fsync_interval : float
+           or once this many seconds have passed since the last fsync
+        compact_bytes : int
+           journal size above which compaction is worthwhile
+    """
+    def __init__(self, cache_dir, snapshot_file='rankings.data', journal_file='votes.journal',
+                 fsync_every=16, fsync_interval=2.0, compact_bytes=4 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.snapshot_path = os.path.join(cache_dir, snapshot_file)
+        self.journal_path = os.path.join(cache_dir, journal_file)
+        self.latest_folder_path = os.path.join(cache_dir, 'latest_folder')
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._seq = None
+
+    def read_snapshot(self):
+        cache_data = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, mode='r') as snapshot_file:
+                    cache_data = json.load(snapshot_file)
+            except (IOError, ValueError) as e:
+                print(f'Error opening file {self.snapshot_path} : {e}')
+        return cache_data
+
+    def read_records(self):
+        """ yields the journal records in order, a torn final line from a crash is skipped
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, mode='r') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict):
+                        yield record
+        except IOError as e:
+            print(f'Error opening file {self.journal_path} : {e}')
+
+    @staticmethod
+    def apply(cache_data, record):
+        """ applies one journal record to cache data in the rankings.data layout
+        """
+        folder = record.get('folder')
+        if record.get('op') == 'vote':
+            winner, loser = record['winner'], record['loser']
+            votes = cache_data.setdefault('rankings', {}).setdefault(folder, {})
+            votes[winner] = votes.get(winner, 0) + 1
+            cache_data.setdefault('comparisons', {}).setdefault(folder, []).append([winner, loser])
+        elif record.get('op') == 'folder':
+            cache_data['latest_folder'] = folder
+        cache_data['journal_seq'] = record.get('seq', cache_data.get('journal_seq', 0))
+
+    def load(self):
+        """ returns the snapshot with every journal record it does not contain yet applied
+        """
+        cache_data = self.read_snapshot()
+        applied = cache_data.get('journal_seq', 0)
+        for record in self.read_records():
+            if record.get('seq', 0) > applied:
+                self.apply(cache_data, record)
+                applied = cache_data['journal_seq']
+        self._seq = max(self._seq or 0, applied)
+        return cache_data
+
+    def latest_folder(self):
+        """ the folder opened last, read from a small side file so the startup popup does
+            not parse the whole snapshot and journal. Falls back to them for caches
+            written before the side file existed
+        """
+        try:
+            with open(self.latest_folder_path, mode='r', encoding='utf-8') as latest_file:
+                return latest_file.read() or None
+        except OSError:
+            return self.load().get('latest_folder')
+
+    def load_folder(self, folder):
+        """ returns {'rankings': {name: votes}, 'comparisons': [[winner, loser], ...]} for one folder
+        """
+        cache_data = self.load()
+        return {'rankings': cache_data.get('rankings', {}).get(folder, {}),
+                'comparisons': cache_data.get('comparisons', {}).get(folder, [])}
+
+    def _next_seq(self):
+        if self._seq is None:
+            self.load()
+        self._seq += 1
+        return self._seq
+
+    def append(self, record):
+        """ appends a record to the journal, fsyncing once enough records or time have accumulated
+
+            Parameters
+            record : dict
+               an 'op' of 'vote' (folder, winner, loser) or 'folder' (folder)
+        """
+        record = dict(record, seq=self._next_seq())
+        try:
+            if self._file is None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._file = open(self.journal_path, mode='a')
+                if self._file.tell() and not self._ends_with_newline():
+                    self._file.write('\n')  # terminate a line torn by a crash so it stays on its own
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.sync()
+        except IOError as e:
+            print(f'Error writing to file {self.journal_path} : {e}')
+
+    def _ends_with_newline(self):
+        with open(self.journal_path, mode='rb') as journal_file:
+            journal_file.seek(-1, os.SEEK_END)
+            return journal_file.read(1) == b'\n'
+
+    def record_vote(self, folder, winner, loser):
+        self.append({'op': 'vote', 'folder': folder, 'winner': winner, 'loser': loser})
+
+    def record_folder(self, folder):
+        self.append({'op': 'folder', 'folder': folder})
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, mode='w', encoding='utf-8') as tmp_file:
+                tmp_file.write(folder)
+            os.replace(tmp_path, self.latest_folder_path)
+        except IOError as e:
+            print(f'Error writing to file {self.latest_folder_path} : {e}')
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def compact(self, force=False):
+        """ folds the journal into the snapshot and truncates it, skipped while the
+            journal is smaller than compact_bytes unless force is set
+        """
+        self.sync()
+        if not force and self.journal_size() < self.compact_bytes:
+            return
+        cache_data = self.load()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, mode='w') as tmp_file:
+                tmp_file.write(json.dumps(cache_data))
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # records up to journal_seq are now in the snapshot, a crash before this point only leaves duplicates that load() skips
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            open(self.journal_path, mode='w').close()
+        except IOError as e:
+            print(f'Error writing to file {self.snapshot_path} : {e}')
+
+    def close(self):
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,198 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import exifread
+from utils.imageutils import sanitise_exif_value
+
+# the EXIF fields shown in view mode, in display order
+DISPLAY_FIELDS = ['ApertureValue', 'ShutterSpeedValue', 'ExposureIndex', 'ISOSpeedRatings']
+
+
+def read_header_metadata(image_path):
+    """ reads the display fields from the EXIF header only, the image data is never decoded
+
+        Parameters
+        image_path : str
+           path of the image to read
+    """
+    with open(image_path, mode='rb') as image_file:
+        tags = exifread.process_file(image_file, details=False, extract_thumbnail=False, builtin_types=True)
+    fields = {}
+    for field in DISPLAY_FIELDS:
+        value = tags.get(f'EXIF {field}')
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]  # single rationals come back as one element lists
+        if value is not None:
+            fields[field] = sanitise_exif_value(value)
+    return fields
+
+
+def _read_entry(folder, name):
+    """ process pool worker, returns (name, size, mtime_ns, fields)
+    """
+    path = os.path.join(folder, name)
+    try:
+        stat = os.stat(path)
+        return name, stat.st_size, stat.st_mtime_ns, read_header_metadata(path)
+    except Exception:
+        return name, None, None, {}
+
+
+class MetadataIndex:
+    """ EXIF display fields for every image of a folder, kept in the local cache
+
+        The index is built on a process pool when a folder opens, entries whose file size and
+        mtime are unchanged are reused from the cache. Lookups are dict reads, so navigation
+        never opens a file, and the file list can be sorted or filtered by any field.
+
+        Parameters
+        folder : str
+           the folder being indexed
+        cache_dir : str
+           where the index is saved, one file per folder
+    """
+    read_entry = staticmethod(_read_entry)  # process pool worker, (folder, name) -> (name, size, mtime_ns, fields)
+
+    def __init__(self, folder, cache_dir='./local_cache/metadata/'):
+        self.folder = folder
+        digest = hashlib.sha1(os.path.abspath(folder).encode('utf-8', errors='surrogateescape')).hexdigest()
+        self.index_path = os.path.join(cache_dir, digest + '.json')
+        self.entries = {}  # name -> {'size': int, 'mtime_ns': int, 'fields': dict}
+        self._lock = threading.Lock()
+        self._builder = None
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, mode='r') as index_file:
+                    self.entries = json.load(index_file)
+            except (IOError, ValueError) as e:
+                print(f'Error opening file {self.index_path} : {e}')
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.entries)
+        try:
+            directory = os.path.dirname(self.index_path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, mode='w') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, self.index_path)
+        except IOError as e:
+            print(f'Error writing to file {self.index_path} : {e}')
+
+    def _is_current(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def stale(self, names):
+        """ the names that are missing from the index or changed since they were indexed
+        """
+        return [name for name in names if not self._is_current(name)]
+
+    def update(self, names, workers=None):
+        """ indexes every name that is missing or out of date on a process pool, yielding
+            each one as it is done. Closing the generator stops early, keeping what was read
+
+            Parameters
+            names : list of str
+               file names relative to the folder
+            workers : int
+               process count, all CPUs by default
+        """
+        stale = self.stale(names)
+        if not stale:
+            return
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(stale) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(self.read_entry, [self.folder] * len(stale), stale, chunksize=chunksize)
+            try:
+                for name, size, mtime_ns, fields in results:
+                    if size is not None:
+                        with self._lock:
+                            self.entries[name] = {'size': size, 'mtime_ns': mtime_ns, 'fields': fields}
+                    yield name
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def build(self, names, workers=None):
+        """ indexes every name that is missing or out of date, drops names no longer in
+            the folder and saves the index
+
+            Parameters
+            names : list of str
+               file names relative to the folder
+            workers : int
+               process count, all CPUs by default
+        """
+        for _ in self.update(names, workers):
+            pass
+        wanted = set(names)
+        with self._lock:
+            for name in [name for name in self.entries if name not in wanted]:
+                del self.entries[name]
+        self.save()
+
+    def build_async(self, names, workers=None):
+        """ runs build on a background thread so opening the folder is not held up
+        """
+        self._builder = threading.Thread(target=self.build, args=(list(names), workers), daemon=True)
+        self._builder.start()
+
+    def get(self, name):
+        """ the indexed fields for name, read on the spot if the index has not reached it yet
+        """
+        entry = self.entries.get(name)
+        if entry is not None:
+            return entry['fields']
+        _, size, mtime_ns, fields = self.read_entry(self.folder, name)
+        if size is not None:
+            with self._lock:
+                self.entries[name] = {'size': size, 'mtime_ns': mtime_ns, 'fields': fields}
+        return fields
+
+    def _value(self, name, field):
+        entry = self.entries.get(name)
+        value = entry['fields'].get(field) if entry else None
+        if isinstance(value, list):
+            value = value[0] if value else None
+        return value if isinstance(value, (int, float)) else None
+
+    def sorted_names(self, names, field, reverse=False):
+        """ names ordered by an indexed field, files without the field go last
+
+            Parameters
+            names : list of str
+               file names relative to the folder
+            field : str
+               one of DISPLAY_FIELDS
+            reverse : boolean
+               largest values first
+        """
+        with_value = [(self._value(name, field), name) for name in names]
+        known = sorted(((value, name) for value, name in with_value if value is not None), reverse=reverse)
+        return [name for _, name in known] + [name for value, name in with_value if value is None]
+
+    def filter_names(self, names, field, minimum=None, maximum=None):
+        """ names whose field lies within [minimum, maximum], either bound may be None
+        """
+        result = []
+        for name in names:
+            value = self._value(name, field)
+            if value is None:
+                continue
+            if (minimum is None or value >= minimum) and (maximum is None or value <= maximum):
+                result.append(name)
+        return result
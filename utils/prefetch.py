@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DisplayCache:
+    """ Bounded in-memory LRU of rendered display bytes, keyed by file path
+    """
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if data is None:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, oldest = self._entries.popitem(last=False)
+                self._total_bytes -= len(oldest)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+
+class Prefetcher:
+    """ Renders display bytes for upcoming files on a thread pool so the event loop
+        only has to pick them up from the DisplayCache
+
+        Parameters
+        render : callable
+           takes a file path and returns the display bytes, raising on failure
+        cache : DisplayCache
+           where rendered bytes are kept
+        workers : int
+           number of background render threads
+    """
+    def __init__(self, render, cache, workers=2):
+        self.render = render
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._pending = {}  # file path -> Future
+        # re-entrant since cancel() and done callbacks run _forget on the calling thread
+        self._lock = threading.RLock()
+
+    def _render_into_cache(self, file_path):
+        data = self.render(file_path)
+        self.cache.put(file_path, data)
+        return data
+
+    def _forget(self, file_path, future):
+        with self._lock:
+            if self._pending.get(file_path) is future:
+                del self._pending[file_path]
+
+    def prefetch(self, file_paths):
+        """ queues file_paths for rendering, cancelling queued work for any other file
+
+            Parameters
+            file_paths : list of str
+               the files to render, most urgent first
+        """
+        wanted = set(file_paths)
+        with self._lock:
+            for file_path, future in list(self._pending.items()):
+                if file_path not in wanted:
+                    future.cancel()  # the done callback drops it from _pending
+            for file_path in file_paths:
+                if file_path in self._pending or file_path in self.cache:
+                    continue
+                future = self._executor.submit(self._render_into_cache, file_path)
+                self._pending[file_path] = future
+                future.add_done_callback(lambda f, p=file_path: self._forget(p, f))
+
+    def is_ready(self, file_path):
+        """ True if the bytes for file_path can be returned without waiting on a render
+        """
+        return file_path in self.cache
+
+    def get(self, file_path):
+        """ returns display bytes for file_path, waiting on an in-flight prefetch
+            or rendering on the calling thread if nothing was queued
+        """
+        data = self.cache.get(file_path)
+        if data is not None:
+            return data
+        with self._lock:
+            future = self._pending.get(file_path)
+        if future is not None and not future.cancelled():
+            return future.result()
+        return self._render_into_cache(file_path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,142 @@
+from bisect import bisect_left, insort
+
+
+class RankOrder:
+    """ Images kept in rank order under changing sort keys
+
+        The keys live in a list of sorted buckets of roughly load entries, with the last
+        key of each bucket indexed for bisection. Moving an image after a vote is a
+        bisection plus a memmove within one bucket, and reading a page of rows starts
+        from the rank by skipping whole buckets, so neither depends on sorting the folder.
+
+        Parameters
+        load : int
+           target bucket size, buckets are split at twice this
+    """
+    def __init__(self, load=512):
+        self.load = load
+        self._buckets = []
+        self._maxes = []
+        self._keys = {}  # image -> current key
+
+    def rebuild(self, keyed_images):
+        """ replaces the contents with (image, key) pairs in a single sort
+        """
+        self._keys = dict(keyed_images)
+        entries = sorted((key, image) for image, key in self._keys.items())
+        self._buckets = [entries[i:i + self.load] for i in range(0, len(entries), self.load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, image):
+        return image in self._keys
+
+    def update(self, image, key):
+        """ places image at the position for key, moving it if it is already present
+        """
+        old_key = self._keys.get(image)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._delete((old_key, image))
+        self._keys[image] = key
+        self._insert((key, image))
+
+    def remove(self, image):
+        old_key = self._keys.pop(image, None)
+        if old_key is not None:
+            self._delete((old_key, image))
+
+    def _insert(self, entry):
+        if not self._buckets:
+            self._buckets.append([entry])
+            self._maxes.append(entry)
+            return
+        position = bisect_left(self._maxes, entry)
+        if position == len(self._maxes):
+            position -= 1
+            self._buckets[position].append(entry)
+            self._maxes[position] = entry
+        else:
+            insort(self._buckets[position], entry)
+        bucket = self._buckets[position]
+        if len(bucket) > 2 * self.load:
+            half = len(bucket) // 2
+            self._buckets[position:position + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[position:position + 1] = [bucket[half - 1], bucket[-1]]
+
+    def _delete(self, entry):
+        position = bisect_left(self._maxes, entry)
+        bucket = self._buckets[position]
+        del bucket[bisect_left(bucket, entry)]
+        if not bucket:
+            del self._buckets[position]
+            del self._maxes[position]
+        else:
+            self._maxes[position] = bucket[-1]
+
+    def key(self, image, default=None):
+        return self._keys.get(image, default)
+
+    def nearby(self, key, image, radius):
+        """ up to radius images either side of where (key, image) sorts, image itself left
+            out, nearest first and alternating the one above with the one below
+        """
+        if not self._buckets:
+            return []
+        entry = (key, image)
+        position = min(bisect_left(self._maxes, entry), len(self._buckets) - 1)
+        offset = bisect_left(self._buckets[position], entry)
+        above, below = [], []
+        bucket_index, index = position, offset
+        while len(above) < radius and bucket_index < len(self._buckets):
+            bucket = self._buckets[bucket_index]
+            if index >= len(bucket):
+                bucket_index, index = bucket_index + 1, 0
+                continue
+            if bucket[index] != entry:
+                above.append(bucket[index][1])
+            index += 1
+        bucket_index, index = position, offset - 1
+        while len(below) < radius and bucket_index >= 0:
+            if index < 0:
+                bucket_index -= 1
+                index = len(self._buckets[bucket_index]) - 1 if bucket_index >= 0 else -1
+                continue
+            below.append(self._buckets[bucket_index][index][1])
+            index -= 1
+        result = []
+        for distance in range(radius):
+            result.extend(side[distance] for side in (above, below) if distance < len(side))
+        return result
+
+    def rank(self, image):
+        """ 0 based position of image, None if it is not present
+        """
+        key = self._keys.get(image)
+        if key is None:
+            return None
+        entry = (key, image)
+        position = bisect_left(self._maxes, entry)
+        return sum(len(bucket) for bucket in self._buckets[:position]) + bisect_left(self._buckets[position], entry)
+
+    def page(self, start, count):
+        """ the images at ranks start to start + count - 1
+        """
+        result = []
+        for bucket in self._buckets:
+            if start >= len(bucket):
+                start -= len(bucket)
+                continue
+            result.extend(image for _, image in bucket[start:start + count - len(result)])
+            start = 0
+            if len(result) >= count:
+                break
+        return result
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            for _, image in bucket:
+                yield image
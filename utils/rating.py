@@ -0,0 +1,194 @@
+import math
+import threading
+from array import array
+from utils.catalog import ImageCatalog, RatingColumn, ComparisonLog
+
+ELO_SCALE = 400 / math.log(10)  # converts natural log-strengths to Elo points
+
+
+class RatingEngine:
+    """ Pairwise rating of images from recorded (winner, loser) outcomes
+
+        Every vote gets an O(1) Elo update so the live order is always current, and
+        the whole comparison history can be fitted with a Bradley-Terry model for
+        ratings with confidence intervals. Ratings, win and loss counts and the history
+        are kept by catalog id in typed arrays, see ImageCatalog.
+
+        Parameters
+        k_factor : float
+           Elo step size, how far a single vote moves a rating
+        initial_rating : float
+           rating of an image that has not been compared yet
+    """
+    def __init__(self, k_factor=32.0, initial_rating=1500.0):
+        self.k_factor = k_factor
+        self.initial_rating = initial_rating
+        self.priors = {}  # image -> Elo offset of its starting rating
+        self._fit_thread = None  # the refit started by latest_fit, if any
+        self.reset()
+
+    def set_priors(self, priors):
+        """ starting rating offsets, applied to images added from now on. Call reset and
+            replay the comparisons for them to reach the images already rated
+
+            Parameters
+            priors : dict
+               file name -> Elo points added to the initial rating
+        """
+        self.priors = dict(priors)
+
+    def reset(self, images=()):
+        """ forgets every rating and comparison, images start over from their prior
+        """
+        self.catalog = ImageCatalog(self.initial_rating)
+        self.ratings = RatingColumn(self.catalog)  # file name -> rating, read like a dict
+        self.comparisons = ComparisonLog(self.catalog)  # (winner, loser) in the order they were recorded
+        self._fit = None
+        self._fit_comparisons = 0  # len(comparisons) when _fit was computed
+        if not isinstance(images, (list, tuple, set, dict)):
+            images = list(images)
+        self.catalog.reserve(len(images))
+        for img in images:
+            self.add_image(img)
+
+    def add_image(self, image):
+        """ the catalog id of image, adding it at its starting rating if it is new
+        """
+        return self.catalog.intern(image, self.initial_rating + self.priors.get(image, 0.0))
+
+    def game_count(self, image):
+        image_id = self.catalog.id_of(image)
+        return 0 if image_id is None else self.catalog.games(image_id)
+
+    def expected_score(self, image_a, image_b):
+        """ probability that image_a wins against image_b under the current ratings
+        """
+        return 1 / (1 + 10 ** ((self.ratings[image_b] - self.ratings[image_a]) / 400))
+
+    def record(self, winner, loser):
+        """ applies the Elo update for a single vote
+
+            Parameters
+            winner : str
+               file name of the image that was voted for
+            loser : str
+               file name of the other image of the pair
+        """
+        winner_id = self.add_image(winner)
+        loser_id = self.add_image(loser)
+        catalog = self.catalog
+        ratings = catalog.ratings
+        delta = self.k_factor * (1 - 1 / (1 + 10 ** ((ratings[loser_id] - ratings[winner_id]) / 400)))
+        ratings[winner_id] += delta
+        ratings[loser_id] -= delta
+        catalog.wins[winner_id] += 1
+        catalog.losses[loser_id] += 1
+        self.comparisons.append(winner_id, loser_id)
+
+    def replay(self, comparisons):
+        """ records a sequence of (winner, loser) outcomes, skipping malformed entries
+        """
+        for comparison in comparisons:
+            if len(comparison) == 2:
+                self.record(comparison[0], comparison[1])
+
+    def fit_bradley_terry(self, iterations=100, tolerance=1e-6, prior_games=1.0, max_stale=0):
+        """ fits Bradley-Terry strengths to the whole comparison history with the MM algorithm
+
+            Each image gets prior_games virtual games (half won, half lost) against an
+            average opponent, which keeps unbeaten and unplayed images finite. The work per
+            iteration is a handful of vectorized passes over the distinct pairs.
+
+            Returns a dict of file name -> (rating, half width of the 95% interval),
+            both in Elo points centred on the initial rating
+
+            Parameters
+            iterations : int
+               maximum number of MM iterations
+            tolerance : float
+               stop once no log-strength moves more than this
+            prior_games : float
+               weight of the virtual games against the average opponent
+            max_stale : int
+               return the previous fit while it is missing at most this many comparisons,
+               so callers refreshing after every vote do not refit every time
+        """
+        if self._fit is not None and len(self.comparisons) - self._fit_comparisons <= max_stale:
+            return self._fit
+        snapshot = self._fit_snapshot()
+        self._store_fit(snapshot, self._fit_strengths(snapshot, iterations, tolerance, prior_games))
+        return self._fit
+
+    def latest_fit(self, max_stale=0):
+        """ the last finished Bradley-Terry fit, never waiting for one. Once it is missing more
+            than max_stale comparisons a refit starts on a worker thread, and until it finishes
+            the previous fit is returned, an empty dict before the first one. Call from the
+            thread that records the votes, which is the one the snapshot is taken on
+
+            Parameters
+            max_stale : int
+               comparisons the returned fit may be missing before a refit is started
+        """
+        if self._fit is not None and len(self.comparisons) - self._fit_comparisons <= max_stale:
+            return self._fit
+        if self._fit_thread is None or not self._fit_thread.is_alive():
+            snapshot = self._fit_snapshot()
+
+            def refit():
+                self._store_fit(snapshot, self._fit_strengths(snapshot))
+            self._fit_thread = threading.Thread(target=refit, daemon=True)
+            self._fit_thread.start()
+        return self._fit or {}
+
+    def _fit_snapshot(self):
+        """ copies of what a fit reads, so it can run while votes keep being recorded
+        """
+        return {'names': list(self.catalog.names), 'winners': array('i', self.comparisons.winners),
+                'losers': array('i', self.comparisons.losers), 'catalog': self.catalog}
+
+    def _store_fit(self, snapshot, fit):
+        if snapshot['catalog'] is not self.catalog:
+            return  # the engine was reset while fitting, the history it fitted is gone
+        if self._fit is None or len(snapshot['winners']) >= self._fit_comparisons:
+            self._fit = fit
+            self._fit_comparisons = len(snapshot['winners'])
+
+    def _fit_strengths(self, snapshot, iterations=100, tolerance=1e-6, prior_games=1.0):
+        import numpy as np  # imported on first use, it is a large share of the startup time
+        n = len(snapshot['names'])
+        if not n:
+            return {}
+        winners = np.array(snapshot['winners'], dtype=np.int64)
+        losers = np.array(snapshot['losers'], dtype=np.int64)
+        wins = np.bincount(winners, minlength=n).astype(float)
+        # distinct unordered pairs and how often each was compared
+        pair_keys, counts = np.unique(np.minimum(winners, losers) * n + np.maximum(winners, losers), return_counts=True)
+        counts = counts.astype(float)
+        pairs = np.stack((pair_keys // n, pair_keys % n), axis=1)
+        left, right = pairs[:, 0], pairs[:, 1]
+        wins = wins + prior_games / 2
+
+        strength = np.ones(n)
+        for _ in range(iterations):
+            inverse_sum = counts / (strength[left] + strength[right])
+            denominator = (np.bincount(left, weights=inverse_sum, minlength=n)
+                           + np.bincount(right, weights=inverse_sum, minlength=n)
+                           + prior_games / (strength + 1))
+            updated = wins / denominator
+            updated /= np.exp(np.mean(np.log(updated)))  # pin the geometric mean to 1
+            converged = np.max(np.abs(np.log(updated) - np.log(strength))) < tolerance
+            strength = updated
+            if converged:
+                break
+
+        # diagonal of the Fisher information for the log-strengths
+        pair_information = counts * strength[left] * strength[right] / (strength[left] + strength[right]) ** 2
+        information = (np.bincount(left, weights=pair_information, minlength=n)
+                       + np.bincount(right, weights=pair_information, minlength=n)
+                       + prior_games * strength / (strength + 1) ** 2)
+        log_strength = np.log(strength)
+        half_width = 1.96 / np.sqrt(information)
+
+        ratings = (self.initial_rating + ELO_SCALE * log_strength).tolist()
+        half_widths = (ELO_SCALE * half_width).tolist()
+        return {img: (rating, width) for img, rating, width in zip(snapshot['names'], ratings, half_widths)}
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+# PIL supported image types
+IMAGE_TYPES = ('.png', '.jpg', 'jpeg', '.tiff', '.bmp')
+
+
+class FolderScanner:
+    """ Streams the image files of a folder with os.scandir, optionally recursing
+
+        A manifest of every directory seen (its mtime plus the name, size and mtime of its
+        images) is kept in the local cache. A directory's mtime only changes when entries
+        are added, removed or renamed in it, so on a rescan unchanged directories are
+        answered from the manifest with a single stat and only changed ones are listed.
+
+        Parameters
+        folder : str
+           the folder to scan
+        manifest_dir : str
+           where manifests are saved, one file per folder and recursion setting
+        recursive : boolean
+           include images in sub folders, returned as paths relative to folder
+        img_types : tuple of str
+           lower case file name endings to accept
+    """
+    def __init__(self, folder, manifest_dir='./local_cache/manifests/', recursive=False, img_types=IMAGE_TYPES):
+        self.folder = folder
+        self.recursive = recursive
+        self.img_types = img_types
+        key = f'{os.path.abspath(folder)}|{int(recursive)}'
+        self.manifest_path = os.path.join(manifest_dir, hashlib.sha1(key.encode('utf-8', errors='surrogateescape')).hexdigest() + '.json')
+        self.manifest = None
+        self.stats = {}
+
+    def load_manifest(self):
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, mode='r') as manifest_file:
+                    self.manifest = json.load(manifest_file)
+            except (IOError, ValueError) as e:
+                print(f'Error opening file {self.manifest_path} : {e}')
+        return self.manifest
+
+    def save_manifest(self):
+        try:
+            directory = os.path.dirname(self.manifest_path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, mode='w') as tmp_file:
+                tmp_file.write(json.dumps(self.manifest))
+            os.replace(tmp_path, self.manifest_path)
+        except IOError as e:
+            print(f'Error writing to file {self.manifest_path} : {e}')
+
+    def scan(self):
+        """ yields (relative name, size, mtime_ns) for every image, reusing the manifest
+            for directories that have not changed. The manifest is saved once the scan completes,
+            only if a directory was listed again or disappeared
+        """
+        if self.manifest is None:
+            self.load_manifest()
+        started = time.perf_counter()
+        seen = {}
+        self.stats = {'files': 0, 'dirs_listed': 0, 'dirs_reused': 0}
+        pending = ['']
+        while pending:
+            relative_dir = pending.pop()
+            entry = self._scan_dir(relative_dir)
+            if entry is None:
+                continue
+            seen[relative_dir] = entry
+            for name, (size, mtime_ns) in entry['files'].items():
+                self.stats['files'] += 1
+                yield (os.path.join(relative_dir, name) if relative_dir else name), size, mtime_ns
+            if self.recursive:
+                pending.extend(os.path.join(relative_dir, d) if relative_dir else d for d in reversed(entry['dirs']))
+        # directories that disappeared drop out of the manifest here
+        changed = self.stats['dirs_listed'] > 0 or len(seen) != len(self.manifest)
+        self.manifest = seen
+        if changed:
+            self.save_manifest()  # an idle rescan of a large folder would spend most of its time rewriting it
+        seconds = time.perf_counter() - started
+        self.stats['seconds'] = seconds
+        self.stats['files_per_sec'] = self.stats['files'] / seconds if seconds > 0 else 0.0
+        self.stats['saved'] = changed
+
+    def _scan_dir(self, relative_dir):
+        path = os.path.join(self.folder, relative_dir) if relative_dir else self.folder
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self.manifest.get(relative_dir)
+        if cached is not None and cached.get('mtime_ns') == dir_mtime:
+            self.stats['dirs_reused'] += 1
+            return cached
+
+        self.stats['dirs_listed'] += 1
+        files = {}
+        dirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and not entry.name.startswith('.'):
+                                dirs.append(entry.name)
+                        elif entry.name.lower().endswith(self.img_types):
+                            stat = entry.stat()
+                            files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f'Error scanning folder {path} : {e}')
+            return None
+        return {'mtime_ns': dir_mtime, 'files': dict(sorted(files.items())), 'dirs': sorted(dirs)}
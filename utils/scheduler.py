@@ -0,0 +1,305 @@
+import math
+import random
+from array import array
+from utils.catalog import PairHistory
+from utils.rankorder import RankOrder
+
+
+class FenwickSampler:
+    """ Weighted sampling over slots with O(log n) updates and draws
+    """
+    def __init__(self, size=0):
+        self.size = size
+        self.tree = [0.0] * (size + 1)
+        self.weights = [0.0] * size
+        self.total = 0.0
+
+    @classmethod
+    def from_weights(cls, weights):
+        """ builds the tree in O(n) instead of n separate appends
+        """
+        sampler = cls(len(weights))
+        sampler.weights = list(weights)
+        sampler.total = float(sum(weights))
+        tree = sampler.tree
+        for i in range(1, sampler.size + 1):
+            tree[i] += sampler.weights[i - 1]
+            parent = i + (i & -i)
+            if parent <= sampler.size:
+                tree[parent] += tree[i]
+        return sampler
+
+    def set(self, slot, weight):
+        delta = weight - self.weights[slot]
+        if delta == 0:
+            return
+        self.weights[slot] = weight
+        self.total += delta
+        i = slot + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def append(self, weight):
+        self.size += 1
+        self.weights.append(0.0)
+        # the new node covers a range of earlier slots, rebuild its partial sum from them
+        i = self.size
+        low = i - (i & -i)
+        self.tree.append(sum(self.weights[low:i]))
+        self.set(self.size - 1, weight)
+
+    def sample(self, rng):
+        """ returns a slot with probability proportional to its weight, None if all weights are 0
+        """
+        if self.total <= 0:
+            return None
+        target = rng.random() * self.total
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                position = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return min(position, self.size - 1)
+
+
+class RandomStrategy:
+    """ uniform choice of both images, the behaviour before scheduling existed
+    """
+    name = 'random'
+
+    def pick_anchor(self, scheduler, excludes):
+        return scheduler.sample_uniform(excludes)
+
+    def pick_opponent(self, scheduler, anchor, excludes):
+        return scheduler.sample_uniform(excludes)
+
+
+class UncertaintyStrategy:
+    """ favours images with few comparisons, whose rating is least certain
+    """
+    name = 'uncertainty'
+
+    def pick_anchor(self, scheduler, excludes):
+        return scheduler.sample_weighted(excludes)
+
+    def pick_opponent(self, scheduler, anchor, excludes):
+        return scheduler.sample_weighted(excludes)
+
+
+class CloseRatingStrategy:
+    """ uncertain anchor against an opponent of similar rating, the most informative outcome
+    """
+    name = 'close'
+
+    def pick_anchor(self, scheduler, excludes):
+        return scheduler.sample_weighted(excludes)
+
+    def pick_opponent(self, scheduler, anchor, excludes):
+        return scheduler.nearest_rated(anchor, excludes)
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (RandomStrategy(), UncertaintyStrategy(), CloseRatingStrategy())}
+
+
+class PairScheduler:
+    """ Chooses which images to compare next from the state of a RatingEngine
+
+        Images are kept in slots so picks never scan the file list: uniform picks are
+        rejection sampled in O(1), weighted picks use a Fenwick tree in O(log n) and
+        similar ratings are found in a RankOrder by rating, whose sorted buckets keep a
+        vote's reordering off the size of the folder. Pairs that were already compared are
+        avoided while untried pairs can still be found, looked up by catalog id in a
+        PairHistory. The slot of each image is found by its catalog id too.
+
+        Parameters
+        rating_engine : RatingEngine
+           source of ratings and game counts, the scheduler must be told about each vote via record
+        strategy : str
+           one of the names in STRATEGIES
+        max_attempts : int
+           how many picks to try before accepting an excluded or repeated pair
+    """
+    def __init__(self, rating_engine, strategy='close', max_attempts=8, rng=None):
+        self.rating_engine = rating_engine
+        self.strategy = STRATEGIES[strategy]
+        self.max_attempts = max_attempts
+        self.rng = rng or random.Random()
+        self.duplicate_groups = None
+        self.reset([])
+
+    def set_strategy(self, strategy):
+        self.strategy = STRATEGIES[strategy]
+
+    def reset(self, images):
+        """ rebuilds the scheduler for the images of a folder, including comparisons already in the engine
+        """
+        self.catalog = catalog = self.rating_engine.catalog
+        self.slots = list(dict.fromkeys(images))
+        ids = [self.rating_engine.add_image(image) for image in self.slots]
+        self.slot_by_id = array('i', [-1]) * len(catalog)  # catalog id -> slot, -1 for images without one
+        for slot, image_id in enumerate(ids):
+            self.slot_by_id[image_id] = slot
+        self.active = len(self.slots)
+        self.sampler = FenwickSampler.from_weights([self._games_weight(catalog.games(image_id)) for image_id in ids])
+        # images by the rating they are filed under, in sorted buckets so a vote moves two in O(sqrt n)
+        self.by_rating = RankOrder()
+        self.by_rating.rebuild((image, catalog.ratings[image_id]) for image, image_id in zip(self.slots, ids))
+        comparisons = self.rating_engine.comparisons
+        self.history = PairHistory(len(comparisons))
+        for winner_id, loser_id in comparisons.ids():
+            self.history.add(winner_id, loser_id)
+
+    def _intern(self, image):
+        if self.catalog is self.rating_engine.catalog:
+            return self.rating_engine.add_image(image)  # new images start from their prior rating
+        return self.catalog.intern(image)  # the engine was reset since, ids stay in the old catalog
+
+    def _set_slot(self, image, slot):
+        image_id = self._intern(image)
+        if image_id >= len(self.slot_by_id):
+            self.slot_by_id.extend([-1] * (image_id + 1 - len(self.slot_by_id)))
+        self.slot_by_id[image_id] = slot
+
+    def slot_of(self, image):
+        """ the slot of image, None if it never had one
+        """
+        image_id = self.catalog.id_of(image)
+        if image_id is None or image_id >= len(self.slot_by_id) or self.slot_by_id[image_id] < 0:
+            return None
+        return self.slot_by_id[image_id]
+
+    @staticmethod
+    def _games_weight(games):
+        return 1 / math.sqrt(1 + games)
+
+    def _weight(self, image):
+        return self._games_weight(self.rating_engine.game_count(image))
+
+    def _rating(self, image):
+        return self.rating_engine.ratings.get(image, self.rating_engine.initial_rating)
+
+    def add_image(self, image):
+        slot = self.slot_of(image)
+        if slot is not None and self.slots[slot] is not None:
+            return
+        if slot is not None:
+            self.slots[slot] = image
+            self.sampler.set(slot, self._weight(image))
+        else:
+            self._set_slot(image, len(self.slots))
+            self.slots.append(image)
+            self.sampler.append(self._weight(image))
+        self.active += 1
+        self._file_rating(image)
+
+    def remove_image(self, image):
+        slot = self.slot_of(image)
+        if slot is None or self.slots[slot] is None:
+            return
+        self.by_rating.remove(image)
+        self.slots[slot] = None  # emptied slots are skipped by the samplers
+        self.sampler.set(slot, 0.0)
+        self.active -= 1
+
+    def _file_rating(self, image):
+        self.by_rating.update(image, self._rating(image))
+
+    def was_compared(self, image_a, image_b):
+        id_a, id_b = self.catalog.id_of(image_a), self.catalog.id_of(image_b)
+        return id_a is not None and id_b is not None and self.history.contains(id_a, id_b)
+
+    def set_duplicate_groups(self, groups):
+        """ near-duplicates in groups (a DuplicateGroups, or None) are then only paired
+            with each other when nothing else can be found
+        """
+        self.duplicate_groups = groups
+
+    def are_duplicates(self, image_a, image_b):
+        if self.duplicate_groups is None:
+            return False
+        group = self.duplicate_groups.group_of(image_a)
+        return group is not None and group == self.duplicate_groups.group_of(image_b)
+
+    def record(self, winner, loser):
+        """ updates weights, rating order and pair history after the engine recorded a vote
+
+            Parameters
+            winner : str
+               file name of the image that was voted for
+            loser : str
+               file name of the other image of the pair
+        """
+        self.history.add(self._intern(winner), self._intern(loser))
+        for image in (winner, loser):
+            slot = self.slot_of(image)
+            if slot is None or self.slots[slot] is None:
+                continue
+            self._file_rating(image)
+            self.sampler.set(slot, self._weight(image))
+
+    def sample_uniform(self, excludes):
+        if not self.slots:
+            return None
+        for _ in range(self.max_attempts * 4):
+            image = self.slots[self.rng.randrange(len(self.slots))]
+            if image is not None and image not in excludes:
+                return image
+        return self._scan(excludes)
+
+    def sample_weighted(self, excludes):
+        for _ in range(self.max_attempts * 4):
+            slot = self.sampler.sample(self.rng)
+            if slot is None:
+                return None
+            image = self.slots[slot]
+            if image is not None and image not in excludes:
+                return image
+        return self._scan(excludes)
+
+    def nearest_rated(self, anchor, excludes):
+        """ the closest rated image to anchor that is not excluded and not yet compared with it
+        """
+        rating = self.by_rating.key(anchor, self._rating(anchor))
+        fallback = None
+        for image in self.by_rating.nearby(rating, anchor, 2 * self.max_attempts + 1):
+            if image in excludes:
+                continue
+            if not self.was_compared(anchor, image):
+                return image
+            fallback = fallback or image
+        return fallback or self.sample_weighted(set(excludes) | {anchor})
+
+    def _scan(self, excludes):
+        # only reached when almost every image is excluded
+        available = [image for image in self.slots if image is not None and image not in excludes]
+        return self.rng.choice(available) if available else None
+
+    def next_opponent(self, anchor, excludes=()):
+        """ picks an image to show against anchor, preferring pairs that were not compared yet
+            and are not near-duplicates
+        """
+        excludes = set(excludes) | {anchor}
+        fallback = None
+        for _ in range(self.max_attempts):
+            opponent = self.strategy.pick_opponent(self, anchor, excludes)
+            if opponent is None:
+                break
+            if not self.was_compared(anchor, opponent) and not self.are_duplicates(anchor, opponent):
+                return opponent
+            fallback = fallback or opponent
+        return fallback
+
+    def next_pair(self, excludes=()):
+        """ picks a fresh pair, None if fewer than two images are available
+        """
+        anchor = self.strategy.pick_anchor(self, set(excludes))
+        if anchor is None:
+            return None
+        opponent = self.next_opponent(anchor, excludes)
+        if opponent is None:
+            return None
+        return anchor, opponent
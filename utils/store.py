@@ -0,0 +1,163 @@
+import os
+import time
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    last_opened REAL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    name TEXT NOT NULL,
+    votes INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (folder_id, name)
+);
+CREATE TABLE IF NOT EXISTS comparisons (
+    id INTEGER PRIMARY KEY,
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    winner_id INTEGER NOT NULL REFERENCES images(id),
+    loser_id INTEGER NOT NULL REFERENCES images(id),
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS comparisons_by_folder ON comparisons (folder_id, id);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+class SqliteRankingStore:
+    """ Ranking storage in SQLite, one row per folder, image and comparison
+
+        Opening a folder reads only that folder's rows through the (folder_id, ...) indexes,
+        so the cost does not grow with the number of other folders ever opened. The
+        database runs in WAL mode so readers are not blocked while votes are written.
+
+        Parameters
+        db_path : str
+           location of the database file
+        legacy_store : VoteJournal
+           JSON snapshot and journal to import from the first time the database is created
+    """
+    def __init__(self, db_path, legacy_store=None):
+        self.db_path = db_path
+        self.legacy_store = legacy_store
+        self._connection = None
+        self._folder_ids = {}
+        self._image_ids = {}  # (folder_id, name) -> image id
+
+    def connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')  # durable across app crashes, fsync at checkpoints
+            self._connection.executescript(SCHEMA)
+            self._migrate_legacy()
+        return self._connection
+
+    def _migrate_legacy(self):
+        """ imports rankings.data and its vote journal once, the JSON files are left in place
+        """
+        db = self._connection
+        if self.legacy_store is None or self._get_setting('legacy_migrated'):
+            return
+        cache_data = self.legacy_store.load()
+        with db:
+            for folder, votes in cache_data.get('rankings', {}).items():
+                folder_id = self._folder_id(folder)
+                db.executemany(
+                    'INSERT INTO images (folder_id, name, votes) VALUES (?, ?, ?) '
+                    'ON CONFLICT (folder_id, name) DO UPDATE SET votes = excluded.votes',
+                    [(folder_id, name, count) for name, count in votes.items()])
+            for folder, comparisons in cache_data.get('comparisons', {}).items():
+                folder_id = self._folder_id(folder)
+                db.executemany(
+                    'INSERT INTO comparisons (folder_id, winner_id, loser_id) VALUES (?, ?, ?)',
+                    [(folder_id, self._image_id(folder_id, winner), self._image_id(folder_id, loser))
+                     for winner, loser in comparisons])
+            if cache_data.get('latest_folder'):
+                self._set_setting('latest_folder', cache_data['latest_folder'])
+            self._set_setting('legacy_migrated', '1')
+
+    def _get_setting(self, key):
+        row = self._connection.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, key, value):
+        self._connection.execute('INSERT INTO settings (key, value) VALUES (?, ?) '
+                                 'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (key, value))
+
+    def _folder_id(self, folder):
+        if folder not in self._folder_ids:
+            db = self._connection
+            db.execute('INSERT OR IGNORE INTO folders (path) VALUES (?)', (folder,))
+            self._folder_ids[folder] = db.execute('SELECT id FROM folders WHERE path = ?', (folder,)).fetchone()[0]
+        return self._folder_ids[folder]
+
+    def _image_id(self, folder_id, name):
+        key = (folder_id, name)
+        if key not in self._image_ids:
+            db = self._connection
+            db.execute('INSERT OR IGNORE INTO images (folder_id, name) VALUES (?, ?)', key)
+            self._image_ids[key] = db.execute('SELECT id FROM images WHERE folder_id = ? AND name = ?', key).fetchone()[0]
+        return self._image_ids[key]
+
+    def latest_folder(self):
+        self.connection()
+        return self._get_setting('latest_folder')
+
+    def load_folder(self, folder):
+        """ returns {'rankings': {name: votes}, 'comparisons': [[winner, loser], ...]} for one folder
+        """
+        db = self.connection()
+        row = db.execute('SELECT id FROM folders WHERE path = ?', (folder,)).fetchone()
+        if row is None:
+            return {'rankings': {}, 'comparisons': []}
+        folder_id = row[0]
+        self._folder_ids[folder] = folder_id
+        names = {}
+        votes = {}
+        for image_id, name, count in db.execute('SELECT id, name, votes FROM images WHERE folder_id = ?', (folder_id,)):
+            names[image_id] = name
+            votes[name] = count
+            self._image_ids[(folder_id, name)] = image_id
+        comparisons = [[names[winner_id], names[loser_id]] for winner_id, loser_id in db.execute(
+            'SELECT winner_id, loser_id FROM comparisons WHERE folder_id = ? ORDER BY id', (folder_id,))]
+        return {'rankings': votes, 'comparisons': comparisons}
+
+    def record_folder(self, folder):
+        db = self.connection()
+        with db:
+            folder_id = self._folder_id(folder)
+            db.execute('UPDATE folders SET last_opened = ? WHERE id = ?', (time.time(), folder_id))
+            self._set_setting('latest_folder', folder)
+
+    def record_vote(self, folder, winner, loser):
+        db = self.connection()
+        with db:
+            folder_id = self._folder_id(folder)
+            winner_id = self._image_id(folder_id, winner)
+            loser_id = self._image_id(folder_id, loser)
+            db.execute('UPDATE images SET votes = votes + 1 WHERE id = ?', (winner_id,))
+            db.execute('INSERT INTO comparisons (folder_id, winner_id, loser_id, created) VALUES (?, ?, ?, ?)',
+                       (folder_id, winner_id, loser_id, time.time()))
+
+    def compact(self, force=False):
+        """ moves the WAL contents into the main database file
+        """
+        if self._connection is not None:
+            self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)' if force else 'PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._folder_ids = {}
+            self._image_ids = {}
@@ -0,0 +1,180 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ThumbnailCache:
+    """ On-disk cache of rendered display thumbnails
+
+        Entries are named <path digest>-<width>x<height>-<version digest>.<ext>, where the
+        version digest covers the source mtime and size, so a changed source file never
+        matches an old entry. The cache is kept under a byte budget by evicting
+        the least recently used entries.
+    """
+    def __init__(self, cache_dir='./local_cache/thumbnails/', max_bytes=256 * 1024 * 1024, extension='ppm'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._entries = None  # entry file name -> size in bytes, oldest first
+        self._by_source = {}  # '<path digest>-<width>x<height>' -> entry file name of its current version
+        self._total_bytes = 0
+        self._lock = threading.RLock()  # renders may run on prefetch threads
+
+    def _load_index(self):
+        """ builds the LRU index from the files on disk, ordered by last use (mtime)
+        """
+        self._entries = OrderedDict()
+        self._by_source = {}
+        self._total_bytes = 0
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.' + self.extension):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+            # of several versions of one source the last used is kept, the others are stale
+            stale = self._by_source.get(self.source_key(name))
+            if stale is not None:
+                self._discard(stale, remove_file=True)
+            self._by_source[self.source_key(name)] = name
+
+    @staticmethod
+    def source_key(name):
+        """ the part of an entry name shared by every version of the same source and size
+        """
+        return name.rsplit('-', 1)[0]
+
+    def _index(self):
+        if self._entries is None:
+            self._load_index()
+        return self._entries
+
+    def entry_name(self, file_path, maxsize):
+        """ returns the cache file name for the current version of file_path, None if it does not exist
+
+            Parameters
+            file_path : str
+               path of the source image
+            maxsize : tuple of int
+               the (width, height) the thumbnail was rendered for
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        abs_path = os.path.abspath(file_path)
+        path_digest = hashlib.sha1(abs_path.encode('utf-8', errors='surrogateescape')).hexdigest()[:16]
+        version = f'{stat.st_mtime_ns}:{stat.st_size}'
+        version_digest = hashlib.sha1(version.encode('ascii')).hexdigest()[:16]
+        return f'{path_digest}-{maxsize[0]}x{maxsize[1]}-{version_digest}.{self.extension}'
+
+    def contains(self, file_path, maxsize):
+        """ True if there is an entry for the current version of file_path
+        """
+        name = self.entry_name(file_path, maxsize)
+        with self._lock:
+            return name is not None and name in self._index()
+
+    def total_bytes(self):
+        with self._lock:
+            self._index()
+            return self._total_bytes
+
+    def get(self, file_path, maxsize):
+        """ returns the cached thumbnail bytes for file_path, or None on a miss
+
+            Parameters
+            file_path : str
+               path of the source image
+            maxsize : tuple of int
+               the (width, height) the thumbnail was rendered for
+        """
+        name = self.entry_name(file_path, maxsize)
+        if name is None:
+            return None
+        with self._lock:
+            if name not in self._index():
+                return None
+        entry_path = os.path.join(self.cache_dir, name)
+        try:
+            with open(entry_path, mode='rb') as entry_file:
+                data = entry_file.read()
+            os.utime(entry_path)  # record the use so eviction survives restarts
+        except OSError:
+            with self._lock:
+                self._discard(name)
+            return None
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+        return data
+
+    def put(self, file_path, maxsize, data):
+        """ stores thumbnail bytes for file_path, replacing any entry for an older version of it
+
+            Parameters
+            file_path : str
+               path of the source image
+            maxsize : tuple of int
+               the (width, height) the thumbnail was rendered for
+            data : bytes
+               the encoded thumbnail
+        """
+        name = self.entry_name(file_path, maxsize)
+        if name is None or data is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary file and rename so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, mode='wb') as tmp_file:
+                    tmp_file.write(data)
+                os.replace(tmp_path, os.path.join(self.cache_dir, name))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f'Error writing thumbnail cache entry {name} : {e}')
+            return
+
+        with self._lock:
+            entries = self._index()
+            # invalidate the entry rendered from an older version of the same file at the same size
+            stale = self._by_source.get(self.source_key(name))
+            if stale is not None and stale != name:
+                self._discard(stale, remove_file=True)
+
+            if name in entries:
+                self._total_bytes -= entries.pop(name)
+            entries[name] = len(data)
+            self._by_source[self.source_key(name)] = name
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _discard(self, name, remove_file=False):
+        entries = self._index()
+        if name in entries:
+            self._total_bytes -= entries.pop(name)
+        if self._by_source.get(self.source_key(name)) == name:
+            del self._by_source[self.source_key(name)]
+        if remove_file:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _evict(self):
+        """ removes least recently used entries until the cache fits in its byte budget
+        """
+        entries = self._index()
+        while self._total_bytes > self.max_bytes and len(entries) > 1:
+            oldest = next(iter(entries))
+            self._discard(oldest, remove_file=True)
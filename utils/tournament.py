@@ -0,0 +1,217 @@
+import os
+import json
+import math
+import hashlib
+from functools import cmp_to_key
+
+MODES = ('sort', 'top')
+
+
+class NeedComparison(Exception):
+    """ raised inside an algorithm when it reaches a pair that has not been voted on yet
+    """
+    def __init__(self, image_a, image_b):
+        super().__init__(image_a, image_b)
+        self.pair = (image_a, image_b)
+
+
+class Tournament:
+    """ A comparison-efficient ranking driven by votes: a full sort, or the best k images
+
+        The algorithms are deterministic and read every outcome from the recorded answers,
+        so the state is just the image order and the answers. step replays the algorithm
+        from the start until it reaches a pair without an answer, which costs dictionary
+        lookups only, and a saved tournament resumes by loading its answers. A replay takes
+        about n log2 n lookups, some 20 ms for 5,000 images, so the outcomes next_after
+        computes for the pending pair are kept and step reuses the one the vote picked.
+
+        sort : Python's merge sort (Timsort) over the images, about log2(n!) ~ n log2 n
+           votes, fewer when the starting order is already close
+        top : a knockout tree, n - 1 votes for the winner, then about log2 n per further
+           place as the winner's path is replayed without it
+
+        Parameters
+        mode : str
+           'sort' or 'top'
+        images : list of str
+           the images in their starting order, the current ranking works best
+        k : int
+           places to find in 'top' mode
+        answers : dict
+           pair key -> winner, from an earlier session
+    """
+    def __init__(self, mode, images, k=20, answers=None):
+        if mode not in MODES:
+            raise ValueError(f'Unknown tournament mode {mode}')
+        self.mode = mode
+        self.images = list(images)
+        self.k = min(k, len(self.images)) if mode == 'top' else len(self.images)
+        self.answers = dict(answers or {})
+        self.result = None
+        self.pending = None
+        self._lookahead = {}  # (winner, loser) -> (result, pending) that answer would lead to, cleared by answer
+        self._ready = None  # the lookahead of the last answer, for step to use
+
+    @staticmethod
+    def pair_key(image_a, image_b):
+        return (image_a, image_b) if image_a < image_b else (image_b, image_a)
+
+    def _compare(self, image_a, image_b):
+        """ -1 if image_a is better, for ordering best first
+        """
+        winner = self.answers.get(self.pair_key(image_a, image_b))
+        if winner is None:
+            raise NeedComparison(image_a, image_b)
+        return -1 if winner == image_a else 1
+
+    def _sort(self):
+        return sorted(self.images, key=cmp_to_key(self._compare))
+
+    def _top(self):
+        size = 1
+        while size < len(self.images):
+            size *= 2
+        tree = [None] * (2 * size)
+        tree[size:size + len(self.images)] = self.images
+        leaf = {image: size + i for i, image in enumerate(self.images)}
+
+        def match(node):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            if left is None or right is None:
+                return left if right is None else right
+            return left if self._compare(left, right) < 0 else right
+
+        for node in range(size - 1, 0, -1):
+            tree[node] = match(node)
+        places = []
+        while len(places) < self.k and tree[1] is not None:
+            winner = tree[1]
+            places.append(winner)
+            node = leaf[winner]
+            tree[node] = None
+            node //= 2
+            while node:
+                tree[node] = match(node)
+                node //= 2
+        return places
+
+    def _run(self):
+        return self._sort() if self.mode == 'sort' else self._top()
+
+    def step(self):
+        """ the next pair to vote on, None once the tournament is finished and result is set
+        """
+        outcome, self._ready = self._ready, None
+        self.result, self.pending = outcome or self._outcome()
+        return self.pending
+
+    def _outcome(self):
+        """ (result, pending) of a replay with the current answers
+        """
+        try:
+            return self._run(), None
+        except NeedComparison as need:
+            return None, need.pair
+
+    def next_after(self, winner, loser):
+        """ the pair that would follow if winner beat loser, None if that would finish it.
+            Lets both possible next pairs be prefetched before the vote
+        """
+        key = self.pair_key(winner, loser)
+        if (winner, loser) not in self._lookahead:
+            self.answers[key] = winner
+            try:
+                self._lookahead[(winner, loser)] = self._outcome()
+            finally:
+                del self.answers[key]
+        return self._lookahead[(winner, loser)][1]
+
+    def answer(self, winner, loser):
+        key = self.pair_key(winner, loser)
+        self._ready = self._lookahead.get((winner, loser)) if key not in self.answers else None
+        self.answers[key] = winner
+        self._lookahead = {}
+
+    def estimate(self):
+        """ (votes so far, estimated total) for the progress display
+        """
+        n = len(self.images)
+        if n < 2:
+            total = 0
+        elif self.mode == 'sort':
+            total = round(math.lgamma(n + 1) / math.log(2))  # log2(n!), what an ideal sort needs
+        else:
+            total = n - 1 + (self.k - 1) * math.ceil(math.log2(n))
+        done = len(self.answers)
+        if self.result is None:
+            total = max(total, done + 1)
+        return done, total
+
+
+class TournamentStore:
+    """ Saves the tournament of a folder as JSON lines: a header with the mode and image
+        order, then one line per answer appended as it is given, so nothing is rewritten per vote
+
+        Parameters
+        folder : str
+           the folder being ranked
+        cache_dir : str
+           where the tournaments are saved, one file per folder
+    """
+    def __init__(self, folder, cache_dir='./local_cache/tournaments/'):
+        digest = hashlib.sha1(os.path.abspath(folder).encode('utf-8', errors='surrogateescape')).hexdigest()
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, digest + '.jsonl')
+
+    def start(self, tournament):
+        header = {'mode': tournament.mode, 'k': tournament.k, 'images': tournament.images}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.path, mode='w', encoding='utf-8') as state_file:
+                state_file.write(json.dumps(header) + '\n')
+                for (image_a, image_b), winner in tournament.answers.items():
+                    loser = image_b if winner == image_a else image_a
+                    state_file.write(json.dumps([winner, loser]) + '\n')
+        except IOError as e:
+            print(f'Error writing to file {self.path} : {e}')
+
+    def append(self, winner, loser):
+        try:
+            with open(self.path, mode='a', encoding='utf-8') as state_file:
+                state_file.write(json.dumps([winner, loser]) + '\n')
+        except IOError as e:
+            print(f'Error writing to file {self.path} : {e}')
+
+    def load(self, present=None):
+        """ the saved tournament, None if there is none. Images no longer in present are
+            dropped, the answers about the others still count
+
+            Parameters
+            present : set of str
+               the images currently in the folder, None keeps them all
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as state_file:
+                header = json.loads(state_file.readline())
+                answers = []
+                for line in state_file:
+                    try:
+                        answers.append(json.loads(line))
+                    except ValueError:
+                        break  # a line cut short by a crash, everything before it is intact
+        except (IOError, ValueError) as e:
+            print(f'Error opening file {self.path} : {e}')
+            return None
+        images = [image for image in header['images'] if present is None or image in present]
+        tournament = Tournament(header['mode'], images, header['k'])
+        for winner, loser in answers:
+            tournament.answer(winner, loser)
+        return tournament
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+
+
+class Tracer:
+    """ Opt-in timing spans, aggregated per name into latency percentiles and exportable
+        as a Chrome trace (chrome://tracing or ui.perfetto.dev)
+
+        While disabled, begin returns None and traced functions make one attribute check
+        before calling straight through, so the instrumentation can stay in the hot paths.
+
+        Parameters
+        max_events : int
+           spans kept for the trace file, the oldest are dropped first. Percentiles
+           use every span recorded
+    """
+    def __init__(self, max_events=200000):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.durations = {}  # name -> list of durations in ns
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.durations = {}
+
+    def begin(self, name, detail=None):
+        """ starts a span, returns the token to pass to end, or None while disabled
+
+            Parameters
+            name : str
+               the span name
+            detail : str
+               appended to the name in brackets, such as the event being handled
+        """
+        if not self.enabled:
+            return None
+        if detail is not None:
+            name = f'{name}[{detail}]'
+        return name, time.perf_counter_ns()
+
+    def end(self, token):
+        if token is None:
+            return
+        name, started = token
+        self.record(name, started, time.perf_counter_ns())
+
+    def record(self, name, started, finished):
+        with self._lock:
+            self.durations.setdefault(name, []).append(finished - started)
+            self.events.append((name, started, finished, threading.get_ident()))
+
+    def summary(self):
+        """ {name: {'count', 'total_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}
+        """
+        import numpy as np  # only needed for the report, kept out of the startup imports
+        with self._lock:
+            durations = {name: np.array(values, dtype=np.float64) / 1e6 for name, values in self.durations.items()}
+        result = {}
+        for name, values in durations.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[name] = {'count': len(values), 'total_ms': float(values.sum()), 'p50_ms': float(p50),
+                            'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(values.max())}
+        return result
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{'span':<48} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, stats in sorted(summary.items(), key=lambda item: item[1]['total_ms'], reverse=True):
+            print(f"{name:<48} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+
+    def export_chrome_trace(self, path):
+        """ writes the recorded spans in the Chrome trace event format
+        """
+        with self._lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace_events = [{'name': name, 'cat': name.split('[')[0], 'ph': 'X', 'pid': pid, 'tid': tid,
+                         'ts': (started - self._origin) / 1000, 'dur': (finished - started) / 1000}
+                        for name, started, finished, tid in events]
+        try:
+            with open(path, mode='w') as trace_file:
+                json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+        except IOError as e:
+            print(f'Error writing to file {path} : {e}')
+
+    def report(self, path=None):
+        """ prints the percentiles and writes the trace file, if tracing is enabled
+        """
+        if not self.enabled:
+            return
+        self.print_summary()
+        if path:
+            self.export_chrome_trace(path)
+            print(f'Trace written to {path}')
+
+
+tracer = Tracer()
+
+
+def traced(name):
+    """ decorator recording a span named name around every call while the tracer is enabled
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                tracer.record(name, started, time.perf_counter_ns())
+        return wrapper
+    return decorate
@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from utils.imageutils import render_preview
+
+
+def _render_entry(file_path, maxsize):
+    """ process pool worker, returns (file_path, data, error)
+    """
+    try:
+        return file_path, render_preview(file_path, maxsize), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+
+class ThumbnailWarmer:
+    """ Renders the display thumbnails of a whole folder ahead of time, on a process pool
+
+        Every thumbnail is stored in the cache as soon as it is rendered and images with an
+        up to date entry are skipped, so an interrupted warm-up resumes where it stopped.
+        It stops early rather than evict its own entries once the cache is full, cache_full
+        is then set and left_out counts the images that were not rendered.
+
+        Parameters
+        cache : ThumbnailCache
+           where the thumbnails go, the same cache vote and view mode read
+        file_paths : list of str
+           the images to render
+        maxsize : tuple of int
+           the (width, height) the display thumbnails are rendered for
+        workers : int
+           process count, all CPUs by default
+    """
+    def __init__(self, cache, file_paths, maxsize=(720, 480), workers=None):
+        self.cache = cache
+        self.file_paths = file_paths
+        self.maxsize = maxsize
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = {'rendered': 0, 'skipped': 0, 'failed': 0}
+        self.cache_full = False
+        self.left_out = 0  # pending images not rendered because the cache filled up
+
+    def pending(self):
+        """ the images without an up to date thumbnail
+        """
+        return [path for path in self.file_paths if not self.cache.contains(path, self.maxsize)]
+
+    def run(self):
+        """ renders the pending images and yields (file_path, error) as each one finishes,
+            error being None on success. Closing the generator cancels the rest
+        """
+        pending = self.pending()
+        self.stats['skipped'] = len(self.file_paths) - len(pending)
+        if not pending:
+            return
+        remaining = iter(pending)
+        pool = ProcessPoolExecutor(max_workers=min(self.workers, len(pending)))
+        in_flight = set()
+        try:
+            while True:
+                # a couple of renders queued per process keeps them busy without holding the whole folder in memory
+                while len(in_flight) < 2 * self.workers and not self.cache_full:
+                    file_path = next(remaining, None)
+                    if file_path is None:
+                        break
+                    in_flight.add(pool.submit(_render_entry, file_path, self.maxsize))
+                if not in_flight:
+                    if self.cache_full:
+                        self.left_out = len(pending) - self.stats['rendered'] - self.stats['failed']
+                    return
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    file_path, data, error = future.result()
+                    if error is None:
+                        self.cache.put(file_path, self.maxsize, data)
+                        self.stats['rendered'] += 1
+                        # one more entry this size would start evicting the ones just rendered
+                        self.cache_full = self.cache.total_bytes() + len(data) > self.cache.max_bytes
+                    else:
+                        self.stats['failed'] += 1
+                    yield file_path, error
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)